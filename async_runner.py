@@ -0,0 +1,144 @@
+"""
+async_runner.py - اجرای هندلرها به صورت coroutine روی یک حلقه asyncio (حالت BOT_MODE=async)
+"""
+
+import asyncio
+import os
+import threading
+import traceback
+from collections import deque
+
+from work_queue import PRIORITY_HIGH, PRIORITY_NORMAL
+
+
+class AsyncRuntime:
+    """یک حلقه asyncio در ترد جدا؛ کد همگام از طریق run به آن دسترسی دارد"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """راه‌اندازی ترد حلقه (یک بار)"""
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.loop.run_forever, name="asyncio-loop")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self, coro, timeout=None):
+        """اجرای coroutine روی حلقه و انتظار برای نتیجه (فقط از تردهای دیگر)"""
+        if threading.current_thread() is self.thread:
+            # انتظار همگام داخل حلقه باعث قفل شدن همه هندلرها می‌شود
+            coro.close()
+            raise RuntimeError("داخل حلقه asyncio باید از await استفاده شود")
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        """توقف حلقه"""
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
+
+
+class AsyncUpdateDispatcher:
+    """هم‌شکل با UpdateDispatcher؛ برای هر چت یک task ترتیبی به جای یک ترد ثابت"""
+
+    def __init__(self, handler, runtime, max_in_flight=None, max_queue_size=None):
+        if max_in_flight is None:
+            max_in_flight = int(os.getenv("BOT_ASYNC_MAX_IN_FLIGHT", 1000))
+        if max_queue_size is None:
+            max_queue_size = int(os.getenv("BOT_QUEUE_SIZE", 1000))
+        self.handler = handler
+        self.runtime = runtime
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_size = max_queue_size
+        # کارهای با اولویت بالا تا ۲۰٪ بیشتر از ظرفیت پذیرفته می‌شوند
+        self.hard_limit = max_queue_size + max(1, max_queue_size // 5)
+        self.num_workers = 1
+
+        self.cond = threading.Condition()
+        self.chats = {}
+        self.size = 0
+        self.unfinished = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.shed_full = 0
+        self.semaphore = None
+
+    def start(self):
+        """راه‌اندازی حلقه asyncio"""
+        self.runtime.start()
+
+    def submit(self, chat_id, update, priority=PRIORITY_NORMAL):
+        """افزودن آپدیت به صف چت (از هر تردی)؛ اگر صف پر باشد False"""
+        with self.cond:
+            limit = self.hard_limit if priority == PRIORITY_HIGH else self.max_size
+            if self.size >= limit:
+                self.shed_full += 1
+                return False
+            items = self.chats.get(chat_id)
+            if items is None:
+                items = self.chats[chat_id] = deque()
+                # اولین آپدیت این چت؛ task جدید روی حلقه ساخته می‌شود
+                self.runtime.loop.call_soon_threadsafe(self._spawn, chat_id)
+            items.append(update)
+            self.size += 1
+            self.unfinished += 1
+            return True
+
+    def _spawn(self, chat_id):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.runtime.loop.create_task(self._run_chat(chat_id))
+
+    async def _run_chat(self, chat_id):
+        # آپدیت‌های هر چت پشت سر هم اجرا می‌شوند؛ چت‌های مختلف هم‌زمان
+        while True:
+            with self.cond:
+                items = self.chats[chat_id]
+                if not items:
+                    del self.chats[chat_id]
+                    return
+                update = items.popleft()
+                self.size -= 1
+            async with self.semaphore:
+                with self.cond:
+                    self.in_flight += 1
+                try:
+                    await self.handler(update)
+                except Exception as e:
+                    print(f"❌ خطا در هندلر async: {e}")
+                    traceback.print_exc()
+                finally:
+                    with self.cond:
+                        self.in_flight -= 1
+                        self.processed += 1
+                        self.unfinished -= 1
+                        if self.unfinished <= 0:
+                            self.cond.notify_all()
+
+    def drain(self, timeout):
+        """انتظار تا پایان همه آپدیت‌های صف و در حال اجرا؛ در صورت اتمام مهلت False"""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.unfinished <= 0, timeout)
+
+    def queue_depths(self):
+        """تعداد آپدیت‌های منتظر"""
+        return [self.size]
+
+    def stats(self):
+        """آمار اجرای async"""
+        with self.cond:
+            return {
+                "mode": "async",
+                "chats": len(self.chats),
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queue_depths": [self.size],
+                "shed_full": self.shed_full,
+                "processed": self.processed
+            }
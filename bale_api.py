@@ -0,0 +1,217 @@
+"""
+bale_api.py - کلاینت HTTP مشترک برای همه فراخوانی‌های API بله
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from resilience import RetryPolicy, BreakerRegistry, is_server_error
+
+# aiohttp فقط برای حالت async لازم است
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+API_ROOT = "https://tapi.bale.ai"
+
+# مهلت هر متد (ثانیه)
+DEFAULT_TIMEOUTS = {
+    "getUpdates": 35,
+    "sendMessage": 10,
+    "sendPhoto": 20,
+    "sendInvoice": 10,
+    "editMessageText": 10,
+    "editMessageCaption": 10,
+    "editMessageReplyMarkup": 10,
+    "answerCallbackQuery": 5,
+    "setMyName": 5,
+    "setMyDescription": 5,
+    "setWebhook": 10
+}
+DEFAULT_TIMEOUT = 15
+
+
+class BaleClient:
+    """یک Session با اتصال‌های keep-alive برای همه درخواست‌ها به tapi.bale.ai"""
+
+    def __init__(self, token, pool_size=None, timeouts=None, api_root=API_ROOT, retry_policy=None):
+        if pool_size is None:
+            pool_size = int(os.getenv("BALE_HTTP_POOL_SIZE", 16))
+        self.base_url = f"{api_root}/bot{token}"
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breakers = BreakerRegistry()
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.errors = {}
+        self.retries = {}
+
+    @staticmethod
+    def serialize(payload, multipart=False):
+        """آماده‌سازی پارامترها: حذف None و تبدیل کیبورد به JSON"""
+        data = {}
+        for key, value in (payload or {}).items():
+            if value is None:
+                continue
+            if key == "reply_markup" and not isinstance(value, str):
+                value = json.dumps(value)
+            elif multipart and isinstance(value, (dict, list, bool)):
+                value = json.dumps(value)
+            data[key] = value
+        return data
+
+    def call(self, method, payload=None, files=None, timeout=None):
+        """فراخوانی یک متد API و برگرداندن پاسخ JSON؛ خطای شبکه به فراخواننده می‌رسد
+
+        متدهای تکرارپذیر با تأخیر نمایی دوباره فرستاده می‌شوند و اگر مدار متد باز باشد
+        بلافاصله CircuitOpenError برمی‌گردد.
+        """
+        url = f"{self.base_url}/{method}"
+        if timeout is None:
+            timeout = self.timeouts.get(method, DEFAULT_TIMEOUT)
+
+        breaker = self.breakers.get(method)
+        attempts = self.retry_policy.attempts_for(method, files)
+        for attempt in range(attempts):
+            last_attempt = attempt + 1 >= attempts
+            breaker.before_call()
+            self._count(self.calls, method)
+            try:
+                if files:
+                    response = self.session.post(url, data=self.serialize(payload, multipart=True),
+                                                 files=files, timeout=timeout)
+                else:
+                    response = self.session.post(url, json=self.serialize(payload), timeout=timeout)
+                result = response.json()
+            except Exception:
+                self._count(self.errors, method)
+                breaker.record_failure()
+                if last_attempt:
+                    raise
+            else:
+                if not is_server_error(result):
+                    breaker.record_success()
+                    return result
+                self._count(self.errors, method)
+                breaker.record_failure()
+                if last_attempt:
+                    return result
+            self._count(self.retries, method)
+            time.sleep(self.retry_policy.delay(attempt))
+
+    def _count(self, counters, method):
+        with self.lock:
+            counters[method] = counters.get(method, 0) + 1
+
+    def stats(self):
+        """تعداد فراخوانی، خطا و تلاش دوباره هر متد و وضعیت مدارها"""
+        with self.lock:
+            result = {"calls": dict(self.calls), "errors": dict(self.errors), "retries": dict(self.retries)}
+        result["breakers"] = self.breakers.stats()
+        return result
+
+
+class AsyncBaleClient:
+    """نسخه asyncio کلاینت بله با استخر اتصال aiohttp؛ باید داخل یک حلقه asyncio استفاده شود"""
+
+    def __init__(self, token, pool_size=None, timeouts=None, api_root=API_ROOT, retry_policy=None):
+        if aiohttp is None:
+            raise RuntimeError("برای حالت async بسته aiohttp لازم است (pip install aiohttp)")
+        if pool_size is None:
+            pool_size = int(os.getenv("BALE_ASYNC_POOL_SIZE", 100))
+        self.pool_size = pool_size
+        self.base_url = f"{api_root}/bot{token}"
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        # Session باید داخل حلقه در حال اجرا ساخته شود
+        self.session = None
+
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breakers = BreakerRegistry()
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.errors = {}
+        self.retries = {}
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def call(self, method, payload=None, files=None, timeout=None):
+        """فراخوانی یک متد API و برگرداندن پاسخ JSON؛ خطای شبکه به فراخواننده می‌رسد"""
+        url = f"{self.base_url}/{method}"
+        if timeout is None:
+            timeout = self.timeouts.get(method, DEFAULT_TIMEOUT)
+
+        breaker = self.breakers.get(method)
+        attempts = self.retry_policy.attempts_for(method, files)
+        for attempt in range(attempts):
+            last_attempt = attempt + 1 >= attempts
+            breaker.before_call()
+            self._count(self.calls, method)
+            try:
+                result = await self._post(url, payload, files, timeout)
+            except Exception:
+                self._count(self.errors, method)
+                breaker.record_failure()
+                if last_attempt:
+                    raise
+            else:
+                if not is_server_error(result):
+                    breaker.record_success()
+                    return result
+                self._count(self.errors, method)
+                breaker.record_failure()
+                if last_attempt:
+                    return result
+            self._count(self.retries, method)
+            await asyncio.sleep(self.retry_policy.delay(attempt))
+
+    async def _post(self, url, payload, files, timeout):
+        if files:
+            form = aiohttp.FormData()
+            for key, value in BaleClient.serialize(payload, multipart=True).items():
+                form.add_field(key, str(value))
+            for key, f in files.items():
+                form.add_field(key, f, filename=os.path.basename(getattr(f, "name", key)))
+            body = {"data": form}
+        else:
+            body = {"json": BaleClient.serialize(payload)}
+        async with self._get_session().post(url, timeout=aiohttp.ClientTimeout(total=timeout),
+                                            **body) as response:
+            return await response.json(content_type=None)
+
+    async def close(self):
+        """بستن اتصال‌های باز"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def _count(self, counters, method):
+        with self.lock:
+            counters[method] = counters.get(method, 0) + 1
+
+    def stats(self):
+        """تعداد فراخوانی، خطا و تلاش دوباره هر متد و وضعیت مدارها"""
+        with self.lock:
+            result = {"calls": dict(self.calls), "errors": dict(self.errors), "retries": dict(self.retries),
+                      "pool_size": self.pool_size}
+        result["breakers"] = self.breakers.stats()
+        return result
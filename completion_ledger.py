@@ -0,0 +1,62 @@
+"""
+completion_ledger.py - جلوگیری از ثبت تکراری «امروز شکرگزار بودم»
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class CompletionLedger:
+    """نتیجه ثبت هر روز را بر اساس (کاربر، موضوع، روز) و شناسه callback نگه می‌دارد"""
+
+    def __init__(self, max_entries=10000, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _day_key(user_id, topic_id, day_number):
+        return f"day:{user_id}:{topic_id}:{day_number}"
+
+    @staticmethod
+    def _callback_key(callback_id):
+        return f"cb:{callback_id}"
+
+    def lookup(self, callback_id, user_id, topic_id, day_number):
+        """نتیجه ذخیره‌شده برای ضربه تکراری یا None"""
+        now = time.time()
+        with self.lock:
+            for key in (self._callback_key(callback_id), self._day_key(user_id, topic_id, day_number)):
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                stored_at, result = entry
+                if now - stored_at > self.ttl:
+                    del self.entries[key]
+                    continue
+                self.hits += 1
+                return result
+            self.misses += 1
+            return None
+
+    def record(self, callback_id, user_id, topic_id, day_number, result):
+        """ذخیره نتیجه ثبت برای پاسخ به ضربه‌های بعدی"""
+        now = time.time()
+        with self.lock:
+            for key in (self._callback_key(callback_id), self._day_key(user_id, topic_id, day_number)):
+                self.entries[key] = (now, result)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        """آمار دفتر ثبت"""
+        return {"entries": len(self.entries), "duplicate_hits": self.hits, "misses": self.misses}
+
+
+# نمونه جهانی
+completion_ledger = CompletionLedger()
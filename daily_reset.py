@@ -1,12 +1,11 @@
-import os
-from pymongo import MongoClient
+from mongo_connection import get_client
+import user_context
 from datetime import datetime, timedelta
 
 class DailyResetManager:
     def __init__(self):
-        # اتصال به دیتابیس
-        mongo_uri = os.getenv("MONGO_URI")
-        self.client = MongoClient(mongo_uri)
+        # اتصال به دیتابیس (کلاینت مشترک)
+        self.client = get_client()
         self.db = self.client['gratitude_bot'] 
         self.collection = self.db['daily_access']
 
@@ -22,10 +21,14 @@ class DailyResetManager:
         else:
             reset_time = today_6am
 
-        last_access = self.collection.find_one({
-            "user_id": str(user_id),
-            "topic_id": int(topic_id)
-        })
+        context = user_context.current(user_id)
+        if context is not None:
+            last_access = context.access_record(topic_id)
+        else:
+            last_access = self.collection.find_one({
+                "user_id": str(user_id),
+                "topic_id": int(topic_id)
+            })
 
         if not last_access:
             return True, today_6am
@@ -47,6 +50,10 @@ class DailyResetManager:
             }},
             upsert=True
         )
+        context = user_context.current(user_id)
+        if context is not None:
+            context.set_access(topic_id, {"user_id": str(user_id), "topic_id": int(topic_id),
+                                          "access_time": now, "day_number": day_number})
 
     def get_access_info(self, user_id, topic_id):
         """همان تابعی که رباتت دنبالش می‌گردد و خطا می‌دهد"""
@@ -68,6 +75,9 @@ class DailyResetManager:
     def reset_user_access(self, user_id, topic_id):
         """برای شروع مجدد موضوع"""
         self.collection.delete_one({"user_id": str(user_id), "topic_id": int(topic_id)})
+        context = user_context.current(user_id)
+        if context is not None:
+            context.drop_access(topic_id)
 
 # ایجاد یک نمونه برای استفاده در ربات
 daily_reset = DailyResetManager()
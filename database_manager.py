@@ -1,9 +1,7 @@
-import os
-from pymongo import MongoClient
+from mongo_connection import get_client
 
-# دریافت لینک از رندر (که قبلاً ست کردی)
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
+# کلاینت مشترک؛ لینک از MONGO_URI رندر خوانده می‌شود
+client = get_client()
 db = client['shoker_gozari_db']
 users_col = db['users']
 
@@ -0,0 +1,115 @@
+"""
+flood_control.py - محدودیت نرخ درخواست هر کاربر و هر چت (token bucket)
+"""
+
+import os
+import threading
+import time
+
+# (تعداد در ثانیه، ظرفیت انفجاری) برای هر دسته مسیر
+DEFAULT_LIMITS = {
+    "content": (1.0, 5),
+    "stats": (0.2, 3),
+    "registration": (0.5, 4),
+    "default": (2.0, 10)
+}
+DEFAULT_CHAT_LIMIT = (3.0, 15)
+
+
+def parse_limit(value, default):
+    """خواندن محدودیت به فرمت «نرخ/ظرفیت» مثل 1/5"""
+    if not value:
+        return default
+    try:
+        rate, capacity = value.split("/")
+        return float(rate), float(capacity)
+    except ValueError:
+        print(f"⚠️ محدودیت نامعتبر: {value}")
+        return default
+
+
+class TokenBucket:
+    """سطل توکن ساده؛ هر درخواست یک توکن مصرف می‌کند"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def consume(self, amount=1, now=None):
+        """مصرف توکن؛ در صورت کمبود False برمی‌گرداند"""
+        now = time.monotonic() if now is None else now
+        # now ممکن است کمی قبل از ساخت سطل گرفته شده باشد؛ زمان منفی توکن کم نمی‌کند
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def wait_time(self, amount=1):
+        """مدت انتظار تا در دسترس بودن توکن"""
+        missing = amount - self.tokens
+        return max(0.0, missing / self.rate) if self.rate else float("inf")
+
+    def is_idle(self, now):
+        # سطل پر شده و دیگر نیازی به نگه‌داشتنش نیست
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class FloodController:
+    """محدودیت نرخ برای هر کاربر (به تفکیک دسته مسیر) و هر چت"""
+
+    def __init__(self, limits=None, chat_limit=None, cleanup_interval=300):
+        self.limits = dict(DEFAULT_LIMITS)
+        for group, default in DEFAULT_LIMITS.items():
+            self.limits[group] = parse_limit(os.getenv(f"FLOOD_{group.upper()}"), default)
+        if limits:
+            self.limits.update(limits)
+        self.chat_limit = chat_limit or parse_limit(os.getenv("FLOOD_CHAT"), DEFAULT_CHAT_LIMIT)
+        self.user_buckets = {}
+        self.chat_buckets = {}
+        self.lock = threading.Lock()
+        self.cleanup_interval = cleanup_interval
+        self.last_cleanup = time.monotonic()
+        self.allowed = {}
+        self.dropped = {}
+
+    def allow(self, user_id, chat_id, group):
+        """آیا آپدیت این کاربر در این دسته مجاز است؟"""
+        group = group if group in self.limits else "default"
+        now = time.monotonic()
+        with self.lock:
+            user_key = (user_id, group)
+            user_bucket = self.user_buckets.get(user_key)
+            if user_bucket is None:
+                user_bucket = self.user_buckets[user_key] = TokenBucket(*self.limits[group])
+            chat_bucket = self.chat_buckets.get(chat_id)
+            if chat_bucket is None:
+                chat_bucket = self.chat_buckets[chat_id] = TokenBucket(*self.chat_limit)
+
+            allowed = user_bucket.consume(now=now) and chat_bucket.consume(now=now)
+            counters = self.allowed if allowed else self.dropped
+            counters[group] = counters.get(group, 0) + 1
+
+            if now - self.last_cleanup > self.cleanup_interval:
+                self._cleanup(now)
+            return allowed
+
+    def _cleanup(self, now):
+        for buckets in (self.user_buckets, self.chat_buckets):
+            for key in [k for k, b in buckets.items() if b.is_idle(now)]:
+                del buckets[key]
+        self.last_cleanup = now
+
+    def stats(self):
+        """شمارنده‌های محدودیت نرخ"""
+        with self.lock:
+            return {
+                "allowed": dict(self.allowed),
+                "dropped": dict(self.dropped),
+                "tracked_users": len(self.user_buckets),
+                "tracked_chats": len(self.chat_buckets)
+            }
@@ -0,0 +1,126 @@
+"""
+index_manager.py - تعریف ایندکس‌های لازم هر کالکشن، ساخت آن‌ها در شروع ربات و گزارش ایندکس‌های بی‌استفاده
+"""
+
+import threading
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+# ایندکس‌هایی که کوئری‌های ربات به آن‌ها تکیه دارند؛ unique جایی که منطق برنامه یکتایی را فرض می‌کند
+REQUIRED_INDEXES = {
+    "registered_users": [
+        {"name": "user_id_unique", "keys": [("user_id", ASCENDING)], "unique": True},
+        {"name": "phone_number_unique", "keys": [("phone_number", ASCENDING)], "unique": True},
+        {"name": "registration_date_str", "keys": [("registration_date_str", ASCENDING)]},
+        {"name": "registration_date_desc", "keys": [("registration_date", DESCENDING)]},
+    ],
+    "users_progress": [
+        {"name": "user_id_unique", "keys": [("user_id", ASCENDING)], "unique": True},
+    ],
+    "daily_access": [
+        {"name": "user_topic_unique", "keys": [("user_id", ASCENDING), ("topic_id", ASCENDING)], "unique": True},
+    ],
+    "temp_users": [
+        {"name": "user_id_unique", "keys": [("user_id", ASCENDING)], "unique": True},
+    ],
+}
+
+
+class IndexManager:
+    """ساخت یا بررسی ایندکس‌های تعریف‌شده و گزارش ایندکس‌های گم‌شده یا بی‌استفاده"""
+
+    def __init__(self, db, specs=None):
+        self.db = db
+        self.specs = specs or REQUIRED_INDEXES
+        self.lock = threading.Lock()
+        self.last_report = {}
+        # ایندکس‌های ساخته‌شده در همین اجرا؛ هنوز فرصت استفاده نداشته‌اند
+        self.created = set()
+
+    @staticmethod
+    def _key(keys):
+        # جهت عددی (1 / -1 / 1.0) یکسان‌سازی می‌شود؛ ایندکس‌های خاص مثل text دست نمی‌خورند
+        return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                     for field, direction in keys)
+
+    def ensure(self):
+        """ساخت ایندکس‌های ناموجود؛ خطای هر ایندکس جدا ثبت می‌شود و بقیه ادامه پیدا می‌کنند"""
+        report = {"created": [], "present": [], "failed": {}, "mismatched": []}
+        for collection_name, specs in self.specs.items():
+            collection = self.db[collection_name]
+            try:
+                existing = {self._key(info["key"]): (name, info.get("unique", False))
+                            for name, info in collection.index_information().items()}
+            except PyMongoError as e:
+                report["failed"][collection_name] = str(e)
+                continue
+
+            for spec in specs:
+                label = f"{collection_name}.{spec['name']}"
+                unique = spec.get("unique", False)
+                found = existing.get(self._key(spec["keys"]))
+                if found is not None:
+                    # ایندکس با همین کلیدها (شاید با نام دیگر) وجود دارد
+                    report["present"].append(label)
+                    if found[1] != unique:
+                        report["mismatched"].append(f"{label} (unique={found[1]})")
+                    continue
+                try:
+                    collection.create_index(spec["keys"], name=spec["name"], unique=unique)
+                    report["created"].append(label)
+                    self.created.add(label)
+                except PyMongoError as e:
+                    # مثلاً داده تکراری مانع ساخت ایندکس یکتا شده است
+                    report["failed"][label] = str(e)
+
+        with self.lock:
+            self.last_report.update(report)
+        return report
+
+    def usage(self):
+        """ایندکس‌های بی‌استفاده (از آخرین راه‌اندازی MongoDB) و ایندکس‌های تعریف‌نشده
+
+        ایندکس‌هایی که همین اجرا ساخته شده‌اند بی‌استفاده گزارش نمی‌شوند.
+        """
+        unused, undeclared = [], []
+        for collection_name, specs in self.specs.items():
+            declared = {self._key(spec["keys"]) for spec in specs}
+            try:
+                stats = list(self.db[collection_name].aggregate([{"$indexStats": {}}]))
+            except PyMongoError:
+                continue
+            for stat in stats:
+                if stat["name"] == "_id_":
+                    continue
+                label = f"{collection_name}.{stat['name']}"
+                if stat.get("accesses", {}).get("ops", 0) == 0 and label not in self.created:
+                    unused.append(label)
+                if self._key(stat["key"].items()) not in declared:
+                    undeclared.append(label)
+        report = {"unused": unused, "undeclared": undeclared}
+        with self.lock:
+            self.last_report.update(report)
+        return report
+
+    def check(self):
+        """ensure و usage با چاپ خلاصه (در شروع ربات)"""
+        report = self.ensure()
+        report.update(self.usage())
+        if report["created"]:
+            print(f"🗂️ ایندکس‌های ساخته‌شده: {', '.join(report['created'])}")
+        for label, error in report["failed"].items():
+            print(f"❌ ساخت ایندکس {label} ناموفق بود: {error}")
+        for label in report["mismatched"]:
+            print(f"⚠️ ایندکس {label} با تعریف کد یکسان نیست")
+        if report["unused"]:
+            print(f"ℹ️ ایندکس‌های بدون استفاده: {', '.join(report['unused'])}")
+        if report["undeclared"]:
+            print(f"ℹ️ ایندکس‌های تعریف‌نشده در کد: {', '.join(report['undeclared'])}")
+        print(f"🗂️ ایندکس‌ها بررسی شد: {len(report['present']) + len(report['created'])} ایندکس آماده")
+        return report
+
+    def stats(self):
+        """آخرین گزارش ایندکس‌ها"""
+        with self.lock:
+            return dict(self.last_report)
@@ -0,0 +1,87 @@
+"""
+last_login.py - ثبت last_login کاربران در پس‌زمینه با تجمیع نوشتن‌ها
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+
+class LastLoginWriter:
+    """آخرین زمان ورود هر کاربر در حافظه؛ هر بازه یک bulk_write برای همه"""
+
+    def __init__(self, collection, interval=None):
+        if interval is None:
+            interval = float(os.getenv("LAST_LOGIN_FLUSH_INTERVAL", 30))
+        self.collection = collection
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.touches = 0
+        self.writes = 0
+        self.batches = 0
+        self.started = False
+
+    def start(self):
+        """راه‌اندازی ترد پس‌زمینه (یک بار)"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        t = threading.Thread(target=self._run, name="last-login-writer")
+        t.daemon = True
+        t.start()
+
+    def touch(self, user_id, when=None):
+        """ثبت ورود کاربر؛ چند ورود یک کاربر در یک بازه یک نوشتن می‌شود"""
+        when = when or datetime.now()
+        with self.lock:
+            self.touches += 1
+            user_id = str(user_id)
+            if user_id not in self.pending or self.pending[user_id] < when:
+                self.pending[user_id] = when
+        if not self.started:
+            self.start()
+
+    def flush(self):
+        """نوشتن زمان‌های در انتظار (در توقف ربات هم صدا زده می‌شود)"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending or self.collection is None:
+            return
+        # $max تا زمان قدیمی‌تر یک پروسس دیگر زمان جدیدتر را بازنویسی نکند
+        requests = [UpdateOne({"user_id": user_id}, {"$max": {"last_login": when}})
+                    for user_id, when in pending.items()]
+        try:
+            self.collection.bulk_write(requests, ordered=False)
+        except Exception:
+            # برگرداندن به صف برای تلاش در بازه بعد
+            with self.lock:
+                for user_id, when in pending.items():
+                    if user_id not in self.pending or self.pending[user_id] < when:
+                        self.pending[user_id] = when
+            raise
+        with self.lock:
+            self.writes += len(requests)
+            self.batches += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ خطا در ثبت last_login: {e}")
+
+    def stats(self):
+        """آمار تجمیع نوشتن‌ها"""
+        with self.lock:
+            return {
+                "pending": len(self.pending),
+                "touches": self.touches,
+                "writes": self.writes,
+                "batches": self.batches
+            }
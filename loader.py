@@ -1,12 +1,12 @@
 import importlib
 import json
-import os
 from typing import Dict, Any, List
-from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+from mongo_connection import get_client
+import user_context
 
-# --- اتصال به MongoDB ---
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
+# --- اتصال به MongoDB (کلاینت مشترک) ---
+client = get_client()
 db = client['gratitude_bot']
 users_col = db['users_progress']
 
@@ -98,15 +98,31 @@ WEEK_THEMES = {
 
 class UserProgressManager:
     def get_topic_progress(self, user_id, topic_id):
+        # داخل یک آپدیت، پیشرفت همه موضوع‌ها یک بار خوانده شده است
+        context = user_context.current(user_id)
+        if context is not None:
+            return context.topic_progress(topic_id)
         user_data = users_col.find_one({"user_id": str(user_id)})
         topic_key = str(topic_id)
         if user_data and "topics" in user_data and topic_key in user_data["topics"]:
             return user_data["topics"][topic_key]
         return {"current_day": 1, "started": False, "completed_days": []}
 
+    def get_all_progress(self, user_id):
+        """زیرسند topics کاربر (پیشرفت همه موضوع‌ها) با یک کوئری"""
+        context = user_context.current(user_id)
+        if context is not None:
+            return context.topics
+        user_data = users_col.find_one({"user_id": str(user_id)}, {"_id": 0, "topics": 1})
+        return (user_data or {}).get("topics") or {}
+
     def set_topic_day(self, user_id, topic_id, day_number):
         day_number = max(1, min(28, day_number))
         topic_key = str(topic_id)
+        context = user_context.current(user_id)
+        if context is not None and not context.needs_topic_day_write(topic_id, day_number):
+            # روز و وضعیت شروع همین حالا در دیتابیس است؛ نوشتن لازم نیست
+            return day_number
         users_col.update_one(
             {"user_id": str(user_id)}, 
             {"$set": {
@@ -115,6 +131,8 @@ class UserProgressManager:
             }}, 
             upsert=True
         )
+        if context is not None:
+            context.set_topic_day(topic_id, day_number)
         return day_number
 
     def complete_day(self, user_id, topic_id, day_number):
@@ -123,17 +141,25 @@ class UserProgressManager:
             topic_key = str(topic_id)
             next_day = min(day_number + 1, 28)
             
-            # ذخیره در MongoDB
-            result = users_col.update_one(
-                {"user_id": str(user_id)}, 
-                {
-                    "$addToSet": {f"topics.{topic_key}.completed_days": day_number}, 
-                    "$set": {f"topics.{topic_key}.current_day": next_day}
-                }, 
-                upsert=True
-            )
-            
-            if result.modified_count > 0 or result.upserted_id:
+            # یک نوشتن شرطی: ضربه تکراری با سند تطبیق نمی‌خورد و current_day را عقب نمی‌برد
+            try:
+                result = users_col.update_one(
+                    {"user_id": str(user_id), f"topics.{topic_key}.completed_days": {"$ne": day_number}},
+                    {
+                        "$addToSet": {f"topics.{topic_key}.completed_days": day_number},
+                        "$set": {f"topics.{topic_key}.current_day": next_day}
+                    },
+                    upsert=True
+                )
+                completed = result.matched_count > 0 or result.upserted_id is not None
+            except DuplicateKeyError:
+                # سند کاربر هست و این روز در آن ثبت شده؛ upsert به ایندکس یکتای user_id خورد
+                completed = False
+
+            if completed:
+                context = user_context.current(user_id)
+                if context is not None:
+                    context.apply_completion(topic_id, day_number, next_day)
                 return {
                     "success": True,
                     "message": f"✅ روز {day_number} با موفقیت ثبت شد! ✨\n🎯 روز بعدی: {next_day}\n📊 یک قدم به تحول نزدیک‌تر شدید!",
@@ -144,7 +170,8 @@ class UserProgressManager:
                 return {
                     "success": False,
                     "message": "⚠️ تغییراتی ایجاد نشد. ممکن است این روز قبلاً ثبت شده باشد.",
-                    "next_day": day_number
+                    "next_day": day_number,
+                    "already_completed": True
                 }
                 
         except Exception as e:
@@ -310,5 +337,8 @@ def get_topic_by_id(topic_id):
 def get_user_topic_progress(user_id, topic_id):
     return UserProgressManager().get_topic_progress(user_id, topic_id)
 
+def get_user_progress(user_id):
+    return UserProgressManager().get_all_progress(user_id)
+
 def start_topic_for_user(user_id, topic_id):
     return load_day_content(topic_id, 1, user_id)
@@ -0,0 +1,180 @@
+"""
+mongo_connection.py - یک MongoClient مشترک برای همه ماژول‌ها با تنظیمات از متغیرهای محیطی
+"""
+
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, monitoring
+
+# این ماژول ممکن است قبل از load_dotenv ربات import شود
+load_dotenv()
+
+DEFAULT_DB_NAME = "gratitude_bot"
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """شمارش اتصال‌های استخر و زمان انتظار برای گرفتن اتصال"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failed = 0
+        self.in_use = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+        self.local = threading.local()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        print(f"⚠️ استخر اتصال MongoDB پاک شد: {event.address}")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self.lock:
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.closed += 1
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.checkout_failed += 1
+
+    def connection_checked_out(self, event):
+        waited = time.perf_counter() - getattr(self.local, "started", time.perf_counter())
+        with self.lock:
+            self.checked_out += 1
+            self.in_use += 1
+            self.wait_seconds += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.in_use -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "open": self.created - self.closed,
+                "in_use": self.in_use,
+                "created": self.created,
+                "checked_out": self.checked_out,
+                "checkout_failed": self.checkout_failed,
+                "avg_wait_ms": round(self.wait_seconds / self.checked_out * 1000, 3) if self.checked_out else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3)
+            }
+
+
+class QueryCounter(monitoring.CommandListener):
+    """شمارش کوئری‌ها به تفکیک دستور و برای ترد جاری (بودجه کوئری هر آپدیت)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.commands = {}
+        self.failures = 0
+
+    def started(self, event):
+        with self.lock:
+            self.commands[event.command_name] = self.commands.get(event.command_name, 0) + 1
+        self.local.count = getattr(self.local, "count", 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        with self.lock:
+            self.failures += 1
+
+    def thread_count(self):
+        """تعداد کوئری‌های ترد جاری از آخرین reset"""
+        return getattr(self.local, "count", 0)
+
+    def reset(self):
+        self.local.count = 0
+
+    def stats(self):
+        with self.lock:
+            return {"commands": dict(self.commands), "failures": self.failures}
+
+
+pool_listener = PoolStatsListener()
+query_counter = QueryCounter()
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _client_options():
+    """تنظیمات اتصال از متغیرهای محیطی"""
+    options = {
+        "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+        "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+        "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000)),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 10000)),
+        "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000)),
+        "retryWrites": True,
+        "appname": os.getenv("MONGO_APP_NAME", "shoker_gozari"),
+        "event_listeners": [pool_listener, query_counter]
+    }
+    # مثلاً zstd,snappy,zlib (zstd و snappy بسته جدا لازم دارند)
+    compressors = os.getenv("MONGO_COMPRESSORS")
+    if compressors:
+        options["compressors"] = compressors
+    write_concern = os.getenv("MONGO_WRITE_CONCERN")
+    if write_concern:
+        options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+    read_concern = os.getenv("MONGO_READ_CONCERN")
+    if read_concern:
+        options["readConcernLevel"] = read_concern
+    read_preference = os.getenv("MONGO_READ_PREFERENCE")
+    if read_preference:
+        options["readPreference"] = read_preference
+    return options
+
+
+def get_client():
+    """MongoClient مشترک این پروسس (یک بار ساخته می‌شود)"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(os.getenv("MONGO_URI"), **_client_options())
+    return _client
+
+
+def get_database(name=DEFAULT_DB_NAME):
+    return get_client()[name]
+
+
+def get_collection(name, db_name=DEFAULT_DB_NAME):
+    return get_database(db_name)[name]
+
+
+def pool_stats():
+    """آمار استخر اتصال و کوئری‌ها برای /metrics"""
+    stats = {"pool": pool_listener.stats(), "queries": query_counter.stats()}
+    if _client is not None:
+        stats["max_pool_size"] = _client.options.pool_options.max_pool_size
+    return stats
@@ -0,0 +1,329 @@
+"""
+outbound.py - صف ارسال پیام‌ها با رعایت محدودیت نرخ بله و retry_after
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+
+from flood_control import TokenBucket, parse_limit
+from resilience import CircuitOpenError
+
+# پاسخ دکمه‌ها جلوتر از هر پیام دیگری ارسال می‌شود؛ پاسخ هندلرها در مسیر interactive و
+# پیام‌های پیگیری زمان‌بندی‌شده و آپدیت پروفایل در مسیر bulk
+LANE_CALLBACK = 0
+LANE_INTERACTIVE = 1
+LANE_BULK = 2
+
+LANE_NAMES = {LANE_CALLBACK: "callback", LANE_INTERACTIVE: "interactive", LANE_BULK: "bulk"}
+
+
+class OutboundDispatcher:
+    """ارسال درخواست‌های خروجی با محدودیت نرخ کلی و هر چت و اولویت‌بندی مسیرها"""
+
+    def __init__(self, num_senders=None, global_limit=None, chat_limit=None, max_retries=3, processes=1):
+        if num_senders is None:
+            num_senders = int(os.getenv("BALE_SENDERS", 8))
+        self.num_senders = max(1, num_senders)
+        # processes: تعداد پروسس‌هایی که با همین توکن ارسال می‌کنند؛ هر کدام سهم برابری از نرخ کلی دارد
+        self.processes = max(1, processes)
+        rate, capacity = global_limit or parse_limit(os.getenv("BALE_GLOBAL_RATE"), (25.0, 30))
+        self.global_bucket = TokenBucket(rate / self.processes, max(1, capacity // self.processes))
+        self.chat_limit = chat_limit or parse_limit(os.getenv("BALE_CHAT_RATE"), (1.0, 3))
+        self.chat_buckets = {}
+        self.max_retries = max_retries
+
+        self.lock = threading.Lock()
+        self.global_paused_until = 0.0
+        self.chat_paused_until = {}
+        # کارهای چت‌هایی که هنوز نوبتشان نرسیده؛ ترد ارسال به سراغ چت‌های دیگر می‌رود
+        self.parked = {}
+        self.counter = itertools.count()
+        self.queues = [queue.PriorityQueue() for _ in range(self.num_senders)]
+        self.lane_depths = {lane: 0 for lane in LANE_NAMES}
+        # کارهایی که از صف برداشته شده‌اند و نتیجه‌شان هنوز در Future ننشسته
+        self.in_flight = 0
+        self.sent = 0
+        self.throttled = 0
+        self.rate_limited = 0
+        self.deferred = 0
+        self.wait_seconds = 0.0
+        self.last_cleanup = time.monotonic()
+        # ارسال‌های زمان‌بندی‌شده: (زمان موعد، ترتیب، چت، تابع، Future، مسیر)؛ بدون Future یعنی فراخوانی مستقیم
+        self.delayed = []
+        self.delayed_cond = threading.Condition()
+        self.scheduled = 0
+        self.started = False
+        self.threads = []
+
+    def start(self):
+        """راه‌اندازی تردهای ارسال (یک بار)"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        for index in range(self.num_senders):
+            t = threading.Thread(target=self._run, args=(index,), name=f"outbound-{index}")
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+        t = threading.Thread(target=self._run_scheduler, name="outbound-scheduler")
+        t.daemon = True
+        t.start()
+        self.threads.append(t)
+
+    def submit(self, chat_id, func, lane=LANE_INTERACTIVE):
+        """افزودن درخواست به صف؛ نتیجه func در Future برمی‌گردد"""
+        if not self.started:
+            self.start()
+        future = Future()
+        self._enqueue(chat_id, func, future, lane)
+        return future
+
+    def submit_later(self, delay, chat_id, func, lane=LANE_INTERACTIVE):
+        """مثل submit ولی بعد از delay ثانیه وارد صف می‌شود؛ هیچ تردی منتظر نمی‌ماند"""
+        if not self.started:
+            self.start()
+        future = Future()
+        with self.delayed_cond:
+            heapq.heappush(self.delayed, (time.monotonic() + delay, next(self.counter), chat_id, func, future, lane))
+            self.scheduled += 1
+            self.delayed_cond.notify()
+        return future
+
+    def _enqueue(self, chat_id, func, future, lane):
+        shard = zlib.crc32(str(chat_id).encode()) % self.num_senders
+        with self.lock:
+            self.lane_depths[lane] += 1
+        self.queues[shard].put((lane, next(self.counter), chat_id, func, future, 0))
+
+    def _call_later(self, delay, callback):
+        # اجرای callback در ترد زمان‌بندی بعد از delay ثانیه
+        with self.delayed_cond:
+            heapq.heappush(self.delayed, (time.monotonic() + delay, next(self.counter), None, callback, None, None))
+            self.delayed_cond.notify()
+
+    def _run_scheduler(self):
+        # انتقال کارهای موعدرسیده از هیپ زمانی به صف ارسال
+        while True:
+            with self.delayed_cond:
+                while not self.delayed or self.delayed[0][0] > time.monotonic():
+                    timeout = self.delayed[0][0] - time.monotonic() if self.delayed else None
+                    self.delayed_cond.wait(timeout)
+                _, _, chat_id, func, future, lane = heapq.heappop(self.delayed)
+            if future is None:
+                func()
+            else:
+                self._enqueue(chat_id, func, future, lane)
+
+    def _chat_delay(self, chat_id, lane, now):
+        """زمان باقی‌مانده تا نوبت این چت (توقف 429 و سطل چت)؛ 0 یعنی آماده (با قفل صدا زده می‌شود)"""
+        paused = self.chat_paused_until.get(chat_id, 0.0) - now
+        if paused > 0:
+            return paused
+        if lane == LANE_CALLBACK:
+            # پاسخ دکمه پیام جدیدی در چت نیست و از سهمیه چت کم نمی‌کند
+            return 0.0
+        chat_bucket = self.chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            chat_bucket = self.chat_buckets[chat_id] = TokenBucket(*self.chat_limit)
+        if chat_bucket.consume(now=now):
+            return 0.0
+        return chat_bucket.wait_time()
+
+    def _park(self, index, job, delay):
+        """کنار گذاشتن کار چتی که نوبتش نرسیده تا زمان آمادگی (با قفل صدا زده می‌شود)"""
+        lane, chat_id = job[0], job[2]
+        self.lane_depths[lane] += 1
+        self.throttled += 1
+        self.wait_seconds += delay
+        parked = self.parked.get(chat_id)
+        if parked is not None:
+            parked.append(job)
+            return
+        self.parked[chat_id] = deque([job])
+        self._call_later(delay, lambda: self._release(index, chat_id))
+
+    def _release(self, index, chat_id):
+        # کارهای کنار گذاشته با همان ترتیب قبلی به صف ترد برمی‌گردند
+        with self.lock:
+            jobs = self.parked.pop(chat_id, ())
+        for job in jobs:
+            self.queues[index].put(job)
+
+    def _wait_global(self, lane):
+        """انتظار برای توقف سراسری 429 و سطل کلی؛ فقط این انتظار ترد ارسال را نگه می‌دارد"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.global_paused_until - now
+                if wait <= 0:
+                    if lane == LANE_CALLBACK or self.global_bucket.consume(now=now):
+                        return
+                    wait = self.global_bucket.wait_time()
+                self.throttled += 1
+                self.wait_seconds += wait
+            time.sleep(min(wait, 5))
+
+    async def call_async(self, chat_id, request, lane=LANE_INTERACTIVE):
+        """نسخه asyncio ارسال برای هندلرهای coroutine؛ task به جای ترد ارسال منتظر نوبت می‌ماند
+
+        request() coroutine درخواست بله را می‌سازد؛ همان سطل‌ها و توقف‌های 429 صف تردی رعایت می‌شود.
+        """
+        with self.lock:
+            self.in_flight += 1
+        try:
+            attempts = 0
+            while True:
+                await self._acquire_async(chat_id, lane)
+                result = await request()
+                if isinstance(result, dict) and result.get("error_code") == 429 and attempts < self.max_retries:
+                    self._on_rate_limited(chat_id, result)
+                    attempts += 1
+                    continue
+                with self.lock:
+                    self.sent += 1
+                return result
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    async def _acquire_async(self, chat_id, lane):
+        # اول سهم چت و بعد سهم کلی؛ انتظار با asyncio.sleep
+        chat_ready = False
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now - self.last_cleanup > 300:
+                    self._cleanup(now)
+                if not chat_ready:
+                    wait = self._chat_delay(chat_id, lane, now)
+                    chat_ready = wait <= 0
+                if chat_ready:
+                    wait = self.global_paused_until - now
+                    if wait <= 0:
+                        if lane == LANE_CALLBACK or self.global_bucket.consume(now=now):
+                            return
+                        wait = self.global_bucket.wait_time()
+                self.throttled += 1
+                self.wait_seconds += wait
+            await asyncio.sleep(min(wait, 5))
+
+    def _cleanup(self, now):
+        # حذف سطل‌های پر و توقف‌های تمام‌شده
+        for chat_id in [c for c, b in self.chat_buckets.items() if b.is_idle(now)]:
+            del self.chat_buckets[chat_id]
+        for chat_id in [c for c, until in self.chat_paused_until.items() if until <= now]:
+            del self.chat_paused_until[chat_id]
+        self.last_cleanup = now
+
+    def _on_rate_limited(self, chat_id, result):
+        """ثبت توقف بر اساس retry_after پاسخ 429"""
+        retry_after = (result.get("parameters") or {}).get("retry_after", 1)
+        with self.lock:
+            self.rate_limited += 1
+            until = time.monotonic() + float(retry_after)
+            if chat_id is None:
+                self.global_paused_until = max(self.global_paused_until, until)
+            else:
+                self.chat_paused_until[chat_id] = max(self.chat_paused_until.get(chat_id, 0.0), until)
+        print(f"⏳ محدودیت نرخ بله برای {chat_id}: {retry_after} ثانیه")
+
+    def _run(self, index):
+        q = self.queues[index]
+        while True:
+            job = q.get()
+            lane, chat_id = job[0], job[2]
+            with self.lock:
+                self.lane_depths[lane] -= 1
+                now = time.monotonic()
+                if now - self.last_cleanup > 300:
+                    self._cleanup(now)
+                if chat_id in self.parked and lane != LANE_CALLBACK:
+                    # پشت کارهای قبلی همین چت می‌ماند تا ترتیب پیام‌ها حفظ شود
+                    self._park(index, job, 0.0)
+                    continue
+                delay = self._chat_delay(chat_id, lane, now)
+                if delay > 0:
+                    self._park(index, job, delay)
+                    continue
+                self.in_flight += 1
+            try:
+                self._send(index, job)
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+
+    def _send(self, index, job):
+        """اجرای یک کار و نشاندن نتیجه در Future یا برگرداندن آن به صف"""
+        lane, seq, chat_id, func, future, attempts = job
+        try:
+            self._wait_global(lane)
+            result = func()
+        except CircuitOpenError as e:
+            if lane == LANE_BULK:
+                # پیام غیرفوری بعد از بسته شدن مدار دوباره فرستاده می‌شود
+                self._defer(index, job, max(e.retry_in, 1.0))
+            else:
+                future.set_exception(e)
+            return
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        if isinstance(result, dict) and result.get("error_code") == 429 and attempts < self.max_retries:
+            self._on_rate_limited(chat_id, result)
+            with self.lock:
+                self.lane_depths[lane] += 1
+            # با همان ترتیب قبلی دوباره در صف قرار می‌گیرد و تا پایان توقف کنار گذاشته می‌شود
+            self.queues[index].put((lane, seq, chat_id, func, future, attempts + 1))
+            return
+
+        with self.lock:
+            self.sent += 1
+        future.set_result(result)
+
+    def wait_idle(self, timeout):
+        """انتظار تا خالی شدن صف‌ها، ارسال‌های در جریان و زمان‌بندی‌شده (برای توقف امن)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                queued = sum(self.lane_depths.values()) + self.in_flight
+            if not queued and not self.delayed:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def _defer(self, index, job, delay):
+        """بازگرداندن کار به صف بعد از delay ثانیه با هیپ زمان‌بندی؛ نه ترد ارسال اشغال می‌شود نه ترد جدیدی ساخته می‌شود"""
+        with self.lock:
+            self.deferred += 1
+            self.lane_depths[job[0]] += 1
+        self._call_later(delay, lambda: self.queues[index].put(job))
+
+    def stats(self):
+        """عمق صف‌ها و آمار محدودیت نرخ"""
+        with self.lock:
+            now = time.monotonic()
+            return {
+                "queue_depths": [q.qsize() for q in self.queues],
+                "lanes": {LANE_NAMES[lane]: depth for lane, depth in self.lane_depths.items()},
+                "in_flight": self.in_flight,
+                "global_rate": round(self.global_bucket.rate, 2),
+                "sent": self.sent,
+                "throttled": self.throttled,
+                "throttle_wait_seconds": round(self.wait_seconds, 2),
+                "rate_limited_429": self.rate_limited,
+                "deferred_circuit_open": self.deferred,
+                "scheduled": self.scheduled,
+                "scheduled_pending": len(self.delayed),
+                "paused_chats": sum(1 for until in self.chat_paused_until.values() if until > now),
+                "parked_chats": len(self.parked)
+            }
@@ -0,0 +1,115 @@
+"""
+photo_registry.py - ذخیره file_id تصاویر آپلودشده برای ارسال دوباره بدون آپلود
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  "static", "data", "photo_file_ids.json")
+
+
+class PhotoRegistry:
+    """هر تصویر یک بار آپلود می‌شود؛ با تغییر محتوای فایل، file_id باطل می‌شود"""
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file or DEFAULT_CACHE_FILE
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self.hashes = {}
+        self.hits = 0
+        self.uploads = 0
+        self.invalidations = 0
+
+    def _load(self):
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                return {}
+        return {}
+
+    def _save(self):
+        # فایل موقت یکتا در همان پوشه؛ چند پروسس هم‌زمان فایل موقت یکدیگر را جابه‌جا نمی‌کنند
+        directory = os.path.dirname(self.cache_file)
+        tmp_file = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.cache_file) + ".",
+                                            suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            # کش فقط بهینه‌سازی است؛ خطای ذخیره روی ارسال اثری ندارد
+            print(f"⚠️ خطا در ذخیره کش تصاویر: {e}")
+            if tmp_file and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def file_hash(self, path):
+        """هش sha256 فایل؛ فقط در صورت تغییر زمان یا اندازه دوباره محاسبه می‌شود"""
+        stat = os.stat(path)
+        signature = (stat.st_mtime, stat.st_size)
+        cached = self.hashes.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        self.hashes[path] = (signature, digest.hexdigest())
+        return digest.hexdigest()
+
+    def get(self, path):
+        """file_id معتبر برای تصویر یا None"""
+        with self.lock:
+            entry = self.entries.get(path)
+            if not entry:
+                return None
+            if entry.get("sha256") != self.file_hash(path):
+                # فایل تغییر کرده؛ باید دوباره آپلود شود
+                del self.entries[path]
+                self.invalidations += 1
+                self._save()
+                return None
+            self.hits += 1
+            return entry["file_id"]
+
+    def store(self, path, file_id):
+        """ذخیره file_id بعد از آپلود موفق"""
+        with self.lock:
+            self.entries[path] = {"sha256": self.file_hash(path), "file_id": file_id}
+            self.uploads += 1
+            self._save()
+
+    def invalidate(self, path):
+        """حذف file_id (مثلاً وقتی بله آن را نپذیرد)"""
+        with self.lock:
+            if self.entries.pop(path, None) is not None:
+                self.invalidations += 1
+                self._save()
+
+    @staticmethod
+    def extract_file_id(result):
+        """file_id بزرگ‌ترین اندازه تصویر از پاسخ sendPhoto"""
+        try:
+            return result["result"]["photo"][-1]["file_id"]
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    def stats(self):
+        """آمار کش تصاویر"""
+        return {
+            "cached": len(self.entries),
+            "hits": self.hits,
+            "uploads": self.uploads,
+            "invalidations": self.invalidations
+        }
+
+
+# نمونه جهانی
+photo_registry = PhotoRegistry()
@@ -1,16 +1,23 @@
 
-import json
+import asyncio
+import contextvars
 import os
 import time
-import requests
 from dotenv import load_dotenv
-from flask import Flask
-from threading import Thread
+from flask import Flask, jsonify, request
+from threading import Thread, Event
 import sys
 import traceback
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from mongo_connection import get_client, pool_stats
+from index_manager import IndexManager
+from registered_index import RegisteredUserIndex
+import user_context
+from user_context import UserContext, QueryBudget
 import re  # برای بررسی شماره تلفن
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 # اضافه کردن مسیر جاری به سیستم برای شناسایی لودر
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -24,6 +31,7 @@ try:
         start_topic_for_user,
         complete_day_for_user,
         get_user_topic_progress,
+        get_user_progress,
         load_past_day_content
     )
 
@@ -34,34 +42,97 @@ except ImportError as e:
         from static.content.loader import (
             load_day_content, get_all_topics, get_topic_by_id,
             start_topic_for_user, complete_day_for_user, get_user_topic_progress,
-            load_past_day_content
+            get_user_progress, load_past_day_content
         )
     except:
         sys.exit(1)
 
 from static.graphics_handler import GraphicsHandler
 from daily_reset import daily_reset
+from bale_api import BaleClient, AsyncBaleClient
+from async_runner import AsyncRuntime, AsyncUpdateDispatcher
+from photo_registry import photo_registry
+from profile_updater import ProfileUpdater
+from last_login import LastLoginWriter
+from progress_report import ProgressRenderer
+from response_buffer import ResponseBuffer, ReplyKeyboardTracker
+from outbound import OutboundDispatcher, LANE_CALLBACK, LANE_INTERACTIVE, LANE_BULK
+from update_dispatcher import UpdateDispatcher
+import process_pool
+from process_pool import ProcessDispatcher
+from work_queue import PRIORITY_HIGH, PRIORITY_LOW
+from update_fetcher import UpdateFetcher, AsyncUpdateFetcher, ALLOWED_UPDATES
+from webhook import WebhookReceiver, serve
+from update_journal import UpdateJournal
+from completion_ledger import completion_ledger
+from router import Router, UpdateContext
+from flood_control import FloodController
 
 load_dotenv()
 BOT_TOKEN = os.getenv('BALE_BOT_TOKEN')
 PAYMENT_TOKEN = os.getenv('BALE_PROVIDER_TOKEN')
 MONGO_URI = os.getenv('MONGO_URI')
-BASE_URL = f"https://tapi.bale.ai/bot{BOT_TOKEN}"
+
+# کلاینت مشترک API بله (اتصال‌های keep-alive)
+bale = BaleClient(BOT_TOKEN)
+
+# حالت دریافت آپدیت: polling، webhook یا async
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# بیش از یک پروسس فقط در حالت‌های polling و webhook
+BOT_PROCESSES = int(os.getenv('BOT_PROCESSES', 1)) if BOT_MODE != "async" else 1
+
+# صف ارسال با رعایت محدودیت نرخ بله؛ با چند پروسس، پروسس اصلی (پاسخ دکمه، پیام شلوغی، پروفایل)
+# و هر ورکر صف خودشان را دارند و نرخ کلی توکن بین آن‌ها تقسیم می‌شود
+outbound = OutboundDispatcher(processes=BOT_PROCESSES + 1 if BOT_PROCESSES > 1 else 1)
+
+# حالت async: صف هر چت، دریافت آپدیت‌ها و هندلرهای coroutine روی حلقه asyncio با aiohttp؛
+# کوئری‌های Mongo و هندلرهای همگام در BOT_ASYNC_THREADS ترد اجرا می‌شوند
+async_runtime = None
+async_bale = None
+handler_executor = None
+BOT_ASYNC_THREADS = int(os.getenv('BOT_ASYNC_THREADS', 32))
+if BOT_MODE == "async":
+    async_runtime = AsyncRuntime()
+    async_bale = AsyncBaleClient(BOT_TOKEN)
+    handler_executor = ThreadPoolExecutor(BOT_ASYNC_THREADS, thread_name_prefix="handler")
 
 # شماره ادمین (فرمت بین‌المللی: 989302446141)
 ADMIN_PHONE = "989302446141"
 
 app = Flask('')
 
+webhook_receiver = None
+if BOT_MODE == "webhook":
+    if not WEBHOOK_SECRET:
+        print("❌ حالت webhook بدون WEBHOOK_SECRET اجرا نمی‌شود")
+        sys.exit(1)
+    webhook_receiver = WebhookReceiver(WEBHOOK_SECRET, int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000)))
+
 
 @app.route('/')
 def home():
     return "🤖 ربات معجزه شکرگزاری فعال است ✨"
 
 
+@app.route('/metrics')
+def metrics():
+    return jsonify(collect_metrics())
+
+
+@app.route('/webhook/<token>', methods=['POST'])
+def webhook(token):
+    if webhook_receiver is None:
+        return "", 404
+    status = webhook_receiver.receive(token, request.get_json(silent=True))
+    return "", status
+
+
 def run_web_server():
     port = int(os.environ.get('PORT', 10000))
-    app.run(host='0.0.0.0', port=port)
+    serve(app, host='0.0.0.0', port=port, threads=int(os.environ.get('WEB_THREADS', 8)))
 
 
 def keep_alive():
@@ -76,7 +147,8 @@ def get_mongo_client():
     """ایجاد اتصال به MongoDB"""
     try:
         if MONGO_URI:
-            client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+            # همان کلاینت مشترک لودر و daily_reset
+            client = get_client()
             client.admin.command('ping')
             print("✅ اتصال به MongoDB موفقیت‌آمیز بود")
             return client
@@ -107,13 +179,49 @@ except Exception as e:
 
 # ========== توابع کمکی ==========
 
+# شناسه کاربران ثبت‌نام‌شده و ادمین در حافظه؛ پاسخ منفی بدون رفتن به Mongo
+registered_index = RegisteredUserIndex(ADMIN_PHONE)
+
+
+def ensure_registered_index():
+    """شروع تنبل فهرست در پروسس‌های worker که start_polling را اجرا نمی‌کنند"""
+    if not registered_index.started and users_collection is not None:
+        registered_index.start(users_collection)
+
+
+def get_registered_user(user_id):
+    """سند ثبت‌نام کاربر یا None؛ داخل یک آپدیت از UserContext خوانده می‌شود"""
+    if users_collection is None:
+        return None
+    context = user_context.current(user_id)
+    if context is not None:
+        return context.registration
+    return users_collection.find_one({"user_id": str(user_id)})
+
+
+def is_registered_user(user_id):
+    """ثبت‌نام بودن کاربر از فهرست حافظه؛ تا آماده شدن فهرست از دیتابیس"""
+    if users_collection is None:
+        return False
+    ensure_registered_index()
+    registered = registered_index.contains(user_id)
+    if registered is None:
+        registered = get_registered_user(user_id) is not None
+    return registered
+
+
 def is_admin_user(user_id):
     """بررسی اینکه آیا کاربر ادمین است"""
     try:
         if users_collection is None:
             return False
 
-        user = users_collection.find_one({"user_id": str(user_id)})
+        ensure_registered_index()
+        admin = registered_index.is_admin(user_id)
+        if admin is not None:
+            return admin
+
+        user = get_registered_user(user_id)
         if user and user.get("phone_number") == ADMIN_PHONE:
             return True
         return False
@@ -183,6 +291,7 @@ def register_user(user_id, username, first_name, last_name, phone_number):
         }
 
         users_collection.insert_one(user_data)
+        registered_index.add(user_id, phone_number, now)
 
         # حذف از کاربران موقت
         if temp_users_collection is not None:
@@ -190,8 +299,8 @@ def register_user(user_id, username, first_name, last_name, phone_number):
 
         print(f"✅ کاربر ثبت‌نام شد: {user_id} | شماره: {phone_number}")
 
-        # آپدیت بیوگرافی ربات
-        update_bot_profile()
+        # آپدیت بیوگرافی ربات در پس‌زمینه
+        record_registration()
 
         return {"success": True, "message": "ثبت‌نام شما با موفقیت انجام شد! 🎉"}
 
@@ -210,10 +319,11 @@ def get_registered_users_count():
         return 0
 
 
-def update_bot_profile():
+def update_bot_profile(total_users=None):
     """آپدیت پروفایل ربات با تعداد کاربران"""
     try:
-        total_users = get_registered_users_count()
+        if total_users is None:
+            total_users = get_registered_users_count()
 
         # ایجاد متن برای بیوگرافی
         bio_text = f"✨ معجزه شکرگزاری روزانه"
@@ -221,28 +331,56 @@ def update_bot_profile():
         # آپدیت نام ربات
         name_text = f"معجزه شکرگزاری ({total_users}+)"
 
+        # هر دو درخواست در مسیر غیرفوری صف خروجی؛ با باز بودن مدار بعداً فرستاده می‌شوند
         # آپدیت بیوگرافی
-        url = f"{BASE_URL}/setMyDescription"
-        data = {"description": bio_text[:70]}  # محدودیت کاراکتر
-        response = requests.post(url, json=data, timeout=5)
+        outbound.submit(None, lambda: api_call("setMyDescription", {"description": bio_text[:70]}),  # محدودیت کاراکتر
+                        LANE_BULK)
 
         # آپدیت نام ربات
-        url_name = f"{BASE_URL}/setMyName"
-        data_name = {"name": name_text[:64]}  # محدودیت کاراکتر نام
-        requests.post(url_name, json=data_name, timeout=5)
+        future = outbound.submit(None, lambda: api_call("setMyName", {"name": name_text[:64]}),  # محدودیت کاراکتر نام
+                                 LANE_BULK)
 
-        print(f"📊 پروفایل ربات آپدیت شد: {name_text}")
+        def on_done(f):
+            if f.exception():
+                print(f"⚠️ خطا در آپدیت پروفایل: {f.exception()}")
+            else:
+                print(f"📊 پروفایل ربات آپدیت شد: {name_text}")
+        future.add_done_callback(on_done)
 
     except Exception as e:
         print(f"⚠️ خطا در آپدیت پروفایل: {e}")
 
 
+# پروفایل حداکثر یک بار در هر PROFILE_UPDATE_INTERVAL ثانیه و بدون شمارش کامل آپدیت می‌شود
+profile_updater = ProfileUpdater(get_registered_users_count, update_bot_profile)
+
+
+def record_registration():
+    """شمارش ثبت‌نام برای پروفایل؛ پروفایل فقط در پروسس اصلی آپدیت می‌شود"""
+    if process_pool.in_worker():
+        process_pool.notify_parent("registration")
+    else:
+        profile_updater.record_registration()
+
+
+def handle_worker_event(event):
+    """رویدادهای پروسس‌های ورکر در پروسس اصلی"""
+    if event == "registration":
+        profile_updater.record_registration()
+
+
+def flush_worker():
+    """تخلیه پروسس ورکر پس از پایان آپدیت‌ها (معادل shutdown_hooks پروسس اصلی)"""
+    outbound.wait_idle(5)
+    last_login_writer.flush()
+
+
 def start_registration(chat_id, user_id, username, first_name, last_name):
     """شروع فرآیند ثبت‌نام"""
     try:
         # بررسی آیا کاربر قبلاً ثبت‌نام کرده
         if users_collection is not None:
-            existing = users_collection.find_one({"user_id": str(user_id)})
+            existing = get_registered_user(user_id)
             if existing:
                 message = f"""
 ✅ شما قبلاً ثبت‌نام کرده‌اید!
@@ -339,8 +477,6 @@ def handle_phone_number(chat_id, user_id, phone_number):
             remove_keyboard = {"remove_keyboard": True}
             send_message(chat_id, "✅", remove_keyboard)
 
-            time.sleep(0.5)
-
             # ارسال پیام تبریک
             welcome_message = f"""
 {result["message"]}
@@ -365,7 +501,8 @@ def handle_phone_number(chat_id, user_id, phone_number):
                 ]
             }
 
-            send_message(chat_id, welcome_message, keyboard)
+            # پیام تبریک نیم ثانیه بعد از «✅» فرستاده می‌شود
+            send_message_later(0.5, chat_id, welcome_message, keyboard)
 
         else:
             send_message(chat_id, result["message"])
@@ -526,11 +663,7 @@ def handle_support_online(chat_id):
 
     send_message(chat_id, message)
 
-    time.sleep(1)
-
     # ارسال فاکتور برای ۲۰,۰۰۰ تومان
-    invoice_url = f"{BASE_URL}/sendInvoice"
-
     invoice_data = {
         "chat_id": chat_id,
         "title": "💝 حمایت از توسعه‌دهنده",
@@ -547,10 +680,15 @@ def handle_support_online(chat_id):
         "need_shipping_address": False
     }
 
-    try:
-        response = requests.post(invoice_url, json=invoice_data, timeout=10)
-        if response.status_code != 200:
-            print(f"⚠️ خطا در ارسال فاکتور: {response.text}")
+    def on_invoice_result(future):
+        # در ترد ارسال اجرا می‌شود؛ پیام‌های بعدی هم فقط زمان‌بندی می‌شوند
+        if future.exception() is not None:
+            print(f"❌ Error sending invoice: {future.exception()}")
+            send_message_later(0, chat_id, "⚠️ خطایی در ایجاد درگاه پرداخت رخ داد.")
+            return
+        result = future.result()
+        if not result.get("ok"):
+            print(f"⚠️ خطا در ارسال فاکتور: {result}")
             # اگر درگاه پرداخت مشکل داشت، گزینه کارت به کارت نشون بده
             error_message = """
 ⚠️ **درگاه پرداخت موقتاً در دسترس نیست**
@@ -567,10 +705,10 @@ def handle_support_online(chat_id):
                     [{"text": "🔙 بازگشت", "callback_data": "support_developer"}]
                 ]
             }
-            send_message(chat_id, error_message, keyboard)
-    except Exception as e:
-        print(f"❌ Error sending invoice: {e}")
-        send_message(chat_id, "⚠️ خطایی در ایجاد درگاه پرداخت رخ داد.")
+            send_message_later(0, chat_id, error_message, keyboard)
+
+    # فاکتور یک ثانیه بعد از توضیحات فرستاده می‌شود
+    call_chat_api_later(1.0, chat_id, "sendInvoice", invoice_data).add_done_callback(on_invoice_result)
 
 
 def handle_support_cart(chat_id):
@@ -602,34 +740,131 @@ def handle_support_cart(chat_id):
 
 # ========== توابع API ==========
 
-def send_message(chat_id, text, keyboard=None):
-    url = f"{BASE_URL}/sendMessage"
-    data = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
-    if keyboard:
-        data["reply_markup"] = json.dumps(keyboard)
+def api_call(method, payload=None, files=None):
+    """فراخوانی API با کلاینت فعال (aiohttp در حالت async، وگرنه Session همگام)"""
+    if async_bale is not None:
+        return async_runtime.run(async_bale.call(method, payload, files=files))
+    return bale.call(method, payload, files=files)
+
+
+def call_chat_api(chat_id, method, payload, files=None, lane=LANE_INTERACTIVE):
+    """ارسال درخواست مربوط به یک چت از طریق صف خروجی و انتظار برای پاسخ"""
+    # پیام‌های متنی بافرشده قبل از این درخواست فرستاده می‌شوند تا ترتیب به هم نخورد
+    response_buffer.flush()
+    return outbound.submit(chat_id, lambda: api_call(method, payload, files=files), lane).result()
+
+
+def call_chat_api_later(delay, chat_id, method, payload, lane=LANE_BULK):
+    """زمان‌بندی درخواست یک چت برای delay ثانیه بعد؛ Future برمی‌گرداند و منتظر نمی‌ماند
+
+    پیام‌های پیگیری غیرفوری‌اند و در مسیر bulk، پشت پاسخ‌های تعاملی ارسال می‌شوند.
+    """
+    return outbound.submit_later(delay, chat_id, lambda: api_call(method, payload), lane)
+
+
+def observe_delivery(data, result):
+    """ثبت کیبورد پایین صفحه فقط وقتی بله پیام را پذیرفته است"""
+    if isinstance(result, dict) and result.get("ok"):
+        reply_keyboards.observe(data["chat_id"], data.get("reply_markup"))
+
+
+def deliver_message(data):
+    """ارسال واقعی یک پیام متنی"""
     try:
-        response = requests.post(url, json=data, timeout=30)
-        return response.json()
+        result = call_chat_api(data["chat_id"], "sendMessage", data)
     except Exception as e:
         print(f"❌ خطا در ارسال پیام: {e}")
         return None
+    observe_delivery(data, result)
+    return result
+
+
+# پیام‌های متنی پشت سر هم هر هندلر در یک درخواست ادغام می‌شوند
+response_buffer = ResponseBuffer(deliver_message)
+reply_keyboards = ReplyKeyboardTracker()
+
+
+def send_message(chat_id, text, keyboard=None):
+    data = {"chat_id": chat_id, "text": text, "parse_mode": "HTML", "reply_markup": keyboard or None}
+    if response_buffer.active():
+        # تا پایان هندلر نگه داشته می‌شود
+        response_buffer.add(data)
+        return {"ok": True, "buffered": True}
+    return deliver_message(data)
+
+
+def send_main_menu(chat_id):
+    """ارسال کیبورد منوی اصلی فقط وقتی که همین حالا پایین صفحه نیست"""
+    keyboard = GraphicsHandler.create_main_menu_keyboard()
+    if reply_keyboards.is_current(chat_id, keyboard):
+        return None
+    return send_message(chat_id, "👇 منوی سریع:", keyboard)
+
+
+def send_message_later(delay, chat_id, text, keyboard=None):
+    """ارسال پیام پیگیری بعد از delay ثانیه بدون نگه داشتن ورکر"""
+    data = {"chat_id": chat_id, "text": text, "parse_mode": "HTML", "reply_markup": keyboard or None}
+    future = call_chat_api_later(delay, chat_id, "sendMessage", data)
+
+    def on_done(f):
+        if f.exception():
+            print(f"❌ خطا در ارسال پیام: {f.exception()}")
+        else:
+            observe_delivery(data, f.result())
+    future.add_done_callback(on_done)
+    return future
+
+
+def edit_request(chat_id, message, text, keyboard=None):
+    """(متد، پارامترها) ویرایش پیامی که دکمه روی آن بود یا None اگر پیام شناسه ندارد؛ text=None فقط کیبورد را عوض می‌کند"""
+    if not message or "message_id" not in message:
+        return None
+    payload = {"chat_id": chat_id, "message_id": message["message_id"], "reply_markup": keyboard or None}
+    if text is None:
+        return "editMessageReplyMarkup", payload
+    payload["parse_mode"] = "HTML"
+    if message.get("photo"):
+        payload["caption"] = text
+        return "editMessageCaption", payload
+    payload["text"] = text
+    return "editMessageText", payload
+
+
+def edit_succeeded(result):
+    # محتوای یکسان هم یعنی صفحه به‌روز است
+    return bool(result.get("ok")) or "not modified" in str(result.get("description", ""))
+
+
+def edit_message(chat_id, message, text, keyboard=None):
+    """ویرایش پیامی که دکمه روی آن بود (کپشن تصویر یا متن)؛ در صورت موفقیت True"""
+    request = edit_request(chat_id, message, text, keyboard)
+    if request is None:
+        return False
+    try:
+        result = call_chat_api(chat_id, *request)
+    except Exception as e:
+        print(f"⚠️ خطا در ویرایش پیام: {e}")
+        return False
+    return edit_succeeded(result)
 
 
 def send_photo(chat_id, photo_path, caption=None, keyboard=None):
     """ارسال تصویر به همراه متن و کیبورد"""
-    url = f"{BASE_URL}/sendPhoto"
-    payload = {"chat_id": chat_id, "parse_mode": "HTML"}
-    if caption:
-        payload["caption"] = caption
-    if keyboard:
-        payload["reply_markup"] = json.dumps(keyboard)
+    payload = {"chat_id": chat_id, "parse_mode": "HTML", "caption": caption or None, "reply_markup": keyboard or None}
 
     try:
         if os.path.exists(photo_path):
+            # ارسال با file_id اگر این تصویر قبلاً آپلود شده
+            file_id = photo_registry.get(photo_path)
+            if file_id:
+                result = call_chat_api(chat_id, "sendPhoto", dict(payload, photo=file_id))
+                if result.get("error_code") != 400:
+                    # فقط وقتی بله شناسه فایل را رد کند دوباره آپلود می‌شود (نه برای 429 یا خطای موقت)
+                    return result
+                photo_registry.invalidate(photo_path)
+
             with open(photo_path, 'rb') as photo:
-                files = {'photo': photo}
-                response = requests.post(url, data=payload, files=files, timeout=40)
-                return response.json()
+                result = call_chat_api(chat_id, "sendPhoto", payload, files={'photo': photo})
         else:
             print(f"⚠️ تصویر یافت نشد: {photo_path}")
             return send_message(chat_id, caption, keyboard)
@@ -637,122 +872,158 @@ def send_photo(chat_id, photo_path, caption=None, keyboard=None):
         print(f"❌ خطا در ارسال عکس: {e}")
         return send_message(chat_id, caption, keyboard)
 
+    # تصویر ارسال شده؛ خطای کش نباید متن را دوباره بفرستد
+    try:
+        file_id = photo_registry.extract_file_id(result)
+        if file_id:
+            photo_registry.store(photo_path, file_id)
+    except Exception as e:
+        print(f"⚠️ خطا در ذخیره file_id تصویر: {e}")
+    return result
 
-def get_updates(last_update_id=0):
-    url = f"{BASE_URL}/getUpdates"
-    params = {"offset": last_update_id + 1, "timeout": 30, "limit": 100}
+
+def get_updates_params(last_update_id, allowed_updates):
+    return {"offset": last_update_id + 1, "timeout": 30, "limit": 100, "allowed_updates": allowed_updates}
+
+
+def get_updates(last_update_id=0, allowed_updates=None):
     try:
-        response = requests.get(url, params=params, timeout=35)
-        return response.json()
+        return api_call("getUpdates", get_updates_params(last_update_id, allowed_updates))
     except:
         return {"ok": False}
 
 
-def answer_callback(callback_id):
-    url = f"{BASE_URL}/answerCallbackQuery"
+# ========== نسخه‌های async (برای هندلرهای coroutine) ==========
+# در حالت همگام همان توابع همگام را صدا می‌زنند و معلق نمی‌شوند تا Router هندلر را بدون حلقه اجرا کند
+
+async def run_blocking(func, *args):
+    """اجرای کد همگام (کوئری Mongo، خواندن فایل) در handler_executor بدون نگه داشتن حلقه"""
+    if handler_executor is None:
+        return func(*args)
+    # UserContext آپدیت (ContextVar) همراه کار به ترد می‌رود
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(handler_executor, context.run, func, *args)
+
+
+async def async_call_chat_api(chat_id, method, payload, files=None, lane=LANE_INTERACTIVE):
+    """مثل call_chat_api؛ در حالت async نوبت نرخ روی حلقه گرفته و درخواست با aiohttp فرستاده می‌شود"""
+    if async_bale is None:
+        return call_chat_api(chat_id, method, payload, files=files, lane=lane)
+    return await outbound.call_async(chat_id, lambda: async_bale.call(method, payload, files=files), lane)
+
+
+async def async_send_message(chat_id, text, keyboard=None):
+    if async_bale is None:
+        return send_message(chat_id, text, keyboard)
+    data = {"chat_id": chat_id, "text": text, "parse_mode": "HTML", "reply_markup": keyboard or None}
     try:
-        requests.post(url, json={"callback_query_id": callback_id}, timeout=5)
-    except:
-        pass
+        result = await async_call_chat_api(chat_id, "sendMessage", data)
+    except Exception as e:
+        print(f"❌ خطا در ارسال پیام: {e}")
+        return None
+    observe_delivery(data, result)
+    return result
 
 
-# ========== توابع کمکی ==========
+async def async_send_main_menu(chat_id):
+    """نسخه async send_main_menu"""
+    keyboard = GraphicsHandler.create_main_menu_keyboard()
+    if reply_keyboards.is_current(chat_id, keyboard):
+        return None
+    return await async_send_message(chat_id, "👇 منوی سریع:", keyboard)
 
-def create_progress_text(user_id):
-    """📊 ساخت متن پیشرفت حرفه‌ای"""
+
+async def async_edit_message(chat_id, message, text, keyboard=None):
+    """نسخه async edit_message"""
+    if async_bale is None:
+        return edit_message(chat_id, message, text, keyboard)
+    request = edit_request(chat_id, message, text, keyboard)
+    if request is None:
+        return False
     try:
-        all_topics = get_all_topics()
-        total_days = 28 * len(all_topics)
-        completed_days = 0
-        progress_details = ""
-
-        for topic in all_topics:
-            progress = get_user_topic_progress(user_id, topic['id'])
-            topic_completed = len(progress.get("completed_days", []))
-            completed_days += topic_completed
-
-            topic_percent = (topic_completed / 28) * 100 if 28 > 0 else 0
-
-            if topic_percent == 100:
-                progress_emoji = "🏆"
-                status_text = "کامل شده!"
-            elif topic_percent >= 75:
-                progress_emoji = "✨"
-                status_text = "عالی!"
-            elif topic_percent >= 50:
-                progress_emoji = "🚀"
-                status_text = "خوب!"
-            elif topic_percent >= 25:
-                progress_emoji = "💪"
-                status_text = "ادامه دهید!"
-            else:
-                progress_emoji = "🌱"
-                status_text = "شروع شده"
+        result = await async_call_chat_api(chat_id, *request)
+    except Exception as e:
+        print(f"⚠️ خطا در ویرایش پیام: {e}")
+        return False
+    return edit_succeeded(result)
 
-            filled_bars = int(topic_percent / 5)
-            progress_bar = "█" * filled_bars + "░" * (20 - filled_bars)
 
-            progress_details += f"""
-{progress_emoji} {topic['emoji']} {topic['name']}
-{progress_bar}
-{topic_percent:.1f}% • {topic_completed}/۲۸ روز • {status_text}
-─────────────────
-"""
+async def async_send_photo(chat_id, photo_path, caption=None, keyboard=None):
+    """نسخه async send_photo"""
+    if async_bale is None:
+        return send_photo(chat_id, photo_path, caption, keyboard)
+    payload = {"chat_id": chat_id, "parse_mode": "HTML", "caption": caption or None, "reply_markup": keyboard or None}
 
-        overall_percent = (completed_days / total_days) * 100 if total_days > 0 else 0
-
-        if overall_percent == 100:
-            overall_emoji = "👑"
-            overall_status = "شما استاد شکرگزاری هستید!"
-            motivation = "🎉 به همه معجزه‌های زندگی‌تان دست یافته‌اید!"
-        elif overall_percent >= 75:
-            overall_emoji = "🌟"
-            overall_status = "در آستانه استادی!"
-            motivation = "✨ چند گام دیگر تا تحول کامل باقی مانده!"
-        elif overall_percent >= 50:
-            overall_emoji = "⚡"
-            overall_status = "در میانه راه!"
-            motivation = "🚀 نیمه راه را طی کرده‌اید، ادامه دهید!"
-        elif overall_percent >= 25:
-            overall_emoji = "🔥"
-            overall_status = "شروع قدرتمند!"
-            motivation = "💪 عادت در حال شکل‌گیری است!"
-        else:
-            overall_emoji = "🌷"
-            overall_status = "تازه شروع کرده‌اید!"
-            motivation = "🌱 مهم‌ترین قدم را برداشته‌اید!"
+    try:
+        # کش file_id فایل تصویر را هش می‌کند و روی دیسک می‌نویسد
+        file_id = await run_blocking(photo_registry.get, photo_path)
+        if file_id:
+            result = await async_call_chat_api(chat_id, "sendPhoto", dict(payload, photo=file_id))
+            if result.get("error_code") != 400:
+                return result
+            await run_blocking(photo_registry.invalidate, photo_path)
+
+        with open(photo_path, 'rb') as photo:
+            result = await async_call_chat_api(chat_id, "sendPhoto", payload, files={'photo': photo})
+    except Exception as e:
+        print(f"❌ خطا در ارسال عکس: {e}")
+        return await async_send_message(chat_id, caption, keyboard)
 
-        overall_filled = int(overall_percent / 5)
-        overall_bar = "▓" * overall_filled + "░" * (20 - overall_filled)
+    try:
+        file_id = photo_registry.extract_file_id(result)
+        if file_id:
+            await run_blocking(photo_registry.store, photo_path, file_id)
+    except Exception as e:
+        print(f"⚠️ خطا در ذخیره file_id تصویر: {e}")
+    return result
 
-        progress_text = f"""
-📈 نقشه سفر شکرگزاری شما
 
-══════════════════════════════
+async def async_get_updates(last_update_id=0, allowed_updates=None):
+    """long polling روی حلقه (حالت async)"""
+    try:
+        return await async_bale.call("getUpdates", get_updates_params(last_update_id, allowed_updates))
+    except Exception:
+        return {"ok": False}
 
-{progress_details}
-══════════════════════════════
 
-{overall_emoji} پیشرفت کلی:
-{overall_bar}
-{overall_percent:.1f}% • {completed_days} از {total_days} روز
+def set_webhook(url):
+    """ثبت آدرس وب‌هوک در بله"""
+    try:
+        return api_call("setWebhook", {"url": url})
+    except Exception as e:
+        print(f"❌ خطا در ثبت وب‌هوک: {e}")
+        return None
 
-✨ {overall_status}
-💫 {motivation}
 
-══════════════════════════════
+def answer_callback(callback_id, text=None, chat_id=None):
+    """پاسخ دکمه در مسیر پس‌زمینه؛ منتظر نتیجه نمی‌ماند"""
+    def call():
+        try:
+            return api_call("answerCallbackQuery", {"callback_query_id": callback_id, "text": text or None})
+        except Exception as e:
+            print(f"⚠️ خطا در پاسخ دکمه: {e}")
+            return None
+    outbound.submit(chat_id, call, LANE_CALLBACK)
 
-🎯 نکته طلایی:
-"هر درصد، قدمی به سوی تحول است.
-شما در مسیر درست قرار دارید!"
-"""
+
+# ========== توابع کمکی ==========
+
+# متن پیشرفت از جدول‌های آماده ساخته و با کلید تعداد روزهای تکمیل‌شده کش می‌شود
+progress_renderer = ProgressRenderer(get_all_topics())
+# last_login خارج از مسیر پاسخ و دسته‌ای نوشته می‌شود
+last_login_writer = LastLoginWriter(users_collection)
+
+
+def create_progress_text(user_id):
+    """📊 ساخت متن پیشرفت حرفه‌ای"""
+    try:
+        # یک کوئری برای زیرسند topics (داخل آپدیت از UserContext)
+        counts = progress_renderer.completed_counts(get_user_progress(user_id))
+        progress_text = progress_renderer.render(counts)
 
         # آپدیت last_login کاربر
         if users_collection is not None:
-            users_collection.update_one(
-                {"user_id": str(user_id)},
-                {"$set": {"last_login": datetime.now()}}
-            )
+            last_login_writer.touch(user_id)
 
         return progress_text
 
@@ -777,13 +1048,11 @@ def handle_start(chat_id, user_id, username=None, first_name=None, last_name=Non
     """هندلر استارت جدید با چک ثبت‌نام"""
     welcome_text = GraphicsHandler.create_welcome_message()
     send_message(chat_id, welcome_text)
-    time.sleep(1)
 
     # بررسی آیا کاربر ثبت‌نام کرده
     is_registered = False
     if users_collection is not None:
-        user_data = users_collection.find_one({"user_id": str(user_id)})
-        is_registered = user_data is not None
+        is_registered = is_registered_user(user_id)
 
     # بررسی آیا کاربر ادمین است
     is_admin = is_admin_user(user_id)
@@ -829,16 +1098,16 @@ def handle_start(chat_id, user_id, username=None, first_name=None, last_name=Non
 • فقط چند ثانیه زمان می‌برد
 """
 
+    # با بافر پاسخ، خوش‌آمد و منو در یک پیام فرستاده می‌شوند
     send_message(chat_id, message, start_keyboard)
 
 
-def handle_category_selection(chat_id, user_id, topic_id):
+async def handle_category_selection(chat_id, user_id, topic_id):
     """دسترسی به محتوا فقط برای کاربران ثبت‌نام شده"""
     try:
         # بررسی ثبت‌نام
         if users_collection is not None:
-            user_data = users_collection.find_one({"user_id": str(user_id)})
-            if not user_data:
+            if not await run_blocking(is_registered_user, user_id):
                 # کاربر ثبت‌نام نکرده
                 message = """
 ⛔ **دسترسی محدود**
@@ -857,12 +1126,12 @@ def handle_category_selection(chat_id, user_id, topic_id):
                         [{"text": "🔙 بازگشت", "callback_data": "main_menu"}]
                     ]
                 }
-                send_message(chat_id, message, keyboard)
+                await async_send_message(chat_id, message, keyboard)
                 return
 
         # ادامه کد برای کاربران ثبت‌نام شده
-        user_progress = get_user_topic_progress(user_id, topic_id)
-        access_info = daily_reset.get_access_info(user_id, topic_id)
+        user_progress = await run_blocking(get_user_topic_progress, user_id, topic_id)
+        access_info = await run_blocking(daily_reset.get_access_info, user_id, topic_id)
         current_day = user_progress.get("current_day", 1)
         completed_days = user_progress.get("completed_days", [])
         topic_info = get_topic_by_id(topic_id)
@@ -879,15 +1148,15 @@ def handle_category_selection(chat_id, user_id, topic_id):
 🎯 برای ادامه، موضوع جدیدی را انتخاب کنید.
 """
             keyboard = GraphicsHandler.create_day_options_keyboard(topic_id, completed_days)
-            send_message(chat_id, message, keyboard)
+            await async_send_message(chat_id, message, keyboard)
             return
 
-        content = load_day_content(topic_id, current_day, user_id)
+        content = await run_blocking(load_day_content, topic_id, current_day, user_id)
         if not content:
-            send_message(chat_id, "⚠️ خطا در دریافت محتوا.\nلطفاً لحظاتی بعد مجدد تلاش کنید.")
+            await async_send_message(chat_id, "⚠️ خطا در دریافت محتوا.\nلطفاً لحظاتی بعد مجدد تلاش کنید.")
             return
 
-        daily_reset.record_access(user_id, topic_id, content['day_number'])
+        await run_blocking(daily_reset.record_access, user_id, topic_id, content['day_number'])
         is_completed = content["day_number"] in completed_days
 
         msg_text = GraphicsHandler.create_beautiful_message(topic_info['name'], content['day_number'], user_progress)
@@ -896,128 +1165,167 @@ def handle_category_selection(chat_id, user_id, topic_id):
 
         photo_path = topic_info.get("image")
         if photo_path and os.path.exists(photo_path):
-            send_photo(chat_id, photo_path, caption=msg_text, keyboard=inline_keyboard)
+            await async_send_photo(chat_id, photo_path, caption=msg_text, keyboard=inline_keyboard)
         else:
-            send_message(chat_id, msg_text, inline_keyboard)
+            await async_send_message(chat_id, msg_text, inline_keyboard)
 
-        send_message(chat_id, "👇 منوی سریع:", GraphicsHandler.create_main_menu_keyboard())
+        await async_send_main_menu(chat_id)
 
     except Exception as e:
         traceback.print_exc()
-        send_message(chat_id, "⚠️ مشکل موقتی پیش آمد.\nسیستم در حال به‌روزرسانی است.")
+        await async_send_message(chat_id, "⚠️ مشکل موقتی پیش آمد.\nسیستم در حال به‌روزرسانی است.")
 
 
-# ========== حلقه اصلی Polling ==========
+# ========== مسیرهای ربات ==========
 
-# ========== حلقه اصلی Polling ==========
+# حداکثر کوئری Mongo هر مسیر در یک آپدیت (BOT_STRICT_QUERY_BUDGET=1 تجاوز را خطا می‌کند)
+QUERY_BUDGETS = {
+    "on_start": 2,
+    "on_categories": 1,
+    "on_topic": 5,
+    "on_complete": 6,
+    "on_topic_progress": 2,
+    "on_review": 2,
+    "on_past_day": 2,
+    "on_back_to_topic": 5,
+    "on_overall_progress": 1,
+}
+query_budget = QueryBudget(QUERY_BUDGETS, strict=os.getenv('BOT_STRICT_QUERY_BUDGET') == "1")
 
-def start_polling():
-    keep_alive()
-    print("🤖 ربات معجزه شکرگزاری فعال شد...")
 
-    # آپدیت اولیه پروفایل
-    try:
-        update_bot_profile()
-    except:
-        pass
+@contextmanager
+def user_scope(ctx):
+    """اطلاعات کاربر آپدیت (ContextVar)؛ برای هندلرهای coroutine روی حلقه هم معتبر است"""
+    if users_collection is None or not ctx.user_id:
+        yield
+        return
+    with user_context.bind(UserContext(ctx.user_id, ADMIN_PHONE)):
+        yield
 
-    last_update_id = 0
 
-    while True:
-        try:
-            updates = get_updates(last_update_id)
-            if updates.get("ok") and updates.get("result"):
-                for update in updates["result"]:
-                    last_update_id = update["update_id"]
+@contextmanager
+def update_scope(ctx):
+    """محدوده هر آپدیت: بافر پاسخ، اطلاعات کاربر و بودجه کوئری"""
+    with query_budget.measure(ctx.route), response_buffer.collect(), user_scope(ctx):
+        yield
+
+
+# بافر پاسخ و بودجه کوئری به ترد وابسته‌اند؛ هندلر coroutine روی حلقه فقط user_scope را دارد
+router = Router(scope=update_scope, async_scope=user_scope)
 
-                    if "message" in update:
-                        msg = update["message"]
-                        chat_id = msg["chat"]["id"]
-                        user_id = str(msg["from"]["id"])
+# برچسب دکمه هر موضوع در کیبورد موضوعات
+TOPIC_LABELS = {f"{t['emoji']} {t['name']}": t['id'] for t in get_all_topics()}
+
+
+def is_phone_like(text):
+    """متنی که احتمالاً شماره تلفن است"""
+    return "شماره" in text or re.search(r'\d+', text) is not None
+
+
+def find_topic_in_text(text):
+    """پیدا کردن موضوع از روی متن دکمه یا پیام"""
+    topic_id = TOPIC_LABELS.get(text)
+    if topic_id is not None:
+        return topic_id
+    for t in get_all_topics():
+        if t['name'] in text:
+            return t['id']
+    return None
 
-                        username = msg["from"].get("username", "")
-                        first_name = msg["from"].get("first_name", "")
-                        last_name = msg["from"].get("last_name", "")
 
-                        text = msg.get("text", "")
+@router.text("/start", "🔙 بازگشت", group="registration")
+@router.callback("main_menu", group="registration")
+def on_start(ctx):
+    handle_start(ctx.chat_id, ctx.user_id, ctx.username, ctx.first_name, ctx.last_name)
 
-                        if text == "/start":
-                            handle_start(chat_id, user_id, username, first_name, last_name)
 
-                        elif text == "📱 ارسال شماره تلفن":
-                            # کاربر دکمه ارسال شماره را زده
-                            message = """
+@router.text("📱 ارسال شماره تلفن", group="registration")
+def on_phone_button(ctx):
+    chat_id = ctx.chat_id
+    # کاربر دکمه ارسال شماره را زده
+    message = """
 لطفاً شماره تلفن خود را به صورت متن وارد کنید:
 مثال: ۰۹۱۲۳۴۵۶۷۸۹
 """
-                            send_message(chat_id, message)
-
-                        elif text == "🔙 بازگشت":
-                            handle_start(chat_id, user_id, username, first_name, last_name)
-
-                        elif "شماره" in text or re.search(r'\d+', text):
-                            # احتمالاً شماره تلفن ارسال شده
-                            handle_phone_number(chat_id, user_id, text)
-
-                        elif text == "/stats":
-                            # فقط برای ادمین
-                            show_registration_stats(chat_id, user_id)
-
-                        elif text == "🎯 موضوعات شکرگزاری":
-                            # چک ثبت‌نام قبل از نمایش موضوعات
-                            if users_collection is not None:
-                                user_data = users_collection.find_one({"user_id": str(user_id)})
-                                if not user_data:
-                                    send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
-                                    continue
-                            send_message(chat_id, "🎯 یک حوزه از زندگی خود را برای شکرگزاری انتخاب کنید:",
-                                         GraphicsHandler.create_categories_keyboard())
-
-                        elif text == "📊 پیشرفت کلی":
-                            progress_text = create_progress_text(user_id)
-                            send_message(chat_id, progress_text)
-
-                        elif text == "❓ راهنما":
-                            help_message = GraphicsHandler.create_help_message()
-                            send_message(chat_id, help_message)
-
-                        elif text == "👨‍💻 ارتباط با من":
-                            contact_message = GraphicsHandler.create_contact_message()
-                            send_message(chat_id, contact_message)
-
-                        elif text == "💝 حمایت":
-                            handle_support_developer(chat_id, user_id)
-
-                        else:
-                            for t in get_all_topics():
-                                if t['name'] in text:
-                                    handle_category_selection(chat_id, user_id, t['id'])
-                                    break
-
-                    elif "callback_query" in update:
-                        cb = update["callback_query"]
-                        chat_id = cb["message"]["chat"]["id"]
-                        user_id = str(cb["from"]["id"])
-                        data = cb.get("data", "")
-                        answer_callback(cb["id"])
-
-                        username = cb["from"].get("username", "")
-                        first_name = cb["from"].get("first_name", "")
-                        last_name = cb["from"].get("last_name", "")
-
-                        if data == "start_registration":
-                            start_registration(chat_id, user_id, username, first_name, last_name)
-
-                        elif data == "show_reg_stats":
-                            # فقط برای ادمین
-                            show_registration_stats(chat_id, user_id)
-
-                        elif data == "refresh_reg_stats":
-                            # فقط برای ادمین
-                            show_registration_stats(chat_id, user_id)
-
-                        elif data == "why_register":
-                            message = f"""
+    send_message(chat_id, message)
+
+
+@router.fallback(is_phone_like, name="on_phone_number", group="registration")
+def on_phone_number(ctx):
+    # احتمالاً شماره تلفن ارسال شده
+    handle_phone_number(ctx.chat_id, ctx.user_id, ctx.text)
+
+
+@router.fallback(lambda text: find_topic_in_text(text) is not None, name="on_topic_text", group="content")
+async def on_topic_text(ctx):
+    await handle_category_selection(ctx.chat_id, ctx.user_id, find_topic_in_text(ctx.text))
+
+
+@router.text("/stats", group="stats")
+@router.callback("show_reg_stats", "refresh_reg_stats", group="stats")
+def on_registration_stats(ctx):
+    # فقط برای ادمین
+    show_registration_stats(ctx.chat_id, ctx.user_id)
+
+
+@router.text("🎯 موضوعات شکرگزاری", group="content")
+@router.callback("start_using", "categories", group="content")
+def on_categories(ctx):
+    chat_id, user_id = ctx.chat_id, ctx.user_id
+    # چک ثبت‌نام
+    if users_collection is not None:
+        if not is_registered_user(user_id):
+            send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
+            return
+    send_message(chat_id, "🎯 یک حوزه از زندگی خود را برای شکرگزاری انتخاب کنید:",
+                 GraphicsHandler.create_categories_keyboard())
+
+
+@router.text("📊 پیشرفت کلی", group="stats")
+@router.callback("overall_progress", group="stats")
+async def on_overall_progress(ctx):
+    progress_text = await run_blocking(create_progress_text, ctx.user_id)
+    await async_send_message(ctx.chat_id, progress_text)
+
+
+@router.text("❓ راهنما", priority=PRIORITY_LOW)
+@router.callback("help", priority=PRIORITY_LOW)
+def on_help(ctx):
+    help_message = GraphicsHandler.create_help_message()
+    send_message(ctx.chat_id, help_message)
+
+
+@router.text("👨‍💻 ارتباط با من", priority=PRIORITY_LOW)
+def on_contact(ctx):
+    contact_message = GraphicsHandler.create_contact_message()
+    send_message(ctx.chat_id, contact_message)
+
+
+@router.text("💝 حمایت", priority=PRIORITY_LOW)
+@router.callback("support_developer", priority=PRIORITY_LOW)
+def on_support_developer(ctx):
+    handle_support_developer(ctx.chat_id, ctx.user_id)
+
+
+@router.callback("support_online", priority=PRIORITY_LOW)
+def on_support_online(ctx):
+    handle_support_online(ctx.chat_id)
+
+
+@router.callback("support_cart", priority=PRIORITY_LOW)
+def on_support_cart(ctx):
+    handle_support_cart(ctx.chat_id)
+
+
+@router.callback("start_registration", group="registration")
+def on_start_registration(ctx):
+    start_registration(ctx.chat_id, ctx.user_id, ctx.username, ctx.first_name, ctx.last_name)
+
+
+@router.callback("why_register", group="registration")
+def on_why_register(ctx):
+    chat_id = ctx.chat_id
+    message = f"""
 ❓ **چرا باید ثبت‌نام کنم؟**
 
 ✨ **مزایای ثبت‌نام:**
@@ -1034,91 +1342,89 @@ def start_polling():
 
 ✨ برای ثبت‌نام روی دکمه زیر کلیک کنید:
 """
-                            keyboard = {
-                                "inline_keyboard": [
-                                    [{"text": "📝 ثبت‌نام در ربات", "callback_data": "start_registration"}],
-                                    [{"text": "🔙 بازگشت", "callback_data": "main_menu"}]
-                                ]
-                            }
-                            send_message(chat_id, message, keyboard)
-
-                        elif data == "main_menu":
-                            handle_start(chat_id, user_id, username, first_name, last_name)
-
-                        elif data in ["start_using", "categories"]:
-                            # چک ثبت‌نام
-                            if users_collection is not None:
-                                user_data = users_collection.find_one({"user_id": str(user_id)})
-                                if not user_data:
-                                    send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
-                                    continue
-                            send_message(chat_id, "🎯 یک حوزه از زندگی خود را برای شکرگزاری انتخاب کنید:",
-                                         GraphicsHandler.create_categories_keyboard())
-
-                        # دکمه‌های موضوعات اصلی
-                        elif data.startswith("topic_"):
-                            try:
-                                topic_id = int(data.split("_")[1])
-                                handle_category_selection(chat_id, user_id, topic_id)
-                            except:
-                                send_message(chat_id, "⚠️ خطا در انتخاب موضوع")
-
-                        # دکمه "امروز شکرگزار بودم" - پشتیبانی از هر دو فرمت
-                        elif data.startswith("complete_day_") or data.startswith("complete_"):
-                            try:
-                                parts = data.split("_")
-
-                                # تشخیص فرمت callback
-                                if data.startswith("complete_day_"):
-                                    topic_id = int(parts[2])
-                                    day_num = int(parts[3])
-                                else:  # complete_
-                                    topic_id = int(parts[1])
-                                    day_num = int(parts[2])
-
-                                print(f"\n🔍 شروع ثبت تمرین...")
-                                print(f"🔍 user_id: {user_id}, topic_id: {topic_id}, day_num: {day_num}")
-
-                                # چک ثبت‌نام
-                                if users_collection is not None:
-                                    user_data = users_collection.find_one({"user_id": str(user_id)})
-                                    if not user_data:
-                                        send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
-                                        continue
-
-                                # ثبت تمرین
-                                print(f"🔍 فراخوانی complete_day_for_user...")
-                                result = complete_day_for_user(user_id, topic_id, day_num)
-                                print(f"🔍 نتیجه ثبت: {result}")
-
-                                if result["success"]:
-                                    # کمی تأخیر برای آپدیت
-                                    time.sleep(0.3)
-
-                                    # آپدیت total_days_completed در MongoDB
-                                    try:
-                                        if users_collection is not None:
-                                            users_collection.update_one(
-                                                {"user_id": str(user_id)},
-                                                {"$inc": {"total_days_completed": 1}}
-                                            )
-                                            print(f"✅ آپدیت total_days_completed در MongoDB")
-                                    except Exception as db_error:
-                                        print(f"⚠️ خطا در آپدیت MongoDB: {db_error}")
-
-                                    # گرفتن اطلاعات آپدیت شده
-                                    user_progress = get_user_topic_progress(user_id, topic_id)
-                                    access_info = daily_reset.get_access_info(user_id, topic_id)
-                                    current_day = user_progress.get("current_day", 1)
-                                    completed_days = user_progress.get("completed_days", [])
-                                    topic_info = get_topic_by_id(topic_id)
-
-                                    print(f"🔍 وضعیت جدید: current_day={current_day}, completed_days={completed_days}")
-
-                                    # نمایش پیام نهایی (فقط پیام دوم)
-                                    if not access_info["has_access"] and (current_day - 1) in completed_days:
-                                        last_done = current_day - 1
-                                        message = f"""
+    keyboard = {
+        "inline_keyboard": [
+            [{"text": "📝 ثبت‌نام در ربات", "callback_data": "start_registration"}],
+            [{"text": "🔙 بازگشت", "callback_data": "main_menu"}]
+        ]
+    }
+    send_message(chat_id, message, keyboard)
+
+
+# دکمه‌های موضوعات اصلی
+@router.prefix("topic_", group="content")
+async def on_topic(ctx):
+    chat_id, user_id = ctx.chat_id, ctx.user_id
+    data = ctx.data
+    try:
+        topic_id = int(data.split("_")[1])
+        await handle_category_selection(chat_id, user_id, topic_id)
+    except:
+        await async_send_message(chat_id, "⚠️ خطا در انتخاب موضوع")
+
+
+# دکمه "امروز شکرگزار بودم" - پشتیبانی از هر دو فرمت (complete_ و complete_day_)
+@router.prefix("complete_", group="content", priority=PRIORITY_HIGH, toast="ثبت شد ✅")
+async def on_complete(ctx):
+    chat_id, user_id = ctx.chat_id, ctx.user_id
+    data = ctx.data
+    try:
+        parts = data.split("_")
+
+        # تشخیص فرمت callback
+        if data.startswith("complete_day_"):
+            topic_id = int(parts[2])
+            day_num = int(parts[3])
+        else:  # complete_
+            topic_id = int(parts[1])
+            day_num = int(parts[2])
+
+        # ضربه تکراری: بدون نوشتن دوباره در دیتابیس و ارسال مجدد تصویر
+        cached = completion_ledger.lookup(ctx.callback_id, user_id, topic_id, day_num)
+        if cached is not None:
+            print(f"🔁 ضربه تکراری نادیده گرفته شد: {user_id} / {topic_id} / {day_num}")
+            return
+
+        print(f"\n🔍 شروع ثبت تمرین...")
+        print(f"🔍 user_id: {user_id}, topic_id: {topic_id}, day_num: {day_num}")
+
+        # چک ثبت‌نام
+        if users_collection is not None:
+            if not await run_blocking(is_registered_user, user_id):
+                await async_send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
+                return
+
+        # ثبت تمرین
+        print(f"🔍 فراخوانی complete_day_for_user...")
+        result = await run_blocking(complete_day_for_user, user_id, topic_id, day_num)
+        print(f"🔍 نتیجه ثبت: {result}")
+        if result["success"] or result.get("already_completed"):
+            completion_ledger.record(ctx.callback_id, user_id, topic_id, day_num, result)
+
+        if result["success"]:
+            # آپدیت total_days_completed در MongoDB
+            try:
+                if users_collection is not None:
+                    await run_blocking(users_collection.update_one,
+                                       {"user_id": str(user_id)},
+                                       {"$inc": {"total_days_completed": 1}})
+                    print(f"✅ آپدیت total_days_completed در MongoDB")
+            except Exception as db_error:
+                print(f"⚠️ خطا در آپدیت MongoDB: {db_error}")
+
+            # گرفتن اطلاعات آپدیت شده
+            user_progress = await run_blocking(get_user_topic_progress, user_id, topic_id)
+            access_info = await run_blocking(daily_reset.get_access_info, user_id, topic_id)
+            current_day = user_progress.get("current_day", 1)
+            completed_days = user_progress.get("completed_days", [])
+            topic_info = get_topic_by_id(topic_id)
+
+            print(f"🔍 وضعیت جدید: current_day={current_day}, completed_days={completed_days}")
+
+            # نمایش پیام نهایی (فقط پیام دوم)
+            if not access_info["has_access"] and (current_day - 1) in completed_days:
+                last_done = current_day - 1
+                message = f"""
 ✅ تمرین امروز تکمیل شد!
 
 {topic_info['emoji']} {topic_info['name']}
@@ -1127,64 +1433,73 @@ def start_polling():
 
 🎯 برای ادامه، موضوع جدیدی را انتخاب کنید.
 """
-                                        keyboard = GraphicsHandler.create_day_options_keyboard(topic_id, completed_days)
-                                        send_message(chat_id, message, keyboard)
-                                    else:
-                                        # بازگشت به صفحه تمرین با دکمه تکمیل شده
-                                        content = load_day_content(topic_id, current_day, user_id)
-                                        if content:
-                                            msg_text = GraphicsHandler.create_beautiful_message(topic_info['name'],
-                                                                                                content['day_number'],
-                                                                                                user_progress)
-                                            inline_keyboard = GraphicsHandler.create_day_inline_keyboard(topic_id,
-                                                                                                         content[
-                                                                                                             'day_number'],
-                                                                                                         True,
-                                                                                                         completed_days)
-
-                                            photo_path = topic_info.get("image")
-                                            if photo_path and os.path.exists(photo_path):
-                                                send_photo(chat_id, photo_path, caption=msg_text,
-                                                           keyboard=inline_keyboard)
-                                            else:
-                                                send_message(chat_id, msg_text, inline_keyboard)
-                                else:
-                                    # فقط در صورت خطا پیام ارسال کن
-                                    error_msg = result.get("message", "⚠️ خطا در ثبت تمرین")
-                                    print(f"❌ خطا در ثبت تمرین: {error_msg}")
-                                    send_message(chat_id, error_msg)
-
-                            except Exception as e:
-                                print(f"❌ خطا در ثبت تمرین: {e}")
-                                print(f"🔍 callback data: {data}")
-                                traceback.print_exc()
-                                send_message(chat_id, "⚠️ خطا در ثبت تمرین. لطفاً بعداً مجدد تلاش کنید.")
-
-                        # دکمه "پیشرفت" برای یک موضوع خاص
-                        elif data.startswith("progress_"):
-                            try:
-                                topic_id = int(data.split("_")[1])
-
-                                # چک ثبت‌نام
-                                if users_collection is not None:
-                                    user_data = users_collection.find_one({"user_id": str(user_id)})
-                                    if not user_data:
-                                        send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
-                                        continue
-
-                                user_progress = get_user_topic_progress(user_id, topic_id)
-                                completed_days = user_progress.get("completed_days", [])
-                                topic_info = get_topic_by_id(topic_id)
-
-                                total_days = 28
-                                completed_count = len(completed_days)
-                                progress_percent = (completed_count / total_days) * 100 if total_days > 0 else 0
-
-                                # ساخت نوار پیشرفت
-                                filled_bars = int(progress_percent / 5)
-                                progress_bar = "█" * filled_bars + "░" * (20 - filled_bars)
-
-                                progress_message = f"""
+                keyboard = GraphicsHandler.create_day_options_keyboard(topic_id, completed_days)
+                # متن تمرین روی همان پیام می‌ماند و فقط دکمه‌اش تکمیل‌شده می‌شود؛ وضعیت پیام جداست
+                day_keyboard = GraphicsHandler.create_day_inline_keyboard(topic_id, day_num, True, completed_days)
+                await async_edit_message(chat_id, ctx.message, None, day_keyboard)
+                await async_send_message(chat_id, message, keyboard)
+            else:
+                # بازگشت به صفحه تمرین با دکمه تکمیل شده
+                content = await run_blocking(load_day_content, topic_id, current_day, user_id)
+                if content:
+                    msg_text = GraphicsHandler.create_beautiful_message(topic_info['name'],
+                                                                        content['day_number'],
+                                                                        user_progress)
+                    inline_keyboard = GraphicsHandler.create_day_inline_keyboard(topic_id,
+                                                                                 content[
+                                                                                     'day_number'],
+                                                                                 True,
+                                                                                 completed_days)
+
+                    # ویرایش همان صفحه به جای ارسال دوباره تصویر
+                    if await async_edit_message(chat_id, ctx.message, msg_text, inline_keyboard):
+                        return
+                    photo_path = topic_info.get("image")
+                    if photo_path and os.path.exists(photo_path):
+                        await async_send_photo(chat_id, photo_path, caption=msg_text,
+                                               keyboard=inline_keyboard)
+                    else:
+                        await async_send_message(chat_id, msg_text, inline_keyboard)
+        else:
+            # فقط در صورت خطا پیام ارسال کن
+            error_msg = result.get("message", "⚠️ خطا در ثبت تمرین")
+            print(f"❌ خطا در ثبت تمرین: {error_msg}")
+            await async_send_message(chat_id, error_msg)
+
+    except Exception as e:
+        print(f"❌ خطا در ثبت تمرین: {e}")
+        print(f"🔍 callback data: {data}")
+        traceback.print_exc()
+        await async_send_message(chat_id, "⚠️ خطا در ثبت تمرین. لطفاً بعداً مجدد تلاش کنید.")
+
+
+# دکمه "پیشرفت" برای یک موضوع خاص
+@router.prefix("progress_", group="stats")
+def on_topic_progress(ctx):
+    chat_id, user_id = ctx.chat_id, ctx.user_id
+    data = ctx.data
+    try:
+        topic_id = int(data.split("_")[1])
+
+        # چک ثبت‌نام
+        if users_collection is not None:
+            if not is_registered_user(user_id):
+                send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
+                return
+
+        user_progress = get_user_topic_progress(user_id, topic_id)
+        completed_days = user_progress.get("completed_days", [])
+        topic_info = get_topic_by_id(topic_id)
+
+        total_days = 28
+        completed_count = len(completed_days)
+        progress_percent = (completed_count / total_days) * 100 if total_days > 0 else 0
+
+        # ساخت نوار پیشرفت
+        filled_bars = int(progress_percent / 5)
+        progress_bar = "█" * filled_bars + "░" * (20 - filled_bars)
+
+        progress_message = f"""
 📊 **پیشرفت در {topic_info['emoji']} {topic_info['name']}**
 
 {progress_bar}
@@ -1194,132 +1509,397 @@ def start_polling():
 
 ✨ **وضعیت فعلی:**
 """
-                                if progress_percent == 100:
-                                    progress_message += "🏆 موضوع به طور کامل تکمیل شد! عالی!"
-                                elif progress_percent >= 75:
-                                    progress_message += "🌟 در حال اتمام! ادامه دهید!"
-                                elif progress_percent >= 50:
-                                    progress_message += "🚀 نیمه راه را طی کرده‌اید!"
-                                elif progress_percent >= 25:
-                                    progress_message += "💪 شروع خوبی داشته‌اید!"
-                                else:
-                                    progress_message += "🌱 تازه شروع کرده‌اید!"
-
-                                keyboard = {
-                                    "inline_keyboard": [
-                                        [{"text": f"🎯 ادامه تمرین {topic_info['name']}",
-                                          "callback_data": f"topic_{topic_id}"}],
-                                        [{"text": "📊 پیشرفت کلی", "callback_data": "overall_progress"}],
-                                        [{"text": "🔙 بازگشت", "callback_data": "main_menu"}]
-                                    ]
-                                }
-
-                                send_message(chat_id, progress_message, keyboard)
-
-                            except Exception as e:
-                                print(f"❌ خطا در نمایش پیشرفت: {e}")
-                                send_message(chat_id, "⚠️ خطا در نمایش پیشرفت")
-
-                        # دکمه "پیشرفت کلی"
-                        elif data == "overall_progress":
-                            progress_text = create_progress_text(user_id)
-                            send_message(chat_id, progress_text)
-
-                        # دکمه "مرور روزهای گذشته"
-                        elif data.startswith("review_"):
-                            try:
-                                topic_id = int(data.split("_")[1])
-
-                                # چک ثبت‌نام
-                                if users_collection is not None:
-                                    user_data = users_collection.find_one({"user_id": str(user_id)})
-                                    if not user_data:
-                                        send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
-                                        continue
-
-                                user_progress = get_user_topic_progress(user_id, topic_id)
-                                completed_days = user_progress.get("completed_days", [])
-                                topic_info = get_topic_by_id(topic_id)
-
-                                if not completed_days:
-                                    send_message(chat_id,
-                                                 f"📝 هنوز روزی در موضوع {topic_info['emoji']} {topic_info['name']} تکمیل نکرده‌اید.")
-                                else:
-                                    keyboard = GraphicsHandler.create_past_days_keyboard(topic_id, completed_days)
-                                    send_message(chat_id,
-                                                 f"📖 روزهای تکمیل شده در {topic_info['emoji']} {topic_info['name']} ({len(completed_days)} روز):",
-                                                 keyboard)
-
-                            except Exception as e:
-                                print(f"❌ خطا در مرور روزها: {e}")
-                                send_message(chat_id, "⚠️ خطا در نمایش روزهای گذشته")
-
-                        # دکمه "نمایش روز گذشته"
-                        elif data.startswith("pastday_"):
-                            try:
-                                parts = data.split("_")
-                                topic_id = int(parts[1])
-                                day_num = int(parts[2])
-
-                                # چک ثبت‌نام
-                                if users_collection is not None:
-                                    user_data = users_collection.find_one({"user_id": str(user_id)})
-                                    if not user_data:
-                                        send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
-                                        continue
-
-                                # بارگذاری محتوای روز گذشته
-                                topic_info = get_topic_by_id(topic_id)
-                                content = load_past_day_content(topic_id, day_num, user_id)
-                                user_progress = get_user_topic_progress(user_id, topic_id)
-                                completed_days = user_progress.get("completed_days", [])
-                                is_completed = day_num in completed_days
-
-                                if content:
-                                    # استفاده از GraphicsHandler برای ساخت پیام
-                                    msg_text = GraphicsHandler.create_beautiful_message(topic_info['name'], day_num,
-                                                                                        user_progress)
-                                    inline_keyboard = GraphicsHandler.create_day_inline_keyboard(topic_id, day_num,
-                                                                                                 is_completed,
-                                                                                                 completed_days)
-
-                                    photo_path = topic_info.get("image")
-                                    if photo_path and os.path.exists(photo_path):
-                                        send_photo(chat_id, photo_path, caption=msg_text, keyboard=inline_keyboard)
-                                    else:
-                                        send_message(chat_id, msg_text, inline_keyboard)
-                                else:
-                                    send_message(chat_id, "⚠️ محتوای این روز در دسترس نیست")
-
-                            except Exception as e:
-                                print(f"❌ خطا در نمایش روز گذشته: {e}")
-                                send_message(chat_id, "⚠️ خطا در نمایش محتوا")
-
-                        # دکمه "بازگشت به موضوع"
-                        elif data.startswith("cat_"):
-                            try:
-                                topic_id = int(data.split("_")[1])
-                                handle_category_selection(chat_id, user_id, topic_id)
-                            except:
-                                send_message(chat_id, "⚠️ خطا در بازگشت به موضوع")
-
-                        elif data == "help":
-                            help_message = GraphicsHandler.create_help_message()
-                            send_message(chat_id, help_message)
-
-                        elif data == "support_developer":
-                            handle_support_developer(chat_id, user_id)
-
-                        elif data == "support_online":
-                            handle_support_online(chat_id)
-
-                        elif data == "support_cart":
-                            handle_support_cart(chat_id)
-
-            time.sleep(0.5)
+        if progress_percent == 100:
+            progress_message += "🏆 موضوع به طور کامل تکمیل شد! عالی!"
+        elif progress_percent >= 75:
+            progress_message += "🌟 در حال اتمام! ادامه دهید!"
+        elif progress_percent >= 50:
+            progress_message += "🚀 نیمه راه را طی کرده‌اید!"
+        elif progress_percent >= 25:
+            progress_message += "💪 شروع خوبی داشته‌اید!"
+        else:
+            progress_message += "🌱 تازه شروع کرده‌اید!"
+
+        keyboard = {
+            "inline_keyboard": [
+                [{"text": f"🎯 ادامه تمرین {topic_info['name']}",
+                  "callback_data": f"topic_{topic_id}"}],
+                [{"text": "📊 پیشرفت کلی", "callback_data": "overall_progress"}],
+                [{"text": "🔙 بازگشت", "callback_data": "main_menu"}]
+            ]
+        }
+
+        send_message(chat_id, progress_message, keyboard)
+
+    except Exception as e:
+        print(f"❌ خطا در نمایش پیشرفت: {e}")
+        send_message(chat_id, "⚠️ خطا در نمایش پیشرفت")
+
+
+# دکمه "مرور روزهای گذشته"
+@router.prefix("review_", group="content")
+def on_review(ctx):
+    chat_id, user_id = ctx.chat_id, ctx.user_id
+    data = ctx.data
+    try:
+        topic_id = int(data.split("_")[1])
+
+        # چک ثبت‌نام
+        if users_collection is not None:
+            if not is_registered_user(user_id):
+                send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
+                return
+
+        user_progress = get_user_topic_progress(user_id, topic_id)
+        completed_days = user_progress.get("completed_days", [])
+        topic_info = get_topic_by_id(topic_id)
+
+        if not completed_days:
+            send_message(chat_id,
+                         f"📝 هنوز روزی در موضوع {topic_info['emoji']} {topic_info['name']} تکمیل نکرده‌اید.")
+        else:
+            keyboard = GraphicsHandler.create_past_days_keyboard(topic_id, completed_days)
+            send_message(chat_id,
+                         f"📖 روزهای تکمیل شده در {topic_info['emoji']} {topic_info['name']} ({len(completed_days)} روز):",
+                         keyboard)
+
+    except Exception as e:
+        print(f"❌ خطا در مرور روزها: {e}")
+        send_message(chat_id, "⚠️ خطا در نمایش روزهای گذشته")
+
+
+# دکمه "نمایش روز گذشته"
+@router.prefix("pastday_", group="content")
+def on_past_day(ctx):
+    chat_id, user_id = ctx.chat_id, ctx.user_id
+    data = ctx.data
+    try:
+        parts = data.split("_")
+        topic_id = int(parts[1])
+        day_num = int(parts[2])
+
+        # چک ثبت‌نام
+        if users_collection is not None:
+            if not is_registered_user(user_id):
+                send_message(chat_id, "⛔ ابتدا ثبت‌نام کنید.")
+                return
+
+        # بارگذاری محتوای روز گذشته
+        topic_info = get_topic_by_id(topic_id)
+        content = load_past_day_content(topic_id, day_num, user_id)
+        user_progress = get_user_topic_progress(user_id, topic_id)
+        completed_days = user_progress.get("completed_days", [])
+        is_completed = day_num in completed_days
+
+        if content:
+            # استفاده از GraphicsHandler برای ساخت پیام
+            msg_text = GraphicsHandler.create_beautiful_message(topic_info['name'], day_num,
+                                                                user_progress)
+            inline_keyboard = GraphicsHandler.create_day_inline_keyboard(topic_id, day_num,
+                                                                         is_completed,
+                                                                         completed_days)
+
+            photo_path = topic_info.get("image")
+            if photo_path and os.path.exists(photo_path):
+                send_photo(chat_id, photo_path, caption=msg_text, keyboard=inline_keyboard)
+            else:
+                send_message(chat_id, msg_text, inline_keyboard)
+        else:
+            send_message(chat_id, "⚠️ محتوای این روز در دسترس نیست")
+
+    except Exception as e:
+        print(f"❌ خطا در نمایش روز گذشته: {e}")
+        send_message(chat_id, "⚠️ خطا در نمایش محتوا")
+
+
+# دکمه "بازگشت به موضوع"
+@router.prefix("cat_", group="content")
+async def on_back_to_topic(ctx):
+    chat_id, user_id = ctx.chat_id, ctx.user_id
+    data = ctx.data
+    try:
+        topic_id = int(data.split("_")[1])
+        await handle_category_selection(chat_id, user_id, topic_id)
+    except:
+        await async_send_message(chat_id, "⚠️ خطا در بازگشت به موضوع")
+
+
+# ========== پردازش آپدیت ==========
+
+
+def get_update_chat_id(update):
+    """استخراج chat_id از آپدیت برای انتخاب ورکر"""
+    if "message" in update:
+        return update["message"]["chat"]["id"]
+    if "callback_query" in update:
+        return update["callback_query"]["message"]["chat"]["id"]
+    return update.get("update_id", 0)
+
+
+flood_controller = FloodController()
+
+
+def admit_update(update):
+    """محدودیت نرخ قبل از ارسال آپدیت به ورکرها؛ اولویت آپدیت یا None"""
+    try:
+        ctx = UpdateContext(update)
+    except (KeyError, TypeError):
+        return None
+    route_class = router.classify(ctx)
+    if route_class is None:
+        # آپدیت بدون مسیر؛ پردازشی لازم نیست
+        if ctx.is_callback:
+            answer_callback(ctx.callback_id, chat_id=ctx.chat_id)
+        return None
+    group, priority = route_class
+    if flood_controller.allow(ctx.user_id, ctx.chat_id, group):
+        return priority
+    if ctx.is_callback:
+        # بستن اسپینر دکمه بدون اجرای هندلر
+        answer_callback(ctx.callback_id, "⏳ لطفاً کمی آهسته‌تر", ctx.chat_id)
+    return None
+
+
+def acknowledge_callback(update):
+    """پاسخ فوری دکمه بلافاصله بعد از ورود به صف (متن خوش‌بینانه مسیر در صورت وجود)"""
+    ctx = UpdateContext(update)
+    if ctx.is_callback:
+        answer_callback(ctx.callback_id, router.toast_for(ctx), ctx.chat_id)
+
+
+def shed_update(update, acknowledged=True):
+    """کنار گذاشتن آپدیت در زمان شلوغی با یک پاسخ کوتاه"""
+    try:
+        ctx = UpdateContext(update)
+        if ctx.is_callback and not acknowledged:
+            answer_callback(ctx.callback_id, "⏳ ربات شلوغ است، چند لحظه دیگر تلاش کنید", ctx.chat_id)
+        else:
+            send_message(ctx.chat_id, "⏳ ربات در حال حاضر شلوغ است، لطفاً چند لحظه دیگر دوباره تلاش کنید.")
+    except Exception as e:
+        print(f"⚠️ خطا در ارسال پیام شلوغی: {e}")
+    finally:
+        if journal is not None:
+            journal.mark_done(update["update_id"])
+
+
+def handle_update(update):
+    """پردازش یک آپدیت (پیام یا callback) از طریق جدول مسیرها"""
+    router.dispatch(UpdateContext(update))
+
+
+
+# ========== حلقه اصلی Polling ==========
+
+dispatcher = None
+fetcher = None
+journal = None
+index_manager = None
+
+
+def collect_metrics():
+    """جمع‌آوری آمار داخلی ربات"""
+    metrics = {"bale_api": bale.stats(), "outbound": outbound.stats(), "photos": photo_registry.stats()}
+    if async_bale is not None:
+        metrics["bale_async"] = async_bale.stats()
+    if dispatcher is not None:
+        metrics["dispatcher"] = dispatcher.stats()
+    if fetcher is not None:
+        metrics["fetcher"] = fetcher.stats()
+    if webhook_receiver is not None:
+        metrics["webhook"] = webhook_receiver.stats()
+    if journal is not None:
+        metrics["journal"] = journal.stats()
+    metrics["completion_ledger"] = completion_ledger.stats()
+    metrics["profile"] = profile_updater.stats()
+    metrics["last_login"] = last_login_writer.stats()
+    metrics["progress_cache"] = progress_renderer.stats()
+    metrics["responses"] = response_buffer.stats()
+    metrics["mongo"] = pool_stats()
+    metrics["query_budget"] = query_budget.stats()
+    if index_manager is not None:
+        metrics["indexes"] = index_manager.stats()
+    metrics["registered_index"] = registered_index.stats()
+    metrics["reply_keyboards"] = reply_keyboards.stats()
+    metrics["routes"] = router.stats()
+    metrics["flood_control"] = flood_controller.stats()
+    return metrics
+
+
+def process_update(update):
+    """پردازش آپدیت و ثبت پایان آن در ژورنال"""
+    try:
+        handle_update(update)
+    finally:
+        if journal is not None:
+            journal.mark_done(update["update_id"])
+
+
+async def process_update_async(update):
+    """نسخه async؛ هندلر coroutine روی حلقه و هندلر همگام در handler_executor اجرا می‌شود"""
+    try:
+        await router.dispatch_async(UpdateContext(update), handler_executor)
+    finally:
+        if journal is not None:
+            journal.mark_done(update["update_id"])
+
+
+# ========== توقف امن ==========
+
+stop_event = Event()
+
+# توابعی که هنگام توقف باید داده‌های بافرشده را ذخیره کنند
+shutdown_hooks = []
+
+
+def request_shutdown(signum=None, frame=None):
+    """درخواست توقف امن (SIGTERM / SIGINT)"""
+    print(f"🛑 سیگنال توقف دریافت شد ({signum})")
+    stop_event.set()
+
+
+def install_signal_handlers():
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+
+
+def journal_batch(batch):
+    """ثبت دسته در ژورنال در ترد دریافت، قبل از getUpdates بعدی که دسته را نزد بله تأیید می‌کند"""
+    journal.record_received(batch, offset=batch[-1]["update_id"])
+
+
+def ingest_batch(batch):
+    """محدودیت نرخ، ثبت در ژورنال و ارسال دسته به ورکرها"""
+    admitted = []
+    for update in batch:
+        priority = admit_update(update)
+        if priority is not None:
+            admitted.append((update, priority))
+        elif fetcher is not None:
+            # دسته قبلاً در ترد دریافت ثبت شده؛ آپدیت ردشده پردازشی ندارد
+            journal.mark_done(update["update_id"])
+    if fetcher is None:
+        journal.record_received([u for u, _ in admitted], offset=batch[-1]["update_id"])
+    for update, priority in admitted:
+        if dispatcher.submit(get_update_chat_id(update), update, priority):
+            acknowledge_callback(update)
+        else:
+            shed_update(update, acknowledged=False)
+
+
+def shutdown_bot(source, timeout=None):
+    """توقف دریافت، تخلیه صف‌ها تا مهلت مشخص و ذخیره وضعیت"""
+    if timeout is None:
+        timeout = float(os.getenv('BOT_SHUTDOWN_TIMEOUT', 25))
+    deadline = time.monotonic() + timeout
+
+    # ۱. توقف دریافت آپدیت جدید
+    if fetcher is not None:
+        fetcher.stop()
+    if webhook_receiver is not None:
+        webhook_receiver.close()
+
+    # ۲. دسته‌های دریافت‌شده ولی ثبت‌نشده هم پردازش می‌شوند
+    while True:
+        batch = source.get_batch(timeout=0)
+        if not batch:
+            break
+        ingest_batch(batch)
+
+    # ۳. تخلیه صف ورکرها
+    drained = dispatcher.drain(max(0, deadline - time.monotonic()))
+    if not drained:
+        print(f"⚠️ مهلت توقف تمام شد؛ آپدیت‌های باقی‌مانده در اجرای بعدی بازپخش می‌شوند: {dispatcher.queue_depths()}")
+
+    # ۴. ذخیره داده‌های بافرشده
+    for hook in shutdown_hooks:
+        try:
+            hook()
+        except Exception as e:
+            print(f"⚠️ خطا در ذخیره‌سازی هنگام توقف: {e}")
+    journal.flush()
+    print("👋 ربات با امنیت متوقف شد")
+
+
+def start_polling():
+    global dispatcher, fetcher, journal, index_manager
+
+    install_signal_handlers()
+
+    # ساخت یا بررسی ایندکس‌ها قبل از پذیرش آپدیت‌ها
+    if users_collection is not None:
+        try:
+            index_manager = IndexManager(users_collection.database)
+            index_manager.check()
+        except Exception as e:
+            print(f"⚠️ خطا در بررسی ایندکس‌ها: {e}")
+        # بارگذاری یک‌باره کاربران قبل از اولین آپدیت
+        registered_index.start(users_collection)
+
+    keep_alive()
+    print("🤖 ربات معجزه شکرگزاری فعال شد...")
+
+    # آپدیت اولیه پروفایل در پس‌زمینه
+    profile_updater.request_update()
+    # آپدیت پروفایل در انتظار و پیام‌های زمان‌بندی‌شده آخرین هندلرها قبل از خروج فرستاده می‌شوند
+    shutdown_hooks.append(profile_updater.flush)
+    shutdown_hooks.append(lambda: outbound.wait_idle(5))
+    shutdown_hooks.append(last_login_writer.flush)
+
+    journal = UpdateJournal()
+    if async_runtime is not None:
+        # صف چت‌ها و هندلرهای coroutine روی حلقه؛ ترد فقط برای کوئری‌ها و هندلرهای همگام گرفته می‌شود
+        dispatcher = AsyncUpdateDispatcher(process_update_async, async_runtime)
+        shutdown_hooks.append(lambda: async_runtime.run(async_bale.close(), timeout=5))
+        print(f"⚙️ حالت async: حداکثر {dispatcher.max_in_flight} هندلر هم‌زمان، {BOT_ASYNC_THREADS} ترد برای کد همگام")
+    elif BOT_PROCESSES > 1:
+        # هر پروسس Mongo و HTTP مخصوص خودش را دارد؛ پایان پردازش به ژورنال این پروسس گزارش می‌شود
+        dispatcher = ProcessDispatcher("polling_bot:handle_update", "polling_bot:shed_update",
+                                       num_processes=BOT_PROCESSES,
+                                       on_done=journal.mark_done, flush_path="polling_bot:flush_worker",
+                                       on_event=handle_worker_event)
+        print(f"⚙️ تعداد پروسس‌ها: {dispatcher.num_workers}")
+    else:
+        dispatcher = UpdateDispatcher(process_update, on_shed=shed_update)
+        print(f"⚙️ تعداد ورکرها: {dispatcher.num_workers}")
+    dispatcher.start()
+
+    # پردازش دوباره آپدیت‌هایی که قبل از توقف تمام نشده بودند
+    pending = journal.pending_updates()
+    if pending:
+        print(f"🔁 بازپخش {len(pending)} آپدیت نیمه‌کاره از ژورنال")
+    for update in pending:
+        dispatcher.submit(get_update_chat_id(update), update, PRIORITY_HIGH)
+
+    if webhook_receiver is not None:
+        # آپدیت‌ها از مسیر /webhook وارد صف می‌شوند
+        source = webhook_receiver
+        if WEBHOOK_URL:
+            result = set_webhook(f"{WEBHOOK_URL.rstrip('/')}/webhook/{WEBHOOK_SECRET}")
+            print(f"🔗 ثبت وب‌هوک: {result}")
+    elif async_runtime is not None:
+        # long polling هم روی حلقه؛ دسته بعدی هم‌زمان با پردازش دسته فعلی
+        fetcher = AsyncUpdateFetcher(async_get_updates, async_runtime, allowed_updates=ALLOWED_UPDATES,
+                                     offset=journal.load_offset(), on_batch=journal_batch)
+        fetcher.start()
+        source = fetcher
+    else:
+        # دریافت دسته بعدی هم‌زمان با پردازش دسته فعلی
+        fetcher = UpdateFetcher(get_updates, ALLOWED_UPDATES, offset=journal.load_offset(),
+                                on_batch=journal_batch)
+        fetcher.start()
+        source = fetcher
+
+    while not stop_event.is_set():
+        try:
+            batch = source.get_batch(timeout=1)
+            if not batch:
+                continue
+            ingest_batch(batch)
         except Exception as e:
             print(f"Error in main loop: {e}")
-            time.sleep(5)
+
+    shutdown_bot(source)
+
 
 
 if __name__ == "__main__":
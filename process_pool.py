@@ -0,0 +1,212 @@
+"""
+process_pool.py - اجرای هندلرها در چند پروسس جدا (تقسیم بر اساس chat_id)
+"""
+
+import importlib
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from work_queue import PRIORITY_NORMAL
+
+# صف نتایج پروسس اصلی و شماره ورکر؛ فقط داخل پروسس‌های ورکر مقدار دارند
+_results = None
+_worker_index = None
+
+
+def in_worker():
+    """آیا کد در یکی از پروسس‌های ورکر اجرا می‌شود"""
+    return _results is not None
+
+
+def notify_parent(event):
+    """ارسال رویداد از ورکر به پروسس اصلی (on_event در ProcessDispatcher)"""
+    _results.put((_worker_index, None, event))
+
+
+def _load_handler(path):
+    """بارگذاری تابع از مسیر «ماژول:تابع»"""
+    module_name, func_name = path.split(":")
+    # با spawn فایل اصلی (python polling_bot.py) یک بار با نام __mp_main__ اجرا شده؛ دوباره import نمی‌شود
+    main = sys.modules.get("__mp_main__")
+    main_file = getattr(main, "__file__", None)
+    if main_file and module_name not in sys.modules \
+            and os.path.splitext(os.path.basename(main_file))[0] == module_name:
+        sys.modules[module_name] = main
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _worker_main(index, inbox, results, handler_path, shed_path, num_threads, flush_path=None):
+    """نقطه شروع هر پروسس ورکر؛ اتصال Mongo و HTTP مخصوص همین پروسس ساخته می‌شود"""
+    global _results, _worker_index
+    from update_dispatcher import UpdateDispatcher
+
+    _results, _worker_index = results, index
+
+    # توقف را پروسس اصلی مدیریت می‌کند (ارسال None پس از تخلیه)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    handler = _load_handler(handler_path)
+    shed_handler = _load_handler(shed_path) if shed_path else None
+
+    # نتیجه هر آپدیت: (ورکر، update_id، علت کنار گذاشتن یا None)
+    def run(update):
+        try:
+            handler(update)
+        finally:
+            results.put((index, update["update_id"], None))
+
+    def shed(update, reason="stale"):
+        try:
+            if shed_handler is not None:
+                shed_handler(update)
+        finally:
+            results.put((index, update["update_id"], reason))
+
+    # ترتیب هر چت داخل پروسس هم با ورکرهای نخی حفظ می‌شود
+    dispatcher = UpdateDispatcher(run, num_workers=num_threads, on_shed=shed)
+    dispatcher.start()
+    print(f"⚙️ پروسس ورکر {index} آماده است (pid={os.getpid()})")
+
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        chat_id, update, priority = item
+        if not dispatcher.submit(chat_id, update, priority):
+            shed(update, "full")
+    dispatcher.drain(float(os.getenv("BOT_SHUTDOWN_TIMEOUT", 25)))
+    # ارسال‌های زمان‌بندی‌شده و نوشتن‌های بافرشده همین پروسس قبل از خروج
+    if flush_path:
+        try:
+            _load_handler(flush_path)()
+        except Exception as e:
+            print(f"⚠️ خطا در تخلیه پروسس ورکر {index}: {e}")
+
+
+class ProcessDispatcher:
+    """هم‌شکل با UpdateDispatcher؛ هر چت همیشه به یک پروسس ثابت می‌رود"""
+
+    def __init__(self, handler_path, shed_path=None, num_processes=None, threads_per_process=None,
+                 max_inbox_size=1000, on_done=None, flush_path=None, on_event=None):
+        if num_processes is None:
+            num_processes = int(os.getenv("BOT_PROCESSES", 2))
+        if threads_per_process is None:
+            threads_per_process = int(os.getenv("BOT_WORKERS", 8))
+        self.handler_path = handler_path
+        self.shed_path = shed_path
+        self.num_workers = max(1, num_processes)
+        self.threads_per_process = threads_per_process
+        self.on_done = on_done
+        self.flush_path = flush_path
+        self.on_event = on_event
+        self.context = multiprocessing.get_context("spawn")
+        self.inboxes = [self.context.Queue(max_inbox_size) for _ in range(self.num_workers)]
+        self.results = self.context.Queue()
+        self.processes = []
+        self.lock = threading.Lock()
+        self.submitted = [0] * self.num_workers
+        self.processed = [0] * self.num_workers
+        # زمان ارسال آپدیت‌های تمام‌نشده هر پروسس به ترتیب ارسال (برای oldest_age)
+        self.pending = [OrderedDict() for _ in range(self.num_workers)]
+        self.shed = {"full": 0, "stale": 0}
+        self.last_sample = (time.monotonic(), [0] * self.num_workers)
+
+    def start(self):
+        """راه‌اندازی پروسس‌ها و ترد جمع‌آوری نتایج"""
+        for index in range(self.num_workers):
+            p = self.context.Process(
+                target=_worker_main,
+                args=(index, self.inboxes[index], self.results, self.handler_path, self.shed_path,
+                      self.threads_per_process, self.flush_path),
+                name=f"update-process-{index}"
+            )
+            p.daemon = True
+            p.start()
+            self.processes.append(p)
+        t = threading.Thread(target=self._collect_results, name="process-results")
+        t.daemon = True
+        t.start()
+
+    def worker_for(self, chat_id):
+        return zlib.crc32(str(chat_id).encode()) % self.num_workers
+
+    def submit(self, chat_id, update, priority=PRIORITY_NORMAL):
+        """ارسال آپدیت به پروسس مربوط به چت؛ اگر صف پر باشد False"""
+        index = self.worker_for(chat_id)
+        with self.lock:
+            self.submitted[index] += 1
+            self.pending[index][update["update_id"]] = time.monotonic()
+        try:
+            self.inboxes[index].put_nowait((chat_id, update, priority))
+        except queue.Full:
+            with self.lock:
+                self.submitted[index] -= 1
+                self.pending[index].pop(update["update_id"], None)
+                self.shed["full"] += 1
+            return False
+        return True
+
+    def _collect_results(self):
+        while True:
+            index, update_id, event = self.results.get()
+            if update_id is None:
+                # رویداد دلخواه ورکر (notify_parent)
+                if self.on_event is not None:
+                    try:
+                        self.on_event(event)
+                    except Exception as e:
+                        print(f"⚠️ خطا در رویداد ورکر {index}: {e}")
+                continue
+            with self.lock:
+                self.processed[index] += 1
+                self.pending[index].pop(update_id, None)
+                if event is not None:
+                    self.shed[event] += 1
+            if self.on_done is not None:
+                self.on_done(update_id)
+
+    def queue_depths(self):
+        """آپدیت‌های ارسال‌شده و هنوز تمام‌نشده در هر پروسس"""
+        with self.lock:
+            return [s - p for s, p in zip(self.submitted, self.processed)]
+
+    def drain(self, timeout):
+        """توقف پروسس‌ها پس از پایان کارهای در جریان"""
+        deadline = time.monotonic() + timeout
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for p in self.processes:
+            p.join(max(0, deadline - time.monotonic()))
+        # صبر برای رسیدن آخرین نتایج به ترد جمع‌آوری
+        while sum(self.queue_depths()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return sum(self.queue_depths()) == 0
+
+    def stats(self):
+        """گذردهی هر پروسس (آپدیت در ثانیه از آخرین گزارش) و آمار شلوغی مثل UpdateDispatcher"""
+        now = time.monotonic()
+        with self.lock:
+            processed = list(self.processed)
+            last_time, last_processed = self.last_sample
+            self.last_sample = (now, processed)
+            oldest = [next(iter(p.values())) for p in self.pending if p]
+            shed = dict(self.shed)
+        elapsed = max(now - last_time, 1e-6)
+        return {
+            "processes": self.num_workers,
+            "alive": [p.is_alive() for p in self.processes],
+            "queue_depths": self.queue_depths(),
+            "oldest_age": round(now - min(oldest), 3) if oldest else 0.0,
+            "shed_full": shed["full"],
+            "shed_stale": shed["stale"],
+            "processed": processed,
+            "throughput_per_sec": [round((c - l) / elapsed, 2) for c, l in zip(processed, last_processed)]
+        }
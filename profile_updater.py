@@ -0,0 +1,97 @@
+"""
+profile_updater.py - به‌روزرسانی پروفایل ربات در پس‌زمینه با تجمیع درخواست‌ها
+"""
+
+import os
+import threading
+import time
+
+
+class ProfileUpdater:
+    """شمارنده کاربران در حافظه؛ حداکثر یک به‌روزرسانی پروفایل در هر بازه"""
+
+    def __init__(self, count_loader, apply, interval=None, resync_interval=3600):
+        if interval is None:
+            interval = float(os.getenv("PROFILE_UPDATE_INTERVAL", 300))
+        self.count_loader = count_loader
+        self.apply = apply
+        self.interval = interval
+        self.resync_interval = resync_interval
+
+        self.lock = threading.Lock()
+        self.count = None
+        self.loaded_at = 0.0
+        self.dirty = False
+        self.applied_count = None
+        self.requests = 0
+        self.updates = 0
+        self.started = False
+
+    def start(self):
+        """راه‌اندازی ترد پس‌زمینه (یک بار)"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        t = threading.Thread(target=self._run, name="profile-updater")
+        t.daemon = True
+        t.start()
+
+    def record_registration(self):
+        """یک ثبت‌نام جدید؛ فقط شمارنده زیاد می‌شود و به‌روزرسانی در نوبت قرار می‌گیرد"""
+        with self.lock:
+            if self.count is not None:
+                self.count += 1
+        self.request_update()
+
+    def request_update(self):
+        """درخواست به‌روزرسانی؛ درخواست‌های یک بازه با هم یکی می‌شوند"""
+        with self.lock:
+            self.dirty = True
+            self.requests += 1
+        if not self.started:
+            self.start()
+
+    def _current_count(self):
+        # شمارش کامل فقط بار اول و هر resync_interval یک بار (برای ثبت‌نام‌های پروسس‌های دیگر)
+        with self.lock:
+            count = self.count
+            stale = time.monotonic() - self.loaded_at > self.resync_interval
+        if count is None or stale:
+            count = self.count_loader()
+            with self.lock:
+                self.count = count
+                self.loaded_at = time.monotonic()
+        return count
+
+    def flush(self):
+        """اعمال درخواست در انتظار (در توقف ربات هم صدا زده می‌شود)"""
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+        count = self._current_count()
+        if count == self.applied_count:
+            return
+        self.apply(count)
+        self.applied_count = count
+        self.updates += 1
+
+    def _run(self):
+        # اولین درخواست بلافاصله، بعدی‌ها حداکثر یک بار در هر بازه
+        while True:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ خطا در به‌روزرسانی پروفایل: {e}")
+            time.sleep(self.interval)
+
+    def stats(self):
+        """آمار تجمیع درخواست‌ها"""
+        with self.lock:
+            return {
+                "users": self.count,
+                "pending": self.dirty,
+                "requests": self.requests,
+                "updates": self.updates
+            }
@@ -0,0 +1,105 @@
+"""
+progress_report.py - ساخت متن پیشرفت کلی با جدول‌های آماده نوار و سطح و کش متن نهایی
+"""
+
+from functools import lru_cache
+
+DAYS_PER_TOPIC = 28
+BAR_LENGTH = 20
+
+# (حداقل درصد، ایموجی، وضعیت) از بالاترین سطح
+TOPIC_TIERS = [
+    (100, "🏆", "کامل شده!"),
+    (75, "✨", "عالی!"),
+    (50, "🚀", "خوب!"),
+    (25, "💪", "ادامه دهید!"),
+    (0, "🌱", "شروع شده"),
+]
+
+OVERALL_TIERS = [
+    (100, "👑", "شما استاد شکرگزاری هستید!", "🎉 به همه معجزه‌های زندگی‌تان دست یافته‌اید!"),
+    (75, "🌟", "در آستانه استادی!", "✨ چند گام دیگر تا تحول کامل باقی مانده!"),
+    (50, "⚡", "در میانه راه!", "🚀 نیمه راه را طی کرده‌اید، ادامه دهید!"),
+    (25, "🔥", "شروع قدرتمند!", "💪 عادت در حال شکل‌گیری است!"),
+    (0, "🌷", "تازه شروع کرده‌اید!", "🌱 مهم‌ترین قدم را برداشته‌اید!"),
+]
+
+
+def _tier(tiers, percent):
+    for tier in tiers:
+        if percent >= tier[0]:
+            return tier[1:]
+    return tiers[-1][1:]
+
+
+def _bar(percent, filled_char):
+    filled = int(percent / 5)
+    return filled_char * filled + "░" * (BAR_LENGTH - filled)
+
+
+class ProgressRenderer:
+    """متن پیشرفت فقط به تعداد روزهای تکمیل‌شده هر موضوع بستگی دارد؛ همان کلید کش است"""
+
+    def __init__(self, topics, cache_size=4096):
+        self.topics = topics
+        self.total_days = DAYS_PER_TOPIC * len(topics)
+        # سطر هر موضوع به ازای 0 تا 28 روز تکمیل‌شده
+        self.topic_rows = []
+        for completed in range(DAYS_PER_TOPIC + 1):
+            percent = completed / DAYS_PER_TOPIC * 100
+            emoji, status = _tier(TOPIC_TIERS, percent)
+            self.topic_rows.append((emoji, _bar(percent, "█"), f"{percent:.1f}% • {completed}/۲۸ روز • {status}"))
+        self.overall_rows = []
+        for completed in range(self.total_days + 1):
+            percent = completed / self.total_days * 100 if self.total_days > 0 else 0
+            emoji, status, motivation = _tier(OVERALL_TIERS, percent)
+            self.overall_rows.append((emoji, _bar(percent, "▓"), f"{percent:.1f}%", status, motivation))
+        self.render = lru_cache(maxsize=cache_size)(self._render)
+
+    def completed_counts(self, topics_progress):
+        """تعداد روزهای تکمیل‌شده هر موضوع به ترتیب topics از زیرسند topics کاربر"""
+        counts = []
+        for topic in self.topics:
+            progress = topics_progress.get(str(topic["id"])) or {}
+            counts.append(min(len(progress.get("completed_days", [])), DAYS_PER_TOPIC))
+        return tuple(counts)
+
+    def _render(self, counts):
+        progress_details = ""
+        for topic, completed in zip(self.topics, counts):
+            emoji, bar, summary = self.topic_rows[completed]
+            progress_details += f"""
+{emoji} {topic['emoji']} {topic['name']}
+{bar}
+{summary}
+─────────────────
+"""
+
+        completed_days = sum(counts)
+        overall_emoji, overall_bar, overall_percent, overall_status, motivation = self.overall_rows[completed_days]
+        return f"""
+📈 نقشه سفر شکرگزاری شما
+
+══════════════════════════════
+
+{progress_details}
+══════════════════════════════
+
+{overall_emoji} پیشرفت کلی:
+{overall_bar}
+{overall_percent} • {completed_days} از {self.total_days} روز
+
+✨ {overall_status}
+💫 {motivation}
+
+══════════════════════════════
+
+🎯 نکته طلایی:
+"هر درصد، قدمی به سوی تحول است.
+شما در مسیر درست قرار دارید!"
+"""
+
+    def stats(self):
+        """آمار کش متن پیشرفت"""
+        info = self.render.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "cached": info.currsize}
@@ -0,0 +1,169 @@
+"""
+registered_index.py - فهرست حافظه‌ای کاربران ثبت‌نام‌شده و ادمین‌ها برای پاسخ بدون کوئری
+"""
+
+import os
+import sys
+import threading
+import time
+
+from pymongo.errors import PyMongoError
+
+PROJECTION = {"_id": 0, "user_id": 1, "phone_number": 1, "registration_date": 1}
+
+
+class RegisteredUserIndex:
+    """بارگذاری یک‌باره، افزودن فوری در ثبت‌نام و تازه‌سازی با change stream یا polling"""
+
+    def __init__(self, admin_phone, poll_interval=None, full_reload_interval=3600):
+        if poll_interval is None:
+            poll_interval = float(os.getenv("REGISTERED_INDEX_POLL_INTERVAL", 30))
+        self.admin_phone = admin_phone
+        self.poll_interval = poll_interval
+        self.full_reload_interval = full_reload_interval
+        self.collection = None
+        self.lock = threading.Lock()
+        self.user_ids = set()
+        self.admin_ids = set()
+        self.last_seen = None
+        self.loaded = False
+        self.loaded_at = 0.0
+        self.mode = "none"
+        # شناسه‌هایی که حین بارگذاری کامل اضافه می‌شوند تا با جایگزینی مجموعه گم نشوند
+        self.added_during_reload = None
+        self.started = False
+        self.hits = 0
+        self.negatives = 0
+
+    def start(self, collection):
+        """بارگذاری کامل و شروع ترد تازه‌سازی (یک بار در هر پروسس)"""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+            self.collection = collection
+        try:
+            self.reload()
+        except PyMongoError as e:
+            print(f"⚠️ بارگذاری فهرست کاربران ناموفق بود: {e}")
+        t = threading.Thread(target=self._run, name="registered-index")
+        t.daemon = True
+        t.start()
+
+    def reload(self):
+        """بارگذاری کامل از دیتابیس"""
+        user_ids, admin_ids, last_seen = set(), set(), None
+        with self.lock:
+            self.added_during_reload = []
+        for doc in self.collection.find({}, PROJECTION):
+            self._collect(doc, user_ids, admin_ids)
+            date = doc.get("registration_date")
+            if date is not None and (last_seen is None or date > last_seen):
+                last_seen = date
+        with self.lock:
+            for doc in self.added_during_reload:
+                self._collect(doc, user_ids, admin_ids)
+            self.added_during_reload = None
+            self.user_ids = user_ids
+            self.admin_ids = admin_ids
+            self.last_seen = max(filter(None, (last_seen, self.last_seen)), default=None)
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+        print(f"👥 فهرست کاربران بارگذاری شد: {len(user_ids)} کاربر")
+
+    def _collect(self, doc, user_ids, admin_ids):
+        user_id = str(doc.get("user_id"))
+        user_ids.add(user_id)
+        if self.admin_phone and doc.get("phone_number") == self.admin_phone:
+            admin_ids.add(user_id)
+
+    def add(self, user_id, phone_number=None, registration_date=None):
+        """افزودن کاربر تازه ثبت‌نام‌شده (در همین پروسس یا از تغییرات دیتابیس)"""
+        if user_id is None:
+            return
+        doc = {"user_id": user_id, "phone_number": phone_number}
+        with self.lock:
+            self._collect(doc, self.user_ids, self.admin_ids)
+            if self.added_during_reload is not None:
+                self.added_during_reload.append(doc)
+            if registration_date is not None and (self.last_seen is None or registration_date > self.last_seen):
+                self.last_seen = registration_date
+
+    def contains(self, user_id):
+        """True / False از حافظه؛ None اگر فهرست هنوز آماده نیست"""
+        if not self.loaded:
+            return None
+        with self.lock:
+            found = str(user_id) in self.user_ids
+            if found:
+                self.hits += 1
+            else:
+                self.negatives += 1
+            return found
+
+    def is_admin(self, user_id):
+        """ادمین بودن از حافظه؛ None اگر فهرست هنوز آماده نیست"""
+        if not self.loaded:
+            return None
+        with self.lock:
+            return str(user_id) in self.admin_ids
+
+    def _watch(self):
+        # change stream فقط روی replica set / Atlas در دسترس است
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        with self.collection.watch(pipeline) as stream:
+            self.mode = "change_stream"
+            # ثبت‌نام‌های بین بارگذاری و شروع stream
+            self._poll()
+            for change in stream:
+                doc = change.get("fullDocument") or {}
+                self.add(doc.get("user_id"), doc.get("phone_number"), doc.get("registration_date"))
+
+    def _poll(self):
+        query = {"registration_date": {"$gt": self.last_seen}} if self.last_seen is not None else {}
+        for doc in self.collection.find(query, PROJECTION):
+            self.add(doc.get("user_id"), doc.get("phone_number"), doc.get("registration_date"))
+
+    def _run(self):
+        while True:
+            if not self.loaded:
+                try:
+                    self.reload()
+                except PyMongoError as e:
+                    print(f"⚠️ بارگذاری فهرست کاربران ناموفق بود: {e}")
+                    time.sleep(self.poll_interval)
+                    continue
+            if self.mode != "polling":
+                try:
+                    self._watch()
+                except PyMongoError as e:
+                    if self.mode != "change_stream":
+                        print(f"ℹ️ change stream در دسترس نیست؛ تازه‌سازی با polling: {e}")
+                        self.mode = "polling"
+            time.sleep(self.poll_interval)
+            try:
+                if time.monotonic() - self.loaded_at > self.full_reload_interval:
+                    self.reload()
+                elif self.mode == "polling":
+                    self._poll()
+            except PyMongoError as e:
+                print(f"⚠️ خطا در تازه‌سازی فهرست کاربران: {e}")
+
+    def memory_bytes(self):
+        """تخمین حافظه مصرفی مجموعه‌ها و رشته‌های شناسه"""
+        with self.lock:
+            total = sys.getsizeof(self.user_ids) + sys.getsizeof(self.admin_ids)
+            total += sum(sys.getsizeof(user_id) for user_id in self.user_ids)
+        return total
+
+    def stats(self):
+        """آمار فهرست کاربران"""
+        return {
+            "loaded": self.loaded,
+            "mode": self.mode,
+            "users": len(self.user_ids),
+            "admins": len(self.admin_ids),
+            "hits": self.hits,
+            "negatives": self.negatives,
+            "memory_bytes": self.memory_bytes()
+        }
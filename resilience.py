@@ -0,0 +1,148 @@
+"""
+resilience.py - تلاش دوباره با تأخیر نمایی و قطع‌کننده مدار برای فراخوانی‌های API بله
+"""
+
+import os
+import random
+import threading
+import time
+
+# متدهایی که تکرارشان اثر اضافه ندارد و می‌توان دوباره فرستاد
+IDEMPOTENT_METHODS = frozenset({
+    "getUpdates",
+    "answerCallbackQuery",
+    "editMessageText",
+    "editMessageCaption",
+    "editMessageReplyMarkup",
+    "setMyName",
+    "setMyDescription",
+    "setWebhook",
+    "deleteWebhook"
+})
+
+
+class CircuitOpenError(Exception):
+    """مدار متد باز است؛ درخواست بدون تماس با بله رد شد"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"مدار {name} باز است ({retry_in:.1f} ثانیه تا تلاش بعدی)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def is_server_error(result):
+    """پاسخ خطای سمت سرور (5xx) که ارزش تلاش دوباره دارد"""
+    return isinstance(result, dict) and not result.get("ok", True) and (result.get("error_code") or 0) >= 500
+
+
+class RetryPolicy:
+    """تعداد تلاش و تأخیر نمایی با jitter کامل"""
+
+    def __init__(self, max_attempts=None, base_delay=0.5, max_delay=5.0):
+        if max_attempts is None:
+            max_attempts = int(os.getenv("BALE_RETRY_ATTEMPTS", 3))
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def attempts_for(self, method, files=None):
+        # آپلود فایل و ارسال پیام تکرارپذیر نیستند
+        if files or method not in IDEMPOTENT_METHODS:
+            return 1
+        return self.max_attempts
+
+    def delay(self, attempt):
+        """تأخیر قبل از تلاش بعدی (attempt از صفر)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """بسته → (خطاهای پیاپی) → باز → (بعد از مهلت) نیمه‌باز → یک تلاش آزمایشی"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.rejected = 0
+        self.opened = 0
+
+    def before_call(self):
+        """اجازه فراخوانی؛ اگر مدار باز باشد CircuitOpenError"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.trial_in_flight:
+                # فقط یک درخواست آزمایشی در حالت نیمه‌باز
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self.trial_in_flight = True
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                    print(f"🔌 مدار {self.name} باز شد ({self.failures} خطای پیاپی)")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "opened": self.opened,
+                "rejected": self.rejected
+            }
+
+
+class BreakerRegistry:
+    """یک قطع‌کننده جدا برای هر متد API"""
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        if failure_threshold is None:
+            failure_threshold = int(os.getenv("BALE_BREAKER_THRESHOLD", 5))
+        if reset_timeout is None:
+            reset_timeout = float(os.getenv("BALE_BREAKER_RESET", 30))
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.breakers = {}
+
+    def get(self, name):
+        with self.lock:
+            breaker = self.breakers.get(name)
+            if breaker is None:
+                breaker = self.breakers[name] = CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def stats(self):
+        """وضعیت مدار هر متد"""
+        with self.lock:
+            breakers = list(self.breakers.values())
+        return {b.name: b.stats() for b in breakers}
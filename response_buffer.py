@@ -0,0 +1,115 @@
+"""
+response_buffer.py - تجمیع پیام‌های متنی پشت سر هم یک هندلر در یک درخواست
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# حداکثر طول متن یک پیام در بله
+MAX_TEXT_LENGTH = 4096
+
+
+class ResponseBuffer:
+    """پیام‌های متنی هر آپدیت تا پایان هندلر نگه داشته و در صورت امکان ادغام می‌شوند"""
+
+    def __init__(self, sender):
+        self.sender = sender
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.buffered = 0
+        self.sent = 0
+
+    def active(self):
+        return getattr(self.local, "pending", None) is not None
+
+    @contextmanager
+    def collect(self):
+        """فعال کردن بافر برای هندلر جاری (در تو در تو فقط بیرونی‌ترین ارسال می‌کند)"""
+        if self.active():
+            yield
+            return
+        self.local.pending = []
+        try:
+            yield
+        finally:
+            try:
+                self.flush()
+            finally:
+                self.local.pending = None
+
+    def add(self, data):
+        """افزودن پیام متنی؛ اگر ممکن باشد با پیام قبلی همان چت یکی می‌شود"""
+        pending = self.local.pending
+        with self.lock:
+            self.buffered += 1
+        if pending:
+            last = pending[-1]
+            merged_text = f"{last['text']}\n{data['text']}"
+            if (last["chat_id"] == data["chat_id"] and not last.get("reply_markup")
+                    and last.get("parse_mode") == data.get("parse_mode")
+                    and len(merged_text) <= MAX_TEXT_LENGTH):
+                # کیبورد پیام دوم به پیام ادغام‌شده می‌رسد
+                pending[-1] = dict(data, text=merged_text)
+                return
+        pending.append(data)
+
+    def flush(self):
+        """ارسال پیام‌های بافرشده؛ قبل از هر ارسال دیگری هم صدا زده می‌شود تا ترتیب حفظ شود"""
+        pending = getattr(self.local, "pending", None)
+        if not pending:
+            return
+        # خالی کردن قبل از ارسال، چون sender خودش دوباره flush را صدا می‌زند
+        self.local.pending = []
+        for data in pending:
+            with self.lock:
+                self.sent += 1
+            try:
+                self.sender(data)
+            except Exception as e:
+                print(f"❌ خطا در ارسال پیام بافرشده: {e}")
+
+    def stats(self):
+        """تعداد پیام‌های دریافتی و درخواست‌های واقعی ارسال"""
+        with self.lock:
+            return {"buffered": self.buffered, "sent": self.sent, "saved": self.buffered - self.sent}
+
+
+class ReplyKeyboardTracker:
+    """آخرین کیبورد پایین صفحه هر چت؛ کیبورد تکراری دوباره فرستاده نمی‌شود"""
+
+    def __init__(self, max_chats=100000):
+        self.max_chats = max_chats
+        self.lock = threading.Lock()
+        self.keyboards = OrderedDict()
+        self.skipped = 0
+
+    @staticmethod
+    def _signature(keyboard):
+        return json.dumps(keyboard, sort_keys=True, ensure_ascii=False)
+
+    def observe(self, chat_id, keyboard):
+        """ثبت کیبوردی که همراه پیام فرستاده شد"""
+        if not keyboard:
+            return
+        with self.lock:
+            if keyboard.get("remove_keyboard"):
+                self.keyboards.pop(chat_id, None)
+            elif "keyboard" in keyboard:
+                self.keyboards[chat_id] = self._signature(keyboard)
+                self.keyboards.move_to_end(chat_id)
+                if len(self.keyboards) > self.max_chats:
+                    self.keyboards.popitem(last=False)
+
+    def is_current(self, chat_id, keyboard):
+        """آیا همین کیبورد الان پایین صفحه چت است"""
+        with self.lock:
+            current = self.keyboards.get(chat_id) == self._signature(keyboard)
+            if current:
+                self.skipped += 1
+            return current
+
+    def stats(self):
+        with self.lock:
+            return {"chats": len(self.keyboards), "skipped": self.skipped}
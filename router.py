@@ -0,0 +1,199 @@
+"""
+router.py - مسیریابی پیام‌ها و callbackها با جدول و زمان‌سنجی هر مسیر
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import nullcontext
+
+
+class UpdateContext:
+    """اطلاعات پایه یک آپدیت که به هندلرها داده می‌شود"""
+
+    def __init__(self, update):
+        self.update = update
+        self.callback = update.get("callback_query")
+        self.is_callback = self.callback is not None
+        if self.is_callback:
+            self.message = self.callback["message"]
+            sender = self.callback["from"]
+            self.callback_id = self.callback["id"]
+            self.data = self.callback.get("data", "")
+            self.text = ""
+        else:
+            self.message = update["message"]
+            sender = self.message["from"]
+            self.callback_id = None
+            self.data = ""
+            self.text = self.message.get("text", "")
+
+        self.chat_id = self.message["chat"]["id"]
+        self.user_id = str(sender["id"])
+        self.username = sender.get("username", "")
+        self.first_name = sender.get("first_name", "")
+        self.last_name = sender.get("last_name", "")
+        self.route = None
+
+
+def run_inline(coro):
+    """اجرای coroutine بدون حلقه؛ فقط وقتی که هیچ await آن واقعاً معلق نشود (helperهای دوحالته در حالت همگام)"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("هندلر coroutine در حالت همگام منتظر حلقه asyncio ماند")
+
+
+class Router:
+    """جدول مسیرها: تطابق دقیق متن/داده و پیشوند callback_data"""
+
+    def __init__(self, scope=None, async_scope=None):
+        # scope(ctx): context manager که دور هر هندلر در اجرای همگام است (مثل بافر پاسخ)
+        # async_scope(ctx): دور هندلر coroutine روی حلقه؛ فقط چیزهایی که به ترد وابسته نیستند
+        self.scope = scope
+        self.async_scope = async_scope
+        self.texts = {}
+        self.callbacks = {}
+        self.prefixes = {}
+        self.fallbacks = []
+        self.groups = {}
+        self.priorities = {}
+        self.toasts = {}
+        self.stats_lock = threading.Lock()
+        self.route_stats = {}
+
+    @staticmethod
+    def _prefix_key(data):
+        # پیشوند تا اولین «_»؛ مثلاً complete_12_3 → complete_
+        head, sep, _ = data.partition("_")
+        return head + sep
+
+    def _register(self, table, keys, name, group, priority, toast=None):
+        def decorator(func):
+            route_name = name or func.__name__
+            self.groups[route_name] = group
+            self.priorities[route_name] = priority
+            if toast:
+                self.toasts[route_name] = toast
+            for key in keys:
+                table[key] = (route_name, func)
+            return func
+        return decorator
+
+    def text(self, *labels, name=None, group="default", priority=1):
+        """ثبت هندلر برای متن دقیق پیام (دستور یا دکمه کیبورد)"""
+        return self._register(self.texts, labels, name, group, priority)
+
+    def callback(self, *values, name=None, group="default", priority=1, toast=None):
+        """ثبت هندلر برای مقدار دقیق callback_data؛ toast متن فوری پاسخ دکمه است"""
+        return self._register(self.callbacks, values, name, group, priority, toast)
+
+    def prefix(self, *prefixes, name=None, group="default", priority=1, toast=None):
+        """ثبت هندلر برای پیشوند callback_data (مثل topic_)"""
+        for p in prefixes:
+            if not p.endswith("_") or "_" in p[:-1]:
+                raise ValueError(f"پیشوند نامعتبر: {p}")
+        return self._register(self.prefixes, prefixes, name, group, priority, toast)
+
+    def fallback(self, predicate, name=None, group="default", priority=1):
+        """ثبت هندلر برای متن‌هایی که تطابق دقیق ندارند (به ترتیب ثبت)"""
+        def decorator(func):
+            route_name = name or func.__name__
+            self.groups[route_name] = group
+            self.priorities[route_name] = priority
+            self.fallbacks.append((route_name, predicate, func))
+            return func
+        return decorator
+
+    def classify(self, ctx):
+        """(دسته، اولویت) مسیر آپدیت یا None اگر مسیری نباشد؛ اولویت کمتر = مهم‌تر"""
+        route = self.resolve(ctx)
+        if route is None:
+            return None
+        name = route[0]
+        return self.groups.get(name, "default"), self.priorities.get(name, 1)
+
+    def toast_for(self, ctx):
+        """متن پاسخ فوری دکمه برای مسیر callback یا None"""
+        route = self.resolve(ctx)
+        if route is None:
+            return None
+        return self.toasts.get(route[0])
+
+    def resolve(self, ctx):
+        """پیدا کردن (نام مسیر، هندلر) برای آپدیت"""
+        if ctx.is_callback:
+            route = self.callbacks.get(ctx.data)
+            if route is None:
+                route = self.prefixes.get(self._prefix_key(ctx.data))
+            return route
+
+        route = self.texts.get(ctx.text)
+        if route is not None:
+            return route
+        for name, predicate, func in self.fallbacks:
+            if predicate(ctx.text):
+                return name, func
+        return None
+
+    def dispatch(self, ctx):
+        """اجرای هندلر مسیر و ثبت تعداد و زمان اجرا"""
+        route = self.resolve(ctx)
+        if route is None:
+            return False
+
+        name, func = route
+        ctx.route = name
+        started = time.perf_counter()
+        try:
+            with self.scope(ctx) if self.scope else nullcontext():
+                result = func(ctx)
+                if asyncio.iscoroutine(result):
+                    # در حالت همگام helperهای async کار را همین‌جا انجام می‌دهند و حلقه لازم نیست
+                    run_inline(result)
+        finally:
+            self._record(name, time.perf_counter() - started)
+        return True
+
+    async def dispatch_async(self, ctx, executor=None):
+        """نسخه async؛ هندلر coroutine مستقیم await می‌شود و هندلر همگام در executor اجرا می‌شود"""
+        route = self.resolve(ctx)
+        if route is None:
+            return False
+
+        name, func = route
+        if not asyncio.iscoroutinefunction(func):
+            return await asyncio.get_running_loop().run_in_executor(executor, self.dispatch, ctx)
+        ctx.route = name
+        started = time.perf_counter()
+        try:
+            with self.async_scope(ctx) if self.async_scope else nullcontext():
+                await func(ctx)
+        finally:
+            self._record(name, time.perf_counter() - started)
+        return True
+
+    def _record(self, name, elapsed):
+        with self.stats_lock:
+            stat = self.route_stats.get(name)
+            if stat is None:
+                stat = self.route_stats[name] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0}
+            elapsed_ms = elapsed * 1000
+            stat["calls"] += 1
+            stat["total_ms"] += elapsed_ms
+            stat["max_ms"] = max(stat["max_ms"], elapsed_ms)
+
+    def stats(self):
+        """آمار مسیرها به ترتیب مجموع زمان"""
+        with self.stats_lock:
+            result = {}
+            for name, stat in self.route_stats.items():
+                result[name] = {
+                    "calls": stat["calls"],
+                    "avg_ms": round(stat["total_ms"] / stat["calls"], 2),
+                    "max_ms": round(stat["max_ms"], 2),
+                    "total_ms": round(stat["total_ms"], 2)
+                }
+        return dict(sorted(result.items(), key=lambda item: -item[1]["total_ms"]))
@@ -0,0 +1,110 @@
+"""
+test_async_mode.py - تست حالت BOT_MODE=async در خود ربات با کلاینت بله ساختگی (بدون aiohttp و Mongo)
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import polling_bot as pb
+from async_runner import AsyncRuntime
+from outbound import OutboundDispatcher
+
+
+class FakeAsyncBale:
+    def __init__(self):
+        self.calls = []
+
+    async def call(self, method, payload=None, files=None, timeout=None):
+        self.calls.append((method, payload, threading.current_thread().name))
+        return {"ok": True, "result": {"message_id": 7}}
+
+
+class FakeDailyReset:
+    def get_access_info(self, user_id, topic_id):
+        return {"has_access": True, "remaining_text": ""}
+
+
+def make_callback(data, update_id, callback_id="cb"):
+    return {"update_id": update_id, "callback_query": {
+        "id": callback_id, "data": data, "from": {"id": 20},
+        "message": {"chat": {"id": 10}, "message_id": 5}
+    }}
+
+
+@contextmanager
+def patched(**attrs):
+    saved = {name: getattr(pb, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(pb, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(pb, name, value)
+
+
+def blocking(threads, result):
+    def func(*args):
+        threads.append(threading.current_thread().name)
+        return result
+    return func
+
+
+def test_hot_handlers_run_on_loop():
+    runtime = AsyncRuntime()
+    executor = ThreadPoolExecutor(2, thread_name_prefix="handler")
+    fake = FakeAsyncBale()
+    outbound = OutboundDispatcher(num_senders=1, global_limit=(100.0, 100), chat_limit=(100.0, 100))
+    threads = []
+    try:
+        with patched(async_runtime=runtime, async_bale=fake, handler_executor=executor, outbound=outbound,
+                     create_progress_text=blocking(threads, "📈 پیشرفت"),
+                     complete_day_for_user=blocking(threads, {"success": True, "next_day": 2}),
+                     get_user_topic_progress=blocking(threads, {"current_day": 2, "completed_days": [1]}),
+                     load_day_content=blocking(threads, {"day_number": 2}),
+                     daily_reset=FakeDailyReset()):
+            runtime.run(pb.process_update_async(make_callback("overall_progress", 1)), timeout=5)
+            runtime.run(pb.process_update_async(make_callback("complete_1_1", 2, "cb-async-1")), timeout=5)
+            # هندلرهای coroutine از تردهای ارسال صف خروجی استفاده نکرده‌اند
+            assert not outbound.started
+
+            # هندلر همگام در executor و ارسالش از صف تردی
+            runtime.run(pb.process_update_async(make_callback("help", 3)), timeout=5)
+            assert outbound.wait_idle(2)
+    finally:
+        runtime.stop()
+        executor.shutdown()
+
+    methods = [method for method, _, _ in fake.calls]
+    assert methods == ["sendMessage", "editMessageText", "sendMessage"]
+    assert fake.calls[0][1]["text"] == "📈 پیشرفت"
+    assert fake.calls[1][1]["message_id"] == 5
+    # درخواست‌های بله روی ترد حلقه و کوئری‌ها در تردهای executor
+    assert {thread for _, _, thread in fake.calls} == {"asyncio-loop"}
+    assert len(threads) == 4
+    assert all(name.startswith("handler") for name in threads)
+    assert outbound.started
+
+
+def test_coroutine_handler_in_sync_mode():
+    outbound = OutboundDispatcher(num_senders=1, global_limit=(100.0, 100), chat_limit=(100.0, 100))
+    sent = []
+
+    def api_call(method, payload=None, files=None):
+        sent.append((method, payload["text"], threading.current_thread().name))
+        return {"ok": True}
+
+    with patched(outbound=outbound, api_call=api_call, create_progress_text=lambda user_id: "📈 پیشرفت"):
+        assert pb.async_bale is None
+        # بدون حلقه asyncio، همان ارسال همگام از صف خروجی
+        pb.handle_update(make_callback("overall_progress", 4))
+        assert outbound.wait_idle(2)
+
+    assert sent == [("sendMessage", "📈 پیشرفت", "outbound-0")]
+
+
+if __name__ == "__main__":
+    test_hot_handlers_run_on_loop()
+    test_coroutine_handler_in_sync_mode()
+    print("✅ تست کامل شد!")
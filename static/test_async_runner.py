@@ -0,0 +1,40 @@
+"""
+test_async_runner.py - تست اجرای ترتیبی آپدیت‌های هر چت در حالت async
+"""
+
+import asyncio
+
+from async_runner import AsyncRuntime, AsyncUpdateDispatcher
+
+
+def test_async_per_chat_order():
+    results = {}
+    running = {"now": 0, "max": 0}
+
+    async def handler(update):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        await asyncio.sleep(0.001 * (update["n"] % 3))
+        results.setdefault(update["chat"], []).append(update["n"])
+        running["now"] -= 1
+
+    runtime = AsyncRuntime()
+    dispatcher = AsyncUpdateDispatcher(handler, runtime, max_in_flight=3)
+    dispatcher.start()
+
+    for n in range(60):
+        chat = n % 5
+        assert dispatcher.submit(chat, {"chat": chat, "n": n})
+
+    assert dispatcher.drain(5)
+    runtime.stop()
+
+    for chat, numbers in results.items():
+        assert numbers == sorted(numbers)
+    assert dispatcher.stats()["processed"] == 60
+    assert running["max"] <= 3
+
+
+if __name__ == "__main__":
+    test_async_per_chat_order()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,122 @@
+"""
+test_bale_api.py - تست آماده‌سازی پارامترها، تلاش دوباره و قطع‌کننده مدار کلاینت بله با Session ساختگی
+"""
+
+import json
+
+from bale_api import BaleClient
+from resilience import RetryPolicy, BreakerRegistry, CircuitOpenError
+
+
+class FakeResponse:
+    def __init__(self, result):
+        self.result = result
+
+    def json(self):
+        return self.result
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = responses
+        self.posts = []
+
+    def post(self, url, **kwargs):
+        self.posts.append((url, kwargs))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return FakeResponse(response)
+
+
+def make_client(responses, failure_threshold=5):
+    client = BaleClient("TOKEN", retry_policy=RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001))
+    client.breakers = BreakerRegistry(failure_threshold=failure_threshold, reset_timeout=60)
+    client.session = FakeSession(responses)
+    return client
+
+
+def test_retry_server_error_and_exception():
+    client = make_client([{"ok": False, "error_code": 502}, ConnectionError("reset"), {"ok": True, "result": []}])
+    assert client.call("getUpdates", {"offset": 1}) == {"ok": True, "result": []}
+    assert len(client.session.posts) == 3
+    stats = client.stats()
+    assert stats["calls"]["getUpdates"] == 3
+    assert stats["errors"]["getUpdates"] == 2
+    assert stats["retries"]["getUpdates"] == 2
+    assert stats["breakers"]["getUpdates"]["failures"] == 0
+
+    # بعد از آخرین تلاش، پاسخ 5xx برمی‌گردد و خطای شبکه بالا می‌رود
+    client = make_client([{"ok": False, "error_code": 500}] * 3)
+    assert client.call("getUpdates")["error_code"] == 500
+    assert len(client.session.posts) == 3
+    client = make_client([ConnectionError("reset")] * 3)
+    try:
+        client.call("getUpdates")
+        assert False, "خطای شبکه آخرین تلاش باید بالا برود"
+    except ConnectionError:
+        pass
+    assert len(client.session.posts) == 3
+
+
+def test_non_idempotent_and_client_errors_not_retried():
+    client = make_client([{"ok": False, "error_code": 502}])
+    assert client.call("sendMessage", {"chat_id": 1, "text": "سلام"})["error_code"] == 502
+    assert len(client.session.posts) == 1
+    assert "sendMessage" not in client.stats()["retries"]
+
+    # خطای 4xx خطای سرور نیست و مدار را باز نمی‌کند
+    client = make_client([{"ok": False, "error_code": 400, "description": "Bad Request"}])
+    assert client.call("editMessageText")["error_code"] == 400
+    assert len(client.session.posts) == 1
+    assert client.stats()["breakers"]["editMessageText"]["failures"] == 0
+
+
+def test_open_circuit_fails_fast():
+    client = make_client([{"ok": False, "error_code": 503}] * 2, failure_threshold=2)
+    client.call("sendMessage")
+    client.call("sendMessage")
+    assert client.stats()["breakers"]["sendMessage"]["state"] == "open"
+
+    try:
+        client.call("sendMessage")
+        assert False, "مدار باز باید بدون درخواست رد کند"
+    except CircuitOpenError as e:
+        assert e.retry_in > 0
+    assert len(client.session.posts) == 2
+    # مدار هر متد جداست
+    client.session.responses.append({"ok": True})
+    assert client.call("answerCallbackQuery") == {"ok": True}
+
+
+def test_serialize():
+    keyboard = {"inline_keyboard": [[{"text": "✅", "callback_data": "done"}]]}
+    payload = {"chat_id": 10, "text": "سلام", "caption": None, "reply_markup": keyboard,
+               "disable_notification": True, "entities": [{"type": "bold"}]}
+
+    data = BaleClient.serialize(payload)
+    # None حذف و کیبورد به رشته JSON تبدیل می‌شود؛ بقیه برای بدنه JSON دست نمی‌خورند
+    assert "caption" not in data
+    assert json.loads(data["reply_markup"]) == keyboard
+    assert data["disable_notification"] is True
+    assert data["entities"] == [{"type": "bold"}]
+    assert data["text"] == "سلام"
+
+    # در multipart هر مقدار غیررشته‌ای ساختاری باید رشته شود
+    multipart = BaleClient.serialize(payload, multipart=True)
+    assert multipart["disable_notification"] == "true"
+    assert multipart["entities"] == '[{"type": "bold"}]'
+    assert json.loads(multipart["reply_markup"]) == keyboard
+    assert multipart["chat_id"] == 10
+
+    # کیبورد از قبل رشته‌شده دوباره رمز نمی‌شود
+    assert BaleClient.serialize({"reply_markup": '{"a": 1}'})["reply_markup"] == '{"a": 1}'
+    assert BaleClient.serialize(None) == {}
+
+
+if __name__ == "__main__":
+    test_retry_server_error_and_exception()
+    test_non_idempotent_and_client_errors_not_retried()
+    test_open_circuit_fails_fast()
+    test_serialize()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,40 @@
+"""
+test_completion_ledger.py - تست جلوگیری از ثبت تکراری با شناسه callback و (کاربر، موضوع، روز)
+"""
+
+import time
+
+from completion_ledger import CompletionLedger
+
+
+def test_dedup_and_ttl():
+    ledger = CompletionLedger(ttl=0.2)
+    result = {"success": True, "next_day": 4}
+    assert ledger.lookup("cb1", "7", 1, 3) is None
+    ledger.record("cb1", "7", 1, 3, result)
+
+    # همان ضربه و ضربه دوباره روی دکمه دیگری برای همان روز
+    assert ledger.lookup("cb1", "7", 1, 3) == result
+    assert ledger.lookup("cb2", "7", 1, 3) == result
+    # روز یا موضوع دیگر
+    assert ledger.lookup("cb3", "7", 1, 4) is None
+    assert ledger.lookup("cb3", "7", 2, 3) is None
+
+    time.sleep(0.25)
+    assert ledger.lookup("cb1", "7", 1, 3) is None
+    assert ledger.stats() == {"entries": 0, "duplicate_hits": 2, "misses": 4}
+
+
+def test_size_limit():
+    ledger = CompletionLedger(max_entries=4)
+    for day in range(1, 4):
+        ledger.record(f"cb{day}", "7", 1, day, {"day": day})
+    assert ledger.stats()["entries"] == 4
+    assert ledger.lookup("cb-new", "7", 1, 1) is None
+    assert ledger.lookup("cb-new", "7", 1, 3) == {"day": 3}
+
+
+if __name__ == "__main__":
+    test_dedup_and_ttl()
+    test_size_limit()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,107 @@
+"""
+test_edit_message.py - تست ویرایش پیام دکمه (متن، کپشن تصویر، فقط کیبورد) و برگشت به ارسال پیام جدید
+"""
+
+import polling_bot as pb
+
+KEYBOARD = {"inline_keyboard": [[{"text": "✅", "callback_data": "x"}]]}
+
+
+class FakeApi:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    def __call__(self, chat_id, method, payload, files=None, lane=None):
+        self.calls.append((method, payload))
+        result = self.results.pop(0) if self.results else {"ok": True}
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class FakeDailyReset:
+    def __init__(self, has_access):
+        self.has_access = has_access
+
+    def get_access_info(self, user_id, topic_id):
+        return {"has_access": self.has_access, "remaining_text": "۵ ساعت"}
+
+
+def with_api(api, func, **attrs):
+    attrs["call_chat_api"] = api
+    saved = {name: getattr(pb, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(pb, name, value)
+    try:
+        return func()
+    finally:
+        for name, value in saved.items():
+            setattr(pb, name, value)
+
+
+def test_edit_method_and_result():
+    api = FakeApi()
+    photo = {"message_id": 5, "photo": [{"file_id": "p"}]}
+    text = {"message_id": 6, "text": "قبلی"}
+    assert with_api(api, lambda: pb.edit_message(10, photo, "کپشن", KEYBOARD))
+    assert with_api(api, lambda: pb.edit_message(10, text, "متن"))
+    assert with_api(api, lambda: pb.edit_message(10, photo, None, KEYBOARD))
+    (m1, p1), (m2, p2), (m3, p3) = api.calls
+    assert m1 == "editMessageCaption" and p1["caption"] == "کپشن" and "text" not in p1
+    assert p1["reply_markup"] == KEYBOARD
+    assert m2 == "editMessageText" and p2["text"] == "متن" and p2["reply_markup"] is None
+    # فقط کیبورد؛ کپشن تصویر دست نمی‌خورد
+    assert m3 == "editMessageReplyMarkup" and "caption" not in p3 and "text" not in p3
+
+    # محتوای یکسان موفقیت است؛ خطای دیگر و استثنا نه
+    api = FakeApi({"ok": False, "description": "Bad Request: message is not modified"},
+                  {"ok": False, "error_code": 400, "description": "message to edit not found"},
+                  ConnectionError("reset"))
+    assert with_api(api, lambda: pb.edit_message(10, text, "متن"))
+    assert not with_api(api, lambda: pb.edit_message(10, text, "متن"))
+    assert not with_api(api, lambda: pb.edit_message(10, text, "متن"))
+    # پیام بدون شناسه اصلاً درخواستی نمی‌فرستد
+    assert not with_api(api, lambda: pb.edit_message(10, {}, "متن"))
+    assert len(api.calls) == 3
+
+
+def make_complete(callback_id, user_id, day):
+    # دفتر تکمیل ضربه تکراری (کاربر، موضوع، روز) را بین تست‌ها هم می‌گیرد؛ هر تست کاربر خودش را دارد
+    return {"update_id": 1, "callback_query": {
+        "id": callback_id, "data": f"complete_1_{day}", "from": {"id": user_id},
+        "message": {"chat": {"id": 10}, "message_id": 5, "photo": [{"file_id": "p"}], "caption": "تمرین روز"}
+    }}
+
+
+def test_completed_status_keeps_exercise_caption():
+    api = FakeApi()
+    with_api(api, lambda: pb.handle_update(make_complete("cb-edit-1", 31, 2)),
+             complete_day_for_user=lambda *args: {"success": True, "next_day": 3},
+             get_user_topic_progress=lambda *args: {"current_day": 3, "completed_days": [1, 2]},
+             daily_reset=FakeDailyReset(has_access=False))
+    methods = [method for method, _ in api.calls]
+    assert methods == ["editMessageReplyMarkup", "sendMessage"]
+    assert "تمرین امروز تکمیل شد" in api.calls[1][1]["text"]
+
+
+def test_failed_edit_falls_back_to_new_message():
+    api = FakeApi(ConnectionError("reset"))
+    photos = []
+    with_api(api, lambda: pb.handle_update(make_complete("cb-edit-2", 32, 1)),
+             complete_day_for_user=lambda *args: {"success": True, "next_day": 2},
+             get_user_topic_progress=lambda *args: {"current_day": 2, "completed_days": [1]},
+             load_day_content=lambda *args: {"day_number": 2},
+             daily_reset=FakeDailyReset(has_access=True),
+             send_photo=lambda chat_id, path, caption=None, keyboard=None: photos.append(caption),
+             send_message=lambda chat_id, text, keyboard=None: photos.append(text))
+    assert api.calls[0][0] == "editMessageCaption"
+    # ویرایش ناموفق؛ همان صفحه تمرین به صورت پیام جدید
+    assert photos == [api.calls[0][1]["caption"]]
+
+
+if __name__ == "__main__":
+    test_edit_method_and_result()
+    test_completed_status_keeps_exercise_caption()
+    test_failed_edit_falls_back_to_new_message()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,47 @@
+"""
+test_flood_control.py - تست سطل توکن و محدودیت هر دسته مسیر
+"""
+
+from flood_control import TokenBucket, FloodController, parse_limit
+
+
+def test_token_bucket_refill():
+    bucket = TokenBucket(2.0, 3)
+    assert [bucket.consume(now=bucket.updated) for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time() == 0.5
+    # نیم ثانیه بعد یک توکن اضافه شده
+    assert bucket.consume(now=bucket.updated + 0.5)
+    assert not bucket.consume(now=bucket.updated)
+    # ظرفیت از capacity بیشتر نمی‌شود
+    assert bucket.is_idle(bucket.updated + 10)
+    assert bucket.consume(now=bucket.updated + 10)
+    assert bucket.tokens == 2
+
+
+def test_per_group_limits():
+    flood = FloodController(limits={"stats": (0.001, 1), "content": (0.001, 3)}, chat_limit=(100.0, 100))
+    assert flood.allow(1, 1, "stats")
+    assert not flood.allow(1, 1, "stats")
+    # دسته دیگر و کاربر دیگر سهمیه جدا دارند
+    assert [flood.allow(1, 1, "content") for _ in range(4)] == [True, True, True, False]
+    assert flood.allow(2, 2, "stats")
+    # دسته ناشناخته به default می‌رود
+    assert flood.allow(1, 1, "unknown")
+
+    stats = flood.stats()
+    assert stats["allowed"] == {"stats": 2, "content": 3, "default": 1}
+    assert stats["dropped"] == {"stats": 1, "content": 1}
+
+
+def test_chat_limit_and_parse():
+    flood = FloodController(limits={"default": (100.0, 100)}, chat_limit=(0.001, 2))
+    assert [flood.allow(user, 5, "default") for user in (1, 2, 3)] == [True, True, False]
+    assert parse_limit("1/5", (2.0, 10)) == (1.0, 5.0)
+    assert parse_limit("bad", (2.0, 10)) == (2.0, 10)
+
+
+if __name__ == "__main__":
+    test_token_bucket_refill()
+    test_per_group_limits()
+    test_chat_limit_and_parse()
+    print("✅ تست کامل شد!")
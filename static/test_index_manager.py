@@ -0,0 +1,58 @@
+"""
+test_index_manager.py - تست ساخت و گزارش ایندکس‌ها با کالکشن ساختگی
+"""
+
+from index_manager import IndexManager
+
+
+class FakeCollection:
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.created = []
+
+    def index_information(self):
+        return {name: {"key": key, "unique": unique} for name, (key, unique) in self.indexes.items()}
+
+    def create_index(self, keys, name, unique=False):
+        self.created.append(name)
+        self.indexes[name] = (list(keys), unique)
+
+    def aggregate(self, pipeline):
+        # ایندکس‌های تازه ساخته‌شده هنوز استفاده‌ای ندارند
+        return [{"name": name, "key": dict(key),
+                 "accesses": {"ops": 0 if name == "old_index" or name in self.created else 5}}
+                for name, (key, _) in self.indexes.items()]
+
+
+def test_ensure_and_usage():
+    users = FakeCollection({
+        "_id_": ([("_id", 1)], False),
+        "user_id_1": ([("user_id", 1.0)], True),
+        "old_index": ([("username", 1)], False),
+    })
+    access = FakeCollection({"_id_": ([("_id", 1)], False)})
+    specs = {
+        "registered_users": [
+            {"name": "user_id_unique", "keys": [("user_id", 1)], "unique": True},
+            {"name": "registration_date_desc", "keys": [("registration_date", -1)]},
+        ],
+        "daily_access": [
+            {"name": "user_topic_unique", "keys": [("user_id", 1), ("topic_id", 1)], "unique": True},
+        ],
+    }
+    manager = IndexManager({"registered_users": users, "daily_access": access}, specs)
+
+    report = manager.ensure()
+    assert report["present"] == ["registered_users.user_id_unique"]
+    assert report["created"] == ["registered_users.registration_date_desc", "daily_access.user_topic_unique"]
+    assert users.created == ["registration_date_desc"]
+
+    usage = manager.usage()
+    assert usage["unused"] == ["registered_users.old_index"]
+    assert usage["undeclared"] == ["registered_users.old_index"]
+    assert manager.ensure()["created"] == []
+
+
+if __name__ == "__main__":
+    test_ensure_and_usage()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,37 @@
+"""
+test_last_login.py - تست تجمیع نوشتن last_login
+"""
+
+from datetime import datetime, timedelta
+
+from last_login import LastLoginWriter
+
+
+class FakeCollection:
+    def __init__(self):
+        self.batches = []
+
+    def bulk_write(self, requests, ordered=True):
+        self.batches.append([(r._filter["user_id"], r._doc["$max"]["last_login"]) for r in requests])
+
+
+def test_coalesced_writes():
+    users = FakeCollection()
+    writer = LastLoginWriter(users, interval=3600)
+    # بدون ترد پس‌زمینه؛ flush دستی
+    writer.started = True
+
+    now = datetime.now()
+    for i in range(10):
+        writer.touch(1, now + timedelta(seconds=i))
+    writer.touch("2", now)
+    writer.flush()
+    writer.flush()
+
+    assert users.batches == [[("1", now + timedelta(seconds=9)), ("2", now)]]
+    assert writer.stats() == {"pending": 0, "touches": 11, "writes": 2, "batches": 1}
+
+
+if __name__ == "__main__":
+    test_coalesced_writes()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,35 @@
+"""
+test_mongo_connection.py - تست شمارنده کوئری هر ترد
+"""
+
+import threading
+from types import SimpleNamespace
+
+from mongo_connection import QueryCounter
+
+
+def test_query_counter_per_thread():
+    counter = QueryCounter()
+    event = SimpleNamespace(command_name="find")
+    counter.reset()
+    counter.started(event)
+    counter.started(event)
+
+    other = []
+
+    def worker():
+        counter.started(SimpleNamespace(command_name="update"))
+        other.append(counter.thread_count())
+
+    t = threading.Thread(target=worker)
+    t.start()
+    t.join()
+
+    assert counter.thread_count() == 2
+    assert other == [1]
+    assert counter.stats()["commands"] == {"find": 2, "update": 1}
+
+
+if __name__ == "__main__":
+    test_query_counter_per_thread()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,143 @@
+"""
+test_outbound.py - تست ارسال‌های زمان‌بندی‌شده صف خروجی
+"""
+
+import asyncio
+import threading
+import time
+
+from outbound import OutboundDispatcher, LANE_BULK
+from resilience import CircuitOpenError
+
+
+def test_delayed_sends_keep_time_order():
+    outbound = OutboundDispatcher(num_senders=2, chat_limit=(100.0, 100))
+    started = time.monotonic()
+    sent = []
+
+    def send(name):
+        sent.append((name, time.monotonic() - started))
+        return {"ok": True}
+
+    later = outbound.submit_later(0.2, 1, lambda: send("later"))
+    sooner = outbound.submit_later(0.05, 1, lambda: send("sooner"))
+    outbound.submit(1, lambda: send("now"))
+
+    assert later.result(2) == {"ok": True}
+    assert sooner.done()
+    assert [name for name, _ in sent] == ["now", "sooner", "later"]
+    assert sent[-1][1] >= 0.2
+    assert outbound.wait_idle(1)
+
+
+def test_throttled_chat_does_not_block_other_chats():
+    # یک ترد ارسال برای همه چت‌ها
+    outbound = OutboundDispatcher(num_senders=1, global_limit=(100.0, 100), chat_limit=(5.0, 1))
+    started = time.monotonic()
+    sent = []
+    limited = []
+
+    def send(name):
+        if name == "a0" and not limited:
+            limited.append(name)
+            return {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.5}}
+        sent.append((name, time.monotonic() - started))
+        return {"ok": True}
+
+    a_futures = [outbound.submit("A", lambda n=n: send(f"a{n}")) for n in range(3)]
+    time.sleep(0.05)
+    b_future = outbound.submit("B", lambda: send("b"))
+
+    assert b_future.result(2) == {"ok": True}
+    assert [f.result(3) for f in a_futures] == [{"ok": True}] * 3
+    times = dict(sent)
+    assert times["b"] < 0.3
+    assert times["a0"] >= 0.5
+    # ترتیب پیام‌های چت A حفظ شده است
+    assert [name for name, _ in sent if name.startswith("a")] == ["a0", "a1", "a2"]
+    assert outbound.wait_idle(1)
+    assert outbound.stats()["parked_chats"] == 0
+
+
+def test_wait_idle_waits_for_send_in_flight():
+    outbound = OutboundDispatcher(num_senders=1, global_limit=(100.0, 100), chat_limit=(100.0, 100))
+
+    def slow_send():
+        time.sleep(0.3)
+        return {"ok": True}
+
+    future = outbound.submit(1, slow_send)
+    time.sleep(0.05)
+    # کار از صف برداشته شده ولی هنوز فرستاده نشده
+    assert outbound.stats()["in_flight"] == 1
+    assert not outbound.wait_idle(0.1)
+    assert outbound.wait_idle(1)
+    assert future.done()
+    assert outbound.stats()["in_flight"] == 0
+
+
+def test_bulk_job_deferred_while_circuit_open():
+    outbound = OutboundDispatcher(num_senders=1, global_limit=(100.0, 100), chat_limit=(100.0, 100))
+    outbound.start()
+    threads = threading.active_count()
+    calls = []
+
+    def send():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise CircuitOpenError("setMyName", 0.0)
+        return {"ok": True}
+
+    future = outbound.submit(None, send, lane=LANE_BULK)
+    time.sleep(0.2)
+    # در مدت انتظار، بازگشت به صف با ترد زمان‌بندی است نه ترد جدید
+    assert threading.active_count() == threads
+    assert outbound.stats()["deferred_circuit_open"] == 1
+    # حداقل تأخیر یک ثانیه است
+    assert future.result(3) == {"ok": True}
+    assert calls[1] - calls[0] >= 1.0
+    assert outbound.wait_idle(1)
+
+
+def test_call_async_waits_on_loop():
+    outbound = OutboundDispatcher(num_senders=1, global_limit=(100.0, 100), chat_limit=(5.0, 1))
+    sent = []
+    responses = [{"ok": False, "error_code": 429, "parameters": {"retry_after": 0.3}}]
+
+    async def request(name):
+        sent.append((name, time.monotonic() - started))
+        return responses.pop(0) if responses else {"ok": True}
+
+    async def main():
+        return await asyncio.gather(outbound.call_async("A", lambda: request("a")),
+                                    outbound.call_async("B", lambda: request("b")))
+
+    started = time.monotonic()
+    assert asyncio.run(main()) == [{"ok": True}, {"ok": True}]
+    times = [(name, round(t, 1)) for name, t in sent]
+    # 429 فقط چت A را متوقف می‌کند؛ تلاش دوباره بعد از retry_after
+    assert times[0] == ("a", 0.0) and ("b", 0.0) in times
+    assert times[-1][0] == "a" and sent[-1][1] >= 0.3
+    # هیچ ترد ارسالی لازم نبود
+    assert not outbound.started
+    stats = outbound.stats()
+    assert stats["rate_limited_429"] == 1
+    assert stats["sent"] == 2
+    assert stats["in_flight"] == 0
+
+
+def test_global_rate_split_between_processes():
+    outbound = OutboundDispatcher(num_senders=1, global_limit=(30.0, 30), processes=3)
+    assert outbound.global_bucket.rate == 10.0
+    assert outbound.global_bucket.capacity == 10
+    assert outbound.stats()["global_rate"] == 10.0
+
+
+if __name__ == "__main__":
+    test_delayed_sends_keep_time_order()
+    test_throttled_chat_does_not_block_other_chats()
+    test_wait_idle_waits_for_send_in_flight()
+    test_bulk_job_deferred_while_circuit_open()
+    test_call_async_waits_on_loop()
+    test_global_rate_split_between_processes()
+    print("✅ تست کامل شد!")
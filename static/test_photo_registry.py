@@ -0,0 +1,42 @@
+"""
+test_photo_registry.py - تست ذخیره هم‌زمان کش file_id تصاویر
+"""
+
+import os
+import threading
+
+from photo_registry import PhotoRegistry
+
+
+def test_concurrent_store(tmp_path):
+    image = tmp_path / "image.png"
+    image.write_bytes(b"png")
+    cache_file = str(tmp_path / "data" / "photo_file_ids.json")
+    # مثل چند پروسس با فایل کش مشترک
+    registries = [PhotoRegistry(cache_file) for _ in range(4)]
+
+    errors = []
+
+    def store(registry, n):
+        for i in range(25):
+            try:
+                registry.store(str(image), f"file-{n}-{i}")
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=store, args=(r, n)) for n, r in enumerate(registries)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert os.listdir(tmp_path / "data") == ["photo_file_ids.json"]
+    assert PhotoRegistry(cache_file).get(str(image)).startswith("file-")
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    test_concurrent_store(pathlib.Path(tempfile.mkdtemp()))
+    print("✅ تست کامل شد!")
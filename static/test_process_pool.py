@@ -0,0 +1,79 @@
+"""
+test_process_pool.py - تست رویدادهای ورکر و تخلیه پروسس‌ها در پایان
+"""
+
+import os
+import time
+
+import process_pool
+from process_pool import ProcessDispatcher
+from work_queue import PRIORITY_LOW
+
+
+def handle(update):
+    process_pool.notify_parent(("handled", update["update_id"]))
+
+
+def flush():
+    process_pool.notify_parent(("flushed", None))
+
+
+def test_worker_events_and_flush():
+    events = []
+    done = []
+    dispatcher = ProcessDispatcher("static.test_process_pool:handle", num_processes=2, threads_per_process=1,
+                                   on_done=done.append, flush_path="static.test_process_pool:flush",
+                                   on_event=events.append)
+    assert not process_pool.in_worker()
+    dispatcher.start()
+    for update_id in range(6):
+        assert dispatcher.submit(update_id, {"update_id": update_id})
+    assert dispatcher.drain(30)
+
+    deadline = time.monotonic() + 5
+    while len(events) < 8 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert sorted(done) == list(range(6))
+    assert sorted(n for kind, n in events if kind == "handled") == list(range(6))
+    # هر پروسس یک بار بعد از تخلیه
+    assert [kind for kind, _ in events].count("flushed") == 2
+
+
+def slow(update):
+    if update["update_id"] == 0:
+        time.sleep(0.5)
+
+
+def test_overload_stats():
+    # صف پر در پروسس اصلی
+    dispatcher = ProcessDispatcher("static.test_process_pool:slow", num_processes=1, max_inbox_size=1)
+    assert dispatcher.submit(1, {"update_id": 10})
+    assert not dispatcher.submit(1, {"update_id": 11})
+    assert dispatcher.stats()["shed_full"] == 1
+
+    # آپدیت کم‌اولویت قدیمی در ورکر کنار گذاشته می‌شود و علتش به پروسس اصلی می‌رسد
+    os.environ["BOT_QUEUE_MAX_AGE"] = "0.1"
+    try:
+        dispatcher = ProcessDispatcher("static.test_process_pool:slow", num_processes=1, threads_per_process=1)
+        dispatcher.start()
+    finally:
+        del os.environ["BOT_QUEUE_MAX_AGE"]
+    assert dispatcher.submit(1, {"update_id": 0})
+    assert dispatcher.submit(1, {"update_id": 1}, PRIORITY_LOW)
+    time.sleep(0.3)
+    assert dispatcher.stats()["oldest_age"] >= 0.25
+    assert dispatcher.drain(30)
+
+    deadline = time.monotonic() + 5
+    while dispatcher.stats()["shed_stale"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stats = dispatcher.stats()
+    assert stats["shed_stale"] == 1
+    assert stats["shed_full"] == 0
+    assert stats["oldest_age"] == 0.0
+
+
+if __name__ == "__main__":
+    test_worker_events_and_flush()
+    test_overload_stats()
+    print("✅ تست کامل شد!")
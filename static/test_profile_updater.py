@@ -0,0 +1,36 @@
+"""
+test_profile_updater.py - تست تجمیع به‌روزرسانی‌های پروفایل
+"""
+
+from profile_updater import ProfileUpdater
+
+
+def test_coalesced_updates():
+    loads = []
+    applied = []
+
+    def count_loader():
+        loads.append(1)
+        return 100
+
+    updater = ProfileUpdater(count_loader, applied.append, interval=3600)
+    # بدون ترد پس‌زمینه؛ flush دستی
+    updater.started = True
+
+    for _ in range(50):
+        updater.request_update()
+    updater.flush()
+    assert applied == [100]
+
+    for _ in range(20):
+        updater.record_registration()
+    updater.flush()
+    updater.flush()
+    assert applied == [100, 120]
+    assert len(loads) == 1
+    assert updater.stats()["requests"] == 70
+
+
+if __name__ == "__main__":
+    test_coalesced_updates()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,32 @@
+"""
+test_progress_report.py - تست متن پیشرفت کلی و کش آن
+"""
+
+from progress_report import ProgressRenderer
+
+TOPICS = [
+    {"id": 1, "name": "سلامتی", "emoji": "💚"},
+    {"id": 2, "name": "ثروت", "emoji": "💰"},
+]
+
+
+def test_render_and_cache():
+    renderer = ProgressRenderer(TOPICS)
+    topics_progress = {"1": {"completed_days": list(range(1, 29))}, "2": {"completed_days": [1, 2, 3, 4, 5, 6, 7]}}
+    counts = renderer.completed_counts(topics_progress)
+    assert counts == (28, 7)
+
+    text = renderer.render(counts)
+    assert "🏆 💚 سلامتی" in text
+    assert "100.0% • 28/۲۸ روز • کامل شده!" in text
+    assert "💪 💰 ثروت\n█████░░░░░░░░░░░░░░░\n25.0% • 7/۲۸ روز • ادامه دهید!" in text
+    assert "⚡ پیشرفت کلی:\n▓▓▓▓▓▓▓▓▓▓▓▓░░░░░░░░\n62.5% • 35 از 56 روز" in text
+
+    assert renderer.render(renderer.completed_counts({})) != text
+    assert renderer.render(counts) is text
+    assert renderer.stats()["hits"] == 1
+
+
+if __name__ == "__main__":
+    test_render_and_cache()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,59 @@
+"""
+test_registered_index.py - تست فهرست حافظه‌ای کاربران ثبت‌نام‌شده با کالکشن ساختگی
+"""
+
+from datetime import datetime, timedelta
+
+from registered_index import RegisteredUserIndex
+
+ADMIN_PHONE = "989120000000"
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        since = query.get("registration_date", {}).get("$gt")
+        return [dict(doc) for doc in self.docs if since is None or doc["registration_date"] > since]
+
+
+def test_load_add_and_poll():
+    now = datetime.now()
+    users = FakeCollection([
+        {"user_id": "1", "phone_number": "989121111111", "registration_date": now - timedelta(days=2)},
+        {"user_id": "2", "phone_number": ADMIN_PHONE, "registration_date": now - timedelta(days=1)},
+    ])
+    index = RegisteredUserIndex(ADMIN_PHONE, poll_interval=60)
+    assert index.contains(1) is None
+    assert index.is_admin(2) is None
+
+    index.collection = users
+    index.reload()
+    assert index.contains(1) is True
+    assert index.contains("3") is False
+    assert index.is_admin(2) is True
+    assert index.is_admin(1) is False
+
+    # ثبت‌نام در همین پروسس
+    index.add(3, "989123333333", now)
+    assert index.contains(3) is True
+
+    # ثبت‌نام در نمونه دیگر فقط با کوئری تغییرات دیده می‌شود
+    users.docs.append({"user_id": "4", "phone_number": "989124444444", "registration_date": now + timedelta(seconds=1)})
+    index._poll()
+    assert users.queries[-1] == {"registration_date": {"$gt": now}}
+    assert index.contains(4) is True
+
+    stats = index.stats()
+    assert stats["users"] == 4
+    assert stats["admins"] == 1
+    assert stats["negatives"] == 1
+    assert stats["memory_bytes"] > 0
+
+
+if __name__ == "__main__":
+    test_load_add_and_poll()
+    print("✅ تست کامل شد!")
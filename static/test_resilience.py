@@ -0,0 +1,49 @@
+"""
+test_resilience.py - تست قطع‌کننده مدار و تلاش دوباره
+"""
+
+import time
+
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+def test_circuit_breaker_states():
+    breaker = CircuitBreaker("sendMessage", failure_threshold=2, reset_timeout=0.05)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    try:
+        breaker.before_call()
+        assert False, "مدار باز باید درخواست را رد کند"
+    except CircuitOpenError as e:
+        assert e.retry_in > 0
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # در حالت نیمه‌باز فقط یک درخواست آزمایشی مجاز است
+    try:
+        breaker.before_call()
+        assert False, "درخواست دوم در حالت نیمه‌باز باید رد شود"
+    except CircuitOpenError:
+        pass
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["rejected"] == 2
+
+
+def test_retry_only_idempotent():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, max_delay=0.3)
+    assert policy.attempts_for("getUpdates") == 3
+    assert policy.attempts_for("sendMessage") == 1
+    assert policy.attempts_for("setMyName", files={"photo": None}) == 1
+    assert all(0 <= policy.delay(n) <= 0.3 for n in range(10))
+
+
+if __name__ == "__main__":
+    test_circuit_breaker_states()
+    test_retry_only_idempotent()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,46 @@
+"""
+test_response_buffer.py - تست ادغام پیام‌های متنی یک هندلر
+"""
+
+from response_buffer import ResponseBuffer, ReplyKeyboardTracker, MAX_TEXT_LENGTH
+
+
+def message(chat_id, text, keyboard=None):
+    return {"chat_id": chat_id, "text": text, "parse_mode": "HTML", "reply_markup": keyboard}
+
+
+def test_merge_consecutive_texts():
+    sent = []
+    buffer = ResponseBuffer(sent.append)
+    menu = {"inline_keyboard": [[{"text": "شروع", "callback_data": "start_using"}]]}
+
+    with buffer.collect():
+        buffer.add(message(1, "خوش آمدید"))
+        buffer.add(message(1, "انتخاب کنید:", menu))
+        # پیام قبلی کیبورد دارد؛ ادغام نمی‌شود
+        buffer.add(message(1, "بعدی"))
+        buffer.add(message(2, "چت دیگر"))
+        buffer.add(message(2, "x" * MAX_TEXT_LENGTH))
+        assert sent == []
+
+    assert [m["text"] for m in sent[:3]] == ["خوش آمدید\nانتخاب کنید:", "بعدی", "چت دیگر"]
+    assert sent[0]["reply_markup"] == menu
+    assert len(sent) == 4
+    assert buffer.stats()["saved"] == 1
+    assert not buffer.active()
+
+
+def test_reply_keyboard_tracker():
+    tracker = ReplyKeyboardTracker()
+    menu = {"keyboard": [["📊 پیشرفت کلی"]], "resize_keyboard": True}
+    assert not tracker.is_current(1, menu)
+    tracker.observe(1, menu)
+    assert tracker.is_current(1, menu)
+    tracker.observe(1, {"remove_keyboard": True})
+    assert not tracker.is_current(1, menu)
+
+
+if __name__ == "__main__":
+    test_merge_consecutive_texts()
+    test_reply_keyboard_tracker()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,109 @@
+"""
+test_router.py - تست جدول مسیرها
+"""
+
+import asyncio
+from contextlib import contextmanager
+
+from router import Router, UpdateContext
+
+
+def make_message(text):
+    return {"update_id": 1, "message": {"chat": {"id": 10}, "from": {"id": 20}, "text": text}}
+
+
+def make_callback(data):
+    return {"update_id": 2, "callback_query": {
+        "id": "cb1", "data": data, "from": {"id": 20},
+        "message": {"chat": {"id": 10}, "message_id": 5}
+    }}
+
+
+def test_routes():
+    router = Router()
+    seen = []
+
+    @router.text("/start")
+    @router.callback("main_menu")
+    def on_start(ctx):
+        seen.append(("start", ctx.chat_id, ctx.user_id))
+
+    @router.prefix("complete_", toast="ثبت شد ✅")
+    def on_complete(ctx):
+        seen.append(("complete", ctx.data, ctx.callback_id))
+
+    @router.fallback(lambda text: text.isdigit())
+    def on_digits(ctx):
+        seen.append(("digits", ctx.text))
+
+    assert router.dispatch(UpdateContext(make_message("/start")))
+    assert router.dispatch(UpdateContext(make_callback("main_menu")))
+    assert router.dispatch(UpdateContext(make_callback("complete_3_4")))
+    assert router.dispatch(UpdateContext(make_callback("complete_day_3_4")))
+    assert router.dispatch(UpdateContext(make_message("0912")))
+    assert not router.dispatch(UpdateContext(make_message("سلام")))
+    assert not router.dispatch(UpdateContext(make_callback("unknown")))
+
+    assert seen == [
+        ("start", 10, "20"),
+        ("start", 10, "20"),
+        ("complete", "complete_3_4", "cb1"),
+        ("complete", "complete_day_3_4", "cb1"),
+        ("digits", "0912"),
+    ]
+    assert router.toast_for(UpdateContext(make_callback("complete_3_4"))) == "ثبت شد ✅"
+    assert router.toast_for(UpdateContext(make_callback("main_menu"))) is None
+
+    stats = router.stats()
+    assert stats["on_start"]["calls"] == 2
+    assert stats["on_complete"]["calls"] == 2
+
+
+def test_coroutine_handlers():
+    scopes = []
+
+    @contextmanager
+    def scope(ctx):
+        scopes.append(("sync", ctx.route))
+        yield
+
+    @contextmanager
+    def async_scope(ctx):
+        scopes.append(("async", ctx.route))
+        yield
+
+    router = Router(scope=scope, async_scope=async_scope)
+    seen = []
+
+    async def helper(value):
+        # helper دوحالته در حالت همگام بدون تعلیق برمی‌گردد
+        return value
+
+    @router.callback("progress")
+    async def on_progress(ctx):
+        seen.append(await helper(ctx.data))
+
+    @router.callback("wait")
+    async def on_wait(ctx):
+        await asyncio.sleep(0.01)
+        seen.append(ctx.data)
+
+    # حالت همگام: بدون حلقه asyncio
+    assert router.dispatch(UpdateContext(make_callback("progress")))
+    try:
+        router.dispatch(UpdateContext(make_callback("wait")))
+        assert False, "تعلیق واقعی در حالت همگام باید خطا بدهد"
+    except RuntimeError:
+        pass
+
+    # حالت async: coroutine روی حلقه با async_scope
+    assert asyncio.run(router.dispatch_async(UpdateContext(make_callback("wait"))))
+    assert seen == ["progress", "wait"]
+    assert scopes == [("sync", "on_progress"), ("sync", "on_wait"), ("async", "on_wait")]
+    assert router.stats()["on_wait"]["calls"] == 2
+
+
+if __name__ == "__main__":
+    test_routes()
+    test_coroutine_handlers()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,91 @@
+"""
+test_shutdown.py - تست ترتیب توقف امن ربات با منبع آپدیت و dispatcher ساختگی
+"""
+
+import time
+
+import polling_bot as pb
+from update_journal import UpdateJournal
+
+
+def update(update_id, user_id):
+    return {"update_id": update_id, "message": {"chat": {"id": user_id}, "from": {"id": user_id}, "text": "/start"}}
+
+
+class FakeSource:
+    """هم‌شکل با UpdateFetcher؛ دسته‌های مانده در صف را قبلاً ترد دریافت ثبت کرده است"""
+
+    def __init__(self, events, batches):
+        self.events = events
+        self.batches = batches
+
+    def stop(self):
+        self.events.append("stop")
+
+    def get_batch(self, timeout=None):
+        self.events.append("batch")
+        return self.batches.pop(0) if self.batches else None
+
+
+class FakeDispatcher:
+    """فقط اولین آپدیت قبل از اتمام مهلت تمام می‌شود"""
+
+    def __init__(self, events, journal):
+        self.events = events
+        self.journal = journal
+        self.submitted = []
+        self.drain_timeout = None
+
+    def submit(self, chat_id, update, priority):
+        self.events.append("submit")
+        self.submitted.append(update["update_id"])
+        return True
+
+    def drain(self, timeout):
+        self.events.append("drain")
+        self.drain_timeout = timeout
+        self.journal.mark_done(self.submitted[0])
+        return False
+
+    def queue_depths(self):
+        return [len(self.submitted) - 1]
+
+
+def test_drain_deadline_keeps_unfinished_pending(tmp_path):
+    events = []
+    journal = UpdateJournal(str(tmp_path))
+    batch = [update(101, 501), update(102, 502)]
+    journal.record_received(batch)
+    source = FakeSource(events, [batch])
+    dispatcher = FakeDispatcher(events, journal)
+
+    def failing_hook():
+        events.append("hook-1")
+        raise RuntimeError("mongo down")
+
+    saved = pb.fetcher, pb.journal, pb.dispatcher, pb.shutdown_hooks, pb.webhook_receiver
+    pb.fetcher, pb.journal, pb.dispatcher, pb.webhook_receiver = source, journal, dispatcher, None
+    pb.shutdown_hooks = [failing_hook, lambda: events.append("hook-2")]
+    try:
+        started = time.monotonic()
+        pb.shutdown_bot(source, timeout=0.5)
+    finally:
+        pb.fetcher, pb.journal, pb.dispatcher, pb.shutdown_hooks, pb.webhook_receiver = saved
+
+    # توقف دریافت، ورود دسته‌های مانده، تخلیه و سپس ذخیره‌سازی؛ خطای یک hook بقیه را متوقف نمی‌کند
+    assert events == ["stop", "batch", "submit", "submit", "batch", "drain", "hook-1", "hook-2"]
+    assert dispatcher.submitted == [101, 102]
+    assert 0 < dispatcher.drain_timeout <= 0.5
+    assert time.monotonic() - started < 0.5
+
+    # آپدیت تمام‌نشده بعد از راه‌اندازی دوباره بازپخش می‌شود
+    restarted = UpdateJournal(str(tmp_path))
+    assert [u["update_id"] for u in restarted.pending_updates()] == [102]
+    assert restarted.load_offset() == 102
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    test_drain_deadline_keeps_unfinished_pending(pathlib.Path(tempfile.mkdtemp()))
+    print("✅ تست کامل شد!")
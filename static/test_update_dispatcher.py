@@ -0,0 +1,39 @@
+"""
+test_update_dispatcher.py - تست ترتیب پردازش آپدیت‌های هر چت
+"""
+
+import threading
+import time
+
+from update_dispatcher import UpdateDispatcher
+
+
+def test_per_chat_order():
+    results = {}
+    lock = threading.Lock()
+
+    def handler(update):
+        # تأخیر تصادفی‌نما برای به‌هم‌ریختن ترتیب بین چت‌ها
+        time.sleep(0.001 * (update["n"] % 3))
+        with lock:
+            results.setdefault(update["chat"], []).append(update["n"])
+
+    dispatcher = UpdateDispatcher(handler, num_workers=4)
+    dispatcher.start()
+
+    for n in range(60):
+        chat = n % 5
+        dispatcher.submit(chat, {"chat": chat, "n": n})
+
+    for q in dispatcher.queues:
+        q.join()
+
+    for chat, numbers in results.items():
+        assert numbers == sorted(numbers)
+    assert sum(dispatcher.stats()["processed"]) == 60
+    assert dispatcher.queue_depths() == [0, 0, 0, 0]
+
+
+if __name__ == "__main__":
+    test_per_chat_order()
+    print("✅ تست کامل شد!")
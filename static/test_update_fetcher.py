@@ -0,0 +1,130 @@
+"""
+test_update_fetcher.py - تست پیشروی offset و تأخیر فقط هنگام خطا
+"""
+
+import asyncio
+import threading
+import time
+
+from async_runner import AsyncRuntime
+from update_fetcher import UpdateFetcher, AsyncUpdateFetcher
+
+
+def test_offset_and_error_backoff():
+    calls = []
+    responses = [
+        {"ok": True, "result": [{"update_id": 11}, {"update_id": 12}]},
+        {"ok": True, "result": []},
+        {"ok": False},
+        RuntimeError("network"),
+        {"ok": True, "result": [{"update_id": 13}]},
+    ]
+
+    def fetch(offset, allowed_updates):
+        calls.append((offset, time.monotonic()))
+        response = responses.pop(0) if responses else {"ok": True, "result": []}
+        if isinstance(response, Exception):
+            raise response
+        if not responses:
+            # بعد از آخرین پاسخ آزمایشی، حلقه بی‌وقفه نچرخد
+            time.sleep(0.01)
+        return response
+
+    fetcher = UpdateFetcher(fetch, offset=10, min_backoff=0.05, max_backoff=1)
+    fetcher.start()
+    first = fetcher.get_batch(timeout=2)
+    second = fetcher.get_batch(timeout=2)
+    fetcher.stop()
+
+    assert [u["update_id"] for u in first] == [11, 12]
+    assert [u["update_id"] for u in second] == [13]
+    offsets = [offset for offset, _ in calls]
+    assert offsets[:5] == [10, 12, 12, 12, 12]
+    assert fetcher.offset == 13
+
+    # پاسخ خالی بلافاصله دوباره درخواست می‌دهد؛ خطاها با تأخیر دوبرابرشونده
+    gaps = [b - a for (_, a), (_, b) in zip(calls, calls[1:])]
+    assert gaps[1] < 0.03
+    assert 0.035 <= gaps[2] and 0.075 <= gaps[3]
+    stats = fetcher.stats()
+    assert stats["errors"] == 2
+    assert stats["backoff"] == 0
+    assert stats["fetched"] == 3
+
+
+def test_batch_recorded_before_next_fetch():
+    journaled = []
+    calls = []
+    responses = [
+        {"ok": True, "result": [{"update_id": 21}, {"update_id": 22}]},
+        {"ok": True, "result": [{"update_id": 21}, {"update_id": 22}]},
+        {"ok": True, "result": [{"update_id": 23}]},
+    ]
+
+    def fetch(offset, allowed_updates):
+        # offset بعدی دسته قبلی را تأیید می‌کند؛ باید قبلاً ثبت شده باشد
+        calls.append((offset, list(journaled)))
+        if not responses:
+            time.sleep(0.01)
+            return {"ok": True, "result": []}
+        return responses.pop(0)
+
+    def on_batch(updates):
+        if not journaled and len(calls) == 1:
+            raise OSError("disk full")
+        journaled.extend(u["update_id"] for u in updates)
+
+    fetcher = UpdateFetcher(fetch, offset=20, min_backoff=0.01, max_backoff=0.1, on_batch=on_batch)
+    fetcher.start()
+    first = fetcher.get_batch(timeout=2)
+    second = fetcher.get_batch(timeout=2)
+    fetcher.stop()
+
+    assert [u["update_id"] for u in first] == [21, 22]
+    assert [u["update_id"] for u in second] == [23]
+    # ثبت ناموفق offset را جلو نمی‌برد و همان دسته دوباره دریافت می‌شود
+    assert calls[0] == (20, [])
+    assert calls[1] == (20, [])
+    assert calls[2] == (22, [21, 22])
+    assert calls[3] == (23, [21, 22, 23])
+    assert fetcher.stats()["errors"] == 1
+
+
+def test_async_fetcher_runs_on_loop():
+    runtime = AsyncRuntime()
+    threads = []
+    journaled = []
+    responses = [
+        {"ok": False},
+        {"ok": True, "result": [{"update_id": 31}, {"update_id": 32}]},
+    ]
+
+    async def fetch(offset, allowed_updates):
+        threads.append((offset, threading.current_thread().name))
+        if not responses:
+            await asyncio.sleep(0.01)
+            return {"ok": True, "result": []}
+        return responses.pop(0)
+
+    fetcher = AsyncUpdateFetcher(fetch, runtime, offset=30, min_backoff=0.01, max_backoff=0.1,
+                                 on_batch=lambda updates: journaled.extend(u["update_id"] for u in updates))
+    fetcher.start()
+    batch = fetcher.get_batch(timeout=2)
+    fetcher.stop()
+    fetcher.task.result(2)
+    runtime.stop()
+
+    assert [u["update_id"] for u in batch] == [31, 32]
+    assert journaled == [31, 32]
+    # درخواست‌ها روی ترد حلقه؛ تردی برای دریافت ساخته نشده
+    assert {name for _, name in threads} == {"asyncio-loop"}
+    assert [offset for offset, _ in threads][:3] == [30, 30, 32]
+    assert fetcher.thread is None
+    assert fetcher.stats()["errors"] == 1
+
+
+if __name__ == "__main__":
+    test_offset_and_error_backoff()
+    test_batch_recorded_before_next_fetch()
+    test_async_fetcher_runs_on_loop()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,49 @@
+"""
+test_update_journal.py - تست ژورنال آپدیت‌ها: بازپخش بعد از راه‌اندازی دوباره، offset و فشرده‌سازی
+"""
+
+from update_journal import UpdateJournal
+
+
+def update(update_id):
+    return {"update_id": update_id, "message": {"chat": {"id": update_id}, "text": "سلام"}}
+
+
+def test_replay_after_restart(tmp_path):
+    journal = UpdateJournal(str(tmp_path))
+    assert journal.load_offset() == 0
+    journal.record_received([update(1), update(2), update(3)])
+    journal.mark_done(2)
+    journal.mark_done(2)
+
+    # پروسس بدون توقف امن از بین رفته (بدون flush یا close)
+    restarted = UpdateJournal(str(tmp_path))
+    assert restarted.load_offset() == 3
+    assert restarted.pending_updates() == [update(1), update(3)]
+
+    restarted.record_received([], offset=10)
+    assert UpdateJournal(str(tmp_path)).load_offset() == 10
+
+
+def test_compaction_keeps_open_updates(tmp_path):
+    journal = UpdateJournal(str(tmp_path), compact_after=6)
+    journal.record_received([update(n) for n in range(1, 5)])
+    journal.mark_done(1)
+    journal.mark_done(3)
+    # خط ششم؛ ژورنال فقط با آپدیت‌های باز بازنویسی شد
+    assert journal.stats() == {"pending": 2, "journal_lines": 2}
+    with open(journal.journal_file, encoding='utf-8') as f:
+        assert len(f.readlines()) == 2
+
+    # نوشتن بعد از فشرده‌سازی در فایل جدید ادامه پیدا می‌کند
+    journal.record_received([update(5)])
+    journal.mark_done(2)
+    assert [u["update_id"] for u in UpdateJournal(str(tmp_path)).pending_updates()] == [4, 5]
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    test_replay_after_restart(pathlib.Path(tempfile.mkdtemp()))
+    test_compaction_keeps_open_updates(pathlib.Path(tempfile.mkdtemp()))
+    print("✅ تست کامل شد!")
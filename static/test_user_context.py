@@ -0,0 +1,68 @@
+"""
+test_user_context.py - تست بارگذاری یک‌باره اطلاعات کاربر و بودجه کوئری
+"""
+
+from types import SimpleNamespace
+
+import user_context
+from mongo_connection import query_counter
+from user_context import UserContext, QueryBudget
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = 0
+
+    def find_one(self, query, projection=None):
+        self.queries += 1
+        return next((d for d in self.docs if d["user_id"] == query["user_id"]), None)
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        return [d for d in self.docs if d["user_id"] == query["user_id"]]
+
+
+def test_loads_each_part_once(monkeypatch):
+    collections = {
+        "registered_users": FakeCollection([{"user_id": "7", "phone_number": "989000000000"}]),
+        "users_progress": FakeCollection([{"user_id": "7", "topics": {"2": {"current_day": 3, "started": True,
+                                                                          "completed_days": [1, 2]}}}]),
+        "daily_access": FakeCollection([{"user_id": "7", "topic_id": 2, "day_number": 3}]),
+    }
+    monkeypatch.setattr(user_context, "get_collection", lambda name: collections[name])
+
+    context = UserContext(7, admin_phone="989000000000")
+    with user_context.bind(context):
+        assert user_context.current("7") is context
+        assert user_context.current("8") is None
+        assert context.is_registered and context.is_admin
+        assert context.topic_progress(2)["current_day"] == 3
+        assert context.topic_progress(1)["current_day"] == 1
+        assert not context.needs_topic_day_write(2, 3)
+        assert context.needs_topic_day_write(1, 1)
+        assert context.access_record(2)["day_number"] == 3
+        assert context.access_record(4) is None
+
+        context.apply_completion(2, 3, 4)
+        assert context.topic_progress(2) == {"current_day": 4, "started": True, "completed_days": [1, 2, 3]}
+
+    assert user_context.current("7") is None
+    assert [c.queries for c in collections.values()] == [1, 1, 1]
+
+
+def test_query_budget():
+    budget = QueryBudget({"on_complete": 1}, strict=True)
+    event = SimpleNamespace(command_name="find")
+
+    with budget.measure("on_complete"):
+        query_counter.started(event)
+
+    try:
+        with budget.measure("on_complete"):
+            query_counter.started(event)
+            query_counter.started(event)
+        assert False, "تجاوز از بودجه باید خطا بدهد"
+    except AssertionError as e:
+        assert "on_complete" in str(e)
+    assert budget.stats()["violations"] == {"on_complete": 1}
@@ -0,0 +1,68 @@
+"""
+test_user_progress.py - تست ثبت شرطی روز تکمیل‌شده با کالکشن ساختگی (ضربه تکراری چیزی را تغییر نمی‌دهد)
+"""
+
+from types import SimpleNamespace
+
+from pymongo.errors import DuplicateKeyError
+
+import loader
+from loader import UserProgressManager
+
+
+class FakeProgressCollection:
+    """فقط شکل کوئری complete_day: user_id و $ne روی completed_days، با ایندکس یکتای user_id"""
+
+    def __init__(self):
+        self.docs = {}
+        self.writes = 0
+
+    def update_one(self, query, update, upsert=False):
+        (path, condition), = [(k, v) for k, v in query.items() if k != "user_id"]
+        topic_key = path.split(".")[1]
+        doc = self.docs.get(query["user_id"])
+        matched = doc is not None and condition["$ne"] not in doc["topics"].get(topic_key, {}).get("completed_days", [])
+        if not matched:
+            if not upsert:
+                return SimpleNamespace(matched_count=0, upserted_id=None)
+            if doc is not None:
+                raise DuplicateKeyError("E11000 duplicate key error: user_id_unique")
+            doc = self.docs[query["user_id"]] = {"user_id": query["user_id"], "topics": {}}
+        progress = doc["topics"].setdefault(topic_key, {"completed_days": []})
+        for value in update["$addToSet"].values():
+            if value not in progress["completed_days"]:
+                progress["completed_days"].append(value)
+        for value in update["$set"].values():
+            progress["current_day"] = value
+        self.writes += 1
+        return SimpleNamespace(matched_count=int(matched), upserted_id=None if matched else query["user_id"])
+
+
+def test_duplicate_completion_is_a_miss():
+    collection = FakeProgressCollection()
+    saved = loader.users_col
+    loader.users_col = collection
+    try:
+        manager = UserProgressManager()
+        # کاربر بدون سند پیشرفت
+        first = manager.complete_day("7", 1, 1)
+        assert first["success"] and first["next_day"] == 2
+        assert manager.complete_day("7", 1, 2)["success"]
+        assert collection.docs["7"]["topics"]["1"] == {"completed_days": [1, 2], "current_day": 3}
+
+        # ضربه دیرهنگام روی دکمه روز ۱: نه موفقیت، نه عقب رفتن current_day
+        stale = manager.complete_day("7", 1, 1)
+        assert not stale["success"]
+        assert stale["already_completed"]
+        assert collection.docs["7"]["topics"]["1"]["current_day"] == 3
+        assert collection.writes == 2
+
+        # همان روز در موضوع دیگر ثبت می‌شود
+        assert manager.complete_day("7", 2, 1)["success"]
+    finally:
+        loader.users_col = saved
+
+
+if __name__ == "__main__":
+    test_duplicate_completion_is_a_miss()
+    print("✅ تست کامل شد!")
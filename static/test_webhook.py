@@ -0,0 +1,26 @@
+"""
+test_webhook.py - تست اعتبارسنجی توکن و آپدیت‌های وب‌هوک
+"""
+
+import pytest
+
+from webhook import WebhookReceiver
+
+
+def test_token_validation():
+    with pytest.raises(ValueError):
+        WebhookReceiver("")
+
+    receiver = WebhookReceiver("s3cret")
+    update = {"update_id": 1, "message": {"text": "سلام"}}
+    assert receiver.receive("wrong", update) == 403
+    # توکن غیر ASCII به جای خطای 500 رد می‌شود
+    assert receiver.receive("رمز", update) == 403
+    assert receiver.receive("s3cret", {"update_id": "x"}) == 400
+    assert receiver.receive("s3cret", update) == 200
+    assert receiver.updates.get_nowait() == update
+
+
+if __name__ == "__main__":
+    test_token_validation()
+    print("✅ تست کامل شد!")
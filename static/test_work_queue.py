@@ -0,0 +1,43 @@
+"""
+test_work_queue.py - تست صف اولویت‌دار و حذف بار اضافه
+"""
+
+import time
+
+from work_queue import ChatWorkQueue, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+
+
+def test_priority_keeps_chat_order():
+    q = ChatWorkQueue(max_size=10)
+    q.put("a", "a1", PRIORITY_LOW)
+    q.put("a", "a2", PRIORITY_HIGH)
+    q.put("b", "b1", PRIORITY_NORMAL)
+    q.put("c", "c1", PRIORITY_HIGH)
+
+    order = [q.get(timeout=0) for _ in range(4)]
+    # c اولویت بالا دارد؛ a2 باید بعد از a1 بیاید
+    assert order[0] == "c1"
+    assert order.index("a1") < order.index("a2")
+    assert q.get(timeout=0) is None
+
+
+def test_shedding():
+    shed = []
+    q = ChatWorkQueue(max_size=2, max_age=0.01, on_shed=shed.append)
+    assert q.put(1, "x", PRIORITY_LOW)
+    assert q.put(2, "y", PRIORITY_NORMAL)
+    assert not q.put(3, "z", PRIORITY_NORMAL)
+    assert q.put(3, "urgent", PRIORITY_HIGH)
+
+    time.sleep(0.02)
+    items = [q.get(timeout=0) for _ in range(2)]
+    assert q.get(timeout=0) is None
+    assert items == ["urgent", "y"]
+    assert shed == ["x"]
+    assert q.stats()["shed"] == {"full": 1, "stale": 1}
+
+
+if __name__ == "__main__":
+    test_priority_keeps_chat_order()
+    test_shedding()
+    print("✅ تست کامل شد!")
@@ -0,0 +1,83 @@
+"""
+update_dispatcher.py - توزیع آپدیت‌ها بین چند ورکر با حفظ ترتیب هر چت
+"""
+
+import os
+import threading
+import time
+import traceback
+import zlib
+
+from work_queue import ChatWorkQueue, PRIORITY_NORMAL
+
+
+class UpdateDispatcher:
+    """پخش آپدیت‌ها بین ورکرها؛ آپدیت‌های هر چت همیشه به یک ورکر می‌روند"""
+
+    def __init__(self, handler, num_workers=None, max_queue_size=None, max_age=None, on_shed=None):
+        if num_workers is None:
+            num_workers = int(os.getenv("BOT_WORKERS", 8))
+        if max_queue_size is None:
+            max_queue_size = int(os.getenv("BOT_QUEUE_SIZE", 1000))
+        if max_age is None:
+            max_age = float(os.getenv("BOT_QUEUE_MAX_AGE", 10))
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        # ظرفیت کل بین ورکرها تقسیم می‌شود
+        per_worker = max(1, max_queue_size // self.num_workers)
+        self.queues = [ChatWorkQueue(per_worker, max_age, on_shed) for _ in range(self.num_workers)]
+        self.processed = [0] * self.num_workers
+        self.threads = []
+
+    def start(self):
+        """راه‌اندازی ورکرها"""
+        for index in range(self.num_workers):
+            t = threading.Thread(target=self._run, args=(index,), name=f"update-worker-{index}")
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def worker_for(self, chat_id):
+        """انتخاب ورکر ثابت برای یک چت"""
+        return zlib.crc32(str(chat_id).encode()) % self.num_workers
+
+    def submit(self, chat_id, update, priority=PRIORITY_NORMAL):
+        """افزودن آپدیت به صف ورکر مربوط به چت؛ اگر صف پر باشد False"""
+        return self.queues[self.worker_for(chat_id)].put(chat_id, update, priority)
+
+    def drain(self, timeout):
+        """انتظار تا پایان همه آپدیت‌های صف و در حال اجرا؛ در صورت اتمام مهلت False"""
+        deadline = time.monotonic() + timeout
+        for q in self.queues:
+            if not q.join(max(0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def queue_depths(self):
+        """تعداد آپدیت‌های منتظر در صف هر ورکر"""
+        return [q.qsize() for q in self.queues]
+
+    def stats(self):
+        """آمار ورکرها"""
+        queue_stats = [q.stats() for q in self.queues]
+        return {
+            "workers": self.num_workers,
+            "queue_depths": self.queue_depths(),
+            "oldest_age": max(s["oldest_age"] for s in queue_stats),
+            "shed_full": sum(s["shed"]["full"] for s in queue_stats),
+            "shed_stale": sum(s["shed"]["stale"] for s in queue_stats),
+            "processed": list(self.processed)
+        }
+
+    def _run(self, index):
+        q = self.queues[index]
+        while True:
+            update = q.get()
+            try:
+                self.handler(update)
+            except Exception as e:
+                print(f"❌ خطا در ورکر {index}: {e}")
+                traceback.print_exc()
+            finally:
+                self.processed[index] += 1
+                q.task_done()
@@ -0,0 +1,155 @@
+"""
+update_fetcher.py - دریافت پیوسته آپدیت‌ها (long polling) در پس‌زمینه
+"""
+
+import asyncio
+import queue
+import random
+import threading
+
+# فقط انواع آپدیتی که ربات پردازش می‌کند
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+
+class UpdateFetcher:
+    """دسته بعدی آپدیت‌ها را هم‌زمان با پردازش دسته فعلی دریافت می‌کند"""
+
+    def __init__(self, fetch, allowed_updates=None, offset=0, max_pending_batches=2,
+                 min_backoff=0.5, max_backoff=30, on_batch=None):
+        self.fetch = fetch
+        # on_batch(updates): ثبت پایدار دسته قبل از اینکه offset بعدی آن را نزد بله تأیید کند
+        self.on_batch = on_batch
+        self.allowed_updates = allowed_updates or ALLOWED_UPDATES
+        self.offset = offset
+        self.batches = queue.Queue(maxsize=max_pending_batches)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.backoff = 0
+        self.errors = 0
+        self.fetched = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """شروع ترد دریافت"""
+        self.thread = threading.Thread(target=self._run, name="update-fetcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """توقف دریافت آپدیت‌های جدید"""
+        self.stop_event.set()
+
+    def get_batch(self, timeout=None):
+        """دریافت دسته بعدی؛ در صورت اتمام زمان None برمی‌گرداند"""
+        try:
+            return self.batches.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stats(self):
+        """آمار دریافت"""
+        return {
+            "offset": self.offset,
+            "fetched": self.fetched,
+            "errors": self.errors,
+            "backoff": self.backoff,
+            "pending_batches": self.batches.qsize()
+        }
+
+    def _next_backoff(self):
+        # تأخیر نمایی با کمی نویز؛ فقط هنگام خطا
+        self.errors += 1
+        if self.backoff:
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+        else:
+            self.backoff = self.min_backoff
+        return self.backoff * random.uniform(0.8, 1.2)
+
+    def _on_error(self):
+        self.stop_event.wait(self._next_backoff())
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                result = self.fetch(self.offset, self.allowed_updates)
+            except Exception as e:
+                print(f"⚠️ خطا در دریافت آپدیت‌ها: {e}")
+                result = {"ok": False}
+
+            if not result.get("ok"):
+                self._on_error()
+                continue
+
+            self.backoff = 0
+            updates = result.get("result") or []
+            if not updates:
+                continue
+
+            if self.on_batch is not None:
+                try:
+                    self.on_batch(updates)
+                except Exception as e:
+                    # offset جلو نمی‌رود و همین دسته دوباره دریافت می‌شود
+                    print(f"⚠️ خطا در ثبت دسته آپدیت‌ها: {e}")
+                    self._on_error()
+                    continue
+
+            self.offset = updates[-1]["update_id"]
+            self.fetched += len(updates)
+            while not self.stop_event.is_set():
+                try:
+                    self.batches.put(updates, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+
+class AsyncUpdateFetcher(UpdateFetcher):
+    """همان دریافت پیوسته به صورت task روی حلقه asyncio (حالت async)؛ fetch یک coroutine است"""
+
+    def __init__(self, fetch, runtime, **kwargs):
+        super().__init__(fetch, **kwargs)
+        self.runtime = runtime
+        self.task = None
+
+    def start(self):
+        """شروع task دریافت روی حلقه"""
+        self.runtime.start()
+        self.task = asyncio.run_coroutine_threadsafe(self._run_async(), self.runtime.loop)
+
+    async def _run_async(self):
+        loop = asyncio.get_running_loop()
+        while not self.stop_event.is_set():
+            try:
+                result = await self.fetch(self.offset, self.allowed_updates)
+            except Exception as e:
+                print(f"⚠️ خطا در دریافت آپدیت‌ها: {e}")
+                result = {"ok": False}
+
+            if not result.get("ok"):
+                await asyncio.sleep(self._next_backoff())
+                continue
+
+            self.backoff = 0
+            updates = result.get("result") or []
+            if not updates:
+                continue
+
+            if self.on_batch is not None:
+                try:
+                    # نوشتن ژورنال (fsync) حلقه را نگه ندارد
+                    await loop.run_in_executor(None, self.on_batch, updates)
+                except Exception as e:
+                    print(f"⚠️ خطا در ثبت دسته آپدیت‌ها: {e}")
+                    await asyncio.sleep(self._next_backoff())
+                    continue
+
+            self.offset = updates[-1]["update_id"]
+            self.fetched += len(updates)
+            while not self.stop_event.is_set():
+                try:
+                    self.batches.put_nowait(updates)
+                    break
+                except queue.Full:
+                    await asyncio.sleep(0.05)
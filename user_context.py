@@ -0,0 +1,143 @@
+"""
+user_context.py - اطلاعات کاربر در طول پردازش یک آپدیت (هر بخش فقط یک بار از دیتابیس خوانده می‌شود)
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from mongo_connection import get_collection, query_counter
+
+_current = ContextVar("user_context", default=None)
+_UNLOADED = object()
+
+
+class UserContext:
+    """ثبت‌نام، ادمین بودن، پیشرفت همه موضوع‌ها و وضعیت دسترسی کاربر؛ بارگذاری تنبل"""
+
+    def __init__(self, user_id, admin_phone=None):
+        self.user_id = str(user_id)
+        self.admin_phone = admin_phone
+        self._registration = _UNLOADED
+        self._topics = _UNLOADED
+        self._access = _UNLOADED
+
+    # --- ثبت‌نام ---
+    @property
+    def registration(self):
+        """سند registered_users یا None"""
+        if self._registration is _UNLOADED:
+            self._registration = get_collection("registered_users").find_one({"user_id": self.user_id})
+        return self._registration
+
+    @property
+    def is_registered(self):
+        return self.registration is not None
+
+    @property
+    def is_admin(self):
+        registration = self.registration
+        return bool(registration and self.admin_phone and registration.get("phone_number") == self.admin_phone)
+
+    # --- پیشرفت (یک سند users_progress برای همه موضوع‌ها) ---
+    @property
+    def topics(self):
+        if self._topics is _UNLOADED:
+            doc = get_collection("users_progress").find_one({"user_id": self.user_id}, {"topics": 1})
+            self._topics = (doc or {}).get("topics") or {}
+        return self._topics
+
+    def topic_progress(self, topic_id):
+        """مثل UserProgressManager.get_topic_progress ولی بدون کوئری دوباره"""
+        progress = self.topics.get(str(topic_id))
+        if progress is not None:
+            return progress
+        return {"current_day": 1, "started": False, "completed_days": []}
+
+    def needs_topic_day_write(self, topic_id, day_number):
+        """آیا set_topic_day چیزی را در دیتابیس تغییر می‌دهد"""
+        progress = self.topics.get(str(topic_id))
+        return not (progress and progress.get("started") and progress.get("current_day") == day_number)
+
+    def set_topic_day(self, topic_id, day_number):
+        if self._topics is _UNLOADED:
+            return
+        progress = self._topics.setdefault(str(topic_id), {"completed_days": []})
+        progress["current_day"] = day_number
+        progress["started"] = True
+
+    def apply_completion(self, topic_id, day_number, next_day):
+        """اعمال نتیجه complete_day روی نسخه حافظه (بدون خواندن دوباره)"""
+        if self._topics is _UNLOADED:
+            return
+        progress = self._topics.setdefault(str(topic_id), {})
+        completed = progress.setdefault("completed_days", [])
+        if day_number not in completed:
+            completed.append(day_number)
+        progress["current_day"] = next_day
+
+    # --- دسترسی روزانه (همه موضوع‌ها با یک find) ---
+    @property
+    def access(self):
+        if self._access is _UNLOADED:
+            cursor = get_collection("daily_access").find({"user_id": self.user_id}, {"_id": 0})
+            self._access = {int(doc["topic_id"]): doc for doc in cursor}
+        return self._access
+
+    def access_record(self, topic_id):
+        return self.access.get(int(topic_id))
+
+    def set_access(self, topic_id, record):
+        if self._access is not _UNLOADED:
+            self._access[int(topic_id)] = record
+
+    def drop_access(self, topic_id):
+        if self._access is not _UNLOADED:
+            self._access.pop(int(topic_id), None)
+
+
+@contextmanager
+def bind(user_context):
+    """فعال کردن UserContext برای هندلر جاری"""
+    token = _current.set(user_context)
+    try:
+        yield user_context
+    finally:
+        _current.reset(token)
+
+
+def current(user_id):
+    """UserContext فعال برای همین کاربر یا None (خارج از آپدیت یا کاربر دیگر)"""
+    user_context = _current.get()
+    if user_context is not None and user_context.user_id == str(user_id):
+        return user_context
+    return None
+
+
+class QueryBudget:
+    """حداکثر کوئری Mongo برای هر مسیر در یک آپدیت؛ در حالت strict تجاوز از بودجه خطا است"""
+
+    def __init__(self, budgets, strict=False):
+        self.budgets = budgets
+        self.strict = strict
+        self.lock = threading.Lock()
+        self.violations = {}
+
+    @contextmanager
+    def measure(self, route_name):
+        started = query_counter.thread_count()
+        yield
+        used = query_counter.thread_count() - started
+        budget = self.budgets.get(route_name)
+        if budget is None or used <= budget:
+            return
+        with self.lock:
+            self.violations[route_name] = self.violations.get(route_name, 0) + 1
+        message = f"مسیر {route_name} از بودجه کوئری گذشت: {used} > {budget}"
+        if self.strict:
+            raise AssertionError(message)
+        print(f"⚠️ {message}")
+
+    def stats(self):
+        with self.lock:
+            return {"budgets": dict(self.budgets), "violations": dict(self.violations)}
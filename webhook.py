@@ -0,0 +1,88 @@
+"""
+webhook.py - دریافت آپدیت‌ها از طریق وب‌هوک بله
+"""
+
+import hmac
+import queue
+
+from update_fetcher import ALLOWED_UPDATES
+
+
+class WebhookReceiver:
+    """اعتبارسنجی آپدیت‌های وب‌هوک و قرار دادن آن‌ها در صف محدود"""
+
+    def __init__(self, secret, max_queue_size=1000, allowed_updates=None):
+        if not secret:
+            # بدون توکن، آدرس /webhook/ با هیچ مسیری تطبیق نمی‌خورد و آپدیتی نمی‌رسد
+            raise ValueError("برای حالت webhook مقدار WEBHOOK_SECRET لازم است")
+        self.secret = secret
+        self.allowed_updates = allowed_updates or ALLOWED_UPDATES
+        self.updates = queue.Queue(maxsize=max_queue_size)
+        self.received = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.closed = False
+
+    def validate(self, update):
+        """بررسی ساختار آپدیت دریافتی"""
+        if not isinstance(update, dict):
+            return False
+        if not isinstance(update.get("update_id"), int):
+            return False
+        return any(kind in update for kind in self.allowed_updates)
+
+    def close(self):
+        """توقف پذیرش آپدیت جدید (بله بعداً دوباره ارسال می‌کند)"""
+        self.closed = True
+
+    def receive(self, token, update):
+        """ثبت آپدیت دریافتی و برگرداندن کد وضعیت HTTP"""
+        if self.closed:
+            return 503
+        # مقایسه بایت‌ها؛ compare_digest برای رشته غیر ASCII خطا می‌دهد
+        if not hmac.compare_digest(str(token).encode(), self.secret.encode()):
+            self.rejected += 1
+            return 403
+        if not self.validate(update):
+            self.rejected += 1
+            return 400
+        try:
+            self.updates.put_nowait(update)
+        except queue.Full:
+            # بله درخواست را دوباره ارسال می‌کند
+            self.dropped += 1
+            return 503
+        self.received += 1
+        return 200
+
+    def get_batch(self, timeout=None):
+        """دریافت آپدیت‌های موجود در صف (هم‌شکل با UpdateFetcher)"""
+        try:
+            batch = [self.updates.get(timeout=timeout)]
+        except queue.Empty:
+            return None
+        while True:
+            try:
+                batch.append(self.updates.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def stats(self):
+        """آمار وب‌هوک"""
+        return {
+            "received": self.received,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "queue_size": self.updates.qsize()
+        }
+
+
+def serve(app, host, port, threads=8):
+    """اجرای اپ Flask روی یک سرور WSGI چندنخی"""
+    try:
+        from waitress import serve as waitress_serve
+        waitress_serve(app, host=host, port=port, threads=threads)
+    except ImportError:
+        from werkzeug.serving import make_server
+        print("⚠️ waitress نصب نیست؛ استفاده از سرور چندنخی werkzeug")
+        make_server(host, port, app, threaded=True).serve_forever()
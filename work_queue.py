@@ -0,0 +1,108 @@
+"""
+work_queue.py - صف محدود و اولویت‌دار کار با حذف بار اضافه
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class ChatWorkQueue:
+    """صف اولویت‌دار بین چت‌ها؛ ترتیب آپدیت‌های هر چت حفظ می‌شود"""
+
+    def __init__(self, max_size=1000, max_age=None, on_shed=None):
+        self.max_size = max_size
+        # کارهای با اولویت بالا تا ۲۰٪ بیشتر از ظرفیت پذیرفته می‌شوند
+        self.hard_limit = max_size + max(1, max_size // 5)
+        self.max_age = max_age
+        self.on_shed = on_shed
+        self.cond = threading.Condition()
+        self.chats = {}
+        self.ready = []
+        self.counter = itertools.count()
+        self.size = 0
+        self.unfinished = 0
+        self.shed = {"full": 0, "stale": 0}
+
+    def put(self, chat_id, item, priority=PRIORITY_NORMAL):
+        """افزودن کار؛ اگر صف پر باشد False برمی‌گرداند"""
+        with self.cond:
+            limit = self.hard_limit if priority == PRIORITY_HIGH else self.max_size
+            if self.size >= limit:
+                self.shed["full"] += 1
+                return False
+
+            items = self.chats.get(chat_id)
+            if items is None:
+                items = self.chats[chat_id] = deque()
+            items.append((priority, time.monotonic(), item))
+            if len(items) == 1:
+                heapq.heappush(self.ready, (priority, next(self.counter), chat_id))
+            self.size += 1
+            self.unfinished += 1
+            self.cond.notify()
+            return True
+
+    def _pop(self):
+        _, _, chat_id = heapq.heappop(self.ready)
+        items = self.chats[chat_id]
+        entry = items.popleft()
+        if items:
+            heapq.heappush(self.ready, (items[0][0], next(self.counter), chat_id))
+        else:
+            del self.chats[chat_id]
+        self.size -= 1
+        return entry
+
+    def get(self, timeout=None):
+        """دریافت کار بعدی؛ کارهای کم‌اولویت قدیمی کنار گذاشته می‌شوند"""
+        while True:
+            with self.cond:
+                if not self.ready and not self.cond.wait_for(lambda: self.ready, timeout):
+                    return None
+                priority, enqueued_at, item = self._pop()
+                stale = (self.max_age is not None and priority == PRIORITY_LOW
+                         and time.monotonic() - enqueued_at > self.max_age)
+                if not stale:
+                    return item
+                self.shed["stale"] += 1
+            if self.on_shed is not None:
+                self.on_shed(item)
+            self.task_done()
+
+    def task_done(self):
+        """اعلام پایان پردازش یک کار"""
+        with self.cond:
+            self.unfinished -= 1
+            if self.unfinished <= 0:
+                self.cond.notify_all()
+
+    def join(self, timeout=None):
+        """انتظار تا پایان همه کارها؛ در صورت اتمام زمان False"""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.unfinished <= 0, timeout)
+
+    def qsize(self):
+        return self.size
+
+    def oldest_age(self):
+        """سن قدیمی‌ترین کار منتظر (ثانیه)"""
+        with self.cond:
+            if not self.chats:
+                return 0.0
+            oldest = min(items[0][1] for items in self.chats.values())
+            return time.monotonic() - oldest
+
+    def stats(self):
+        """آمار صف"""
+        return {
+            "size": self.size,
+            "oldest_age": round(self.oldest_age(), 3),
+            "shed": dict(self.shed)
+        }